@@ -2,7 +2,7 @@ from niprov.discovery import discover
 from niprov.inspection import inspect
 from niprov.plogging import log
 from niprov.recording import record
-from niprov.adding import add
+from niprov.adding import add, addMany
 from niprov.renaming import renameDicoms
 from niprov.approval import (markForApproval, markedForApproval, approve, 
     selectApproved)
@@ -13,5 +13,7 @@ from niprov.exporting import export, print_, backup, view
 from niprov.importing import importp
 from niprov.comparing import compare
 from niprov.searching import search
+from niprov.indexing import ensureIndexes, reindex
+from niprov.versioning import pruneVersions
 
 
@@ -1,6 +1,7 @@
 #!/usr/bin/python
 # -*- coding: UTF-8 -*-
-import os, errno, pkg_resources
+import os, errno, copy, pkg_resources
+from collections import OrderedDict
 import shortuuid
 from datetime import datetime
 from niprov.dependencies import Dependencies
@@ -38,11 +39,67 @@ def add(filepath, transient=False, provenance=None,
             'dryrun': Function called with config.dryrun, database not touched.
     """
     config = dependencies.getConfiguration()
+
+    img = locateNew(filepath, transient, provenance, dependencies)
+    if config.dryrun:
+        return img
+
+    inspectNew(img, transient, dependencies)
+    if img.status == 'failed':
+        return img
+    return register(img, dependencies)
+
+
+def addMany(filepaths, transient=False, provenance=None, 
+    dependencies=Dependencies()):
+    """
+    Register several files at once.
+
+    Does the same as :py:func:`add` for each file, but looks up copies, 
+    previous versions and series for all files together, and saves them in 
+    one operation. This is much faster than calling :py:func:`add` for each 
+    file when the provenance is stored in a database.
+
+    Example:
+        images = niprov.addMany(['/path/to/my.nii', '/path/to/other.nii'])
+
+    Args:
+        filepaths (list): Paths to the newly created files.
+        transient (bool, optional): Set this to True to indicate that the 
+            files are only temporary. Defaults to False.
+        provenance (dict, optional): Add the key-value pairs in this dictionary 
+            to the provenance record for each of the new files.
+
+    Returns:
+        list: For each path, the image object as :py:func:`add` would have 
+            returned it.
+    """
+    config = dependencies.getConfiguration()
+
+    images = [locateNew(filepath, transient, copy.deepcopy(provenance), 
+        dependencies) for filepath in filepaths]
+    if config.dryrun:
+        return images
+
+    for img in images:
+        inspectNew(img, transient, dependencies)
+    inspected = [img for img in images if img.status != 'failed']
+    registered = iter(registerMany(inspected, dependencies))
+    return [img if img.status == 'failed' else next(registered) 
+        for img in images]
+
+
+def locateNew(filepath, transient=False, provenance=None, 
+    dependencies=Dependencies()):
+    """Create the object representing a file that is being added.
+
+    Sets the provenance fields that niprov determines for any new file, such 
+    as 'id' and 'added'. See :py:func:`add` for the arguments.
+
+    Returns:
+        :class:`.BaseFile`: Object representing the new file.
+    """
     file = dependencies.getFileFactory()
-    repository = dependencies.getRepository()
-    listener = dependencies.getListener()
-    filesys = dependencies.getFilesystem()
-    query = dependencies.getQuery()
 
     if provenance is None:
         provenance = {}
@@ -52,9 +109,22 @@ def add(filepath, transient=False, provenance=None,
     vparts = pkg_resources.get_distribution("niprov").version.split('.')
     provenance['version-added'] = float(vparts[0] + '.' + ''.join(vparts[1:]))
 
-    img = file.locatedAt(filepath, provenance=provenance)
-    if config.dryrun:
-        return img
+    return file.locatedAt(filepath, provenance=provenance)
+
+
+def inspectNew(img, transient=False, dependencies=Dependencies()):
+    """Inspect a file that is being added, unless it is transient.
+
+    If inspection fails, the listener is informed and the status of the file 
+    is set to 'failed'.
+
+    Args:
+        img (:class:`.BaseFile`): File as returned by :py:func:`locateNew`.
+        transient (bool, optional): Whether the file was added as transient.
+    """
+    config = dependencies.getConfiguration()
+    listener = dependencies.getListener()
+    filesys = dependencies.getFilesystem()
 
     if not transient:
         if not filesys.fileExists(img.location.path):
@@ -67,28 +137,52 @@ def add(filepath, transient=False, provenance=None,
             return img
         if config.attach:
             img.attach(config.attach_format)
+    return img
+
+
+def register(img, dependencies=Dependencies()):
+    """Store the provenance of an inspected file.
+
+    Looks for copies of the file to use as parent, previous versions of 
+    the file and the series that it is part of, and then saves it to the 
+    repository.
+
+    Args:
+        img (:class:`.BaseFile`): File as returned by :py:func:`inspectNew`.
+
+    Returns:
+        :class:`.BaseFile`: The file, or if it was merged into a series, 
+            the series.
+    """
+    repository = dependencies.getRepository()
+    listener = dependencies.getListener()
+    query = dependencies.getQuery()
 
-    if not provenance.get('parents', []):
-        for copy in query.copiesOf(img):
-            if not copy.location == img.location:
-                inheritFrom(img.provenance, copy.provenance)
-                img.provenance['parents'] = [copy.location.toString()]
+    if not img.provenance.get('parents', []):
+        for original in query.copiesOf(img):
+            if not original.location == img.location:
+                inheritFrom(img.provenance, original.provenance)
+                img.provenance['parents'] = [original.location.toString()]
                 img.provenance['copy-as-parent'] = True
-                listener.usingCopyAsParent(copy)
+                listener.usingCopyAsParent(original)
                 break
 
     previousVersion = repository.byLocation(img.location.toString())
     series = repository.getSeries(img)
+    newSlice = None
     if previousVersion:
         img.keepVersionsFromPrevious(previousVersion)
     elif series:
         if series.hasFile(img):
             img.keepVersionsFromPrevious(series)
         else:
+            newSlice = img
             img = series.mergeWith(img)
 
     if not previousVersion and not series:
         repository.add(img)
+    elif newSlice is not None:
+        repository.extendSeries([(img, [newSlice.path])])
     else:
         repository.update(img)
 
@@ -96,5 +190,134 @@ def add(filepath, transient=False, provenance=None,
     return img
 
 
+def registerMany(images, dependencies=Dependencies()):
+    """Store the provenance of several inspected files.
 
-    
+    Like :py:func:`register`, but copies, previous versions and series are 
+    looked up with one query each, and new and changed files are saved with 
+    one call each. Files earlier in the list are taken into account for 
+    later ones, so slices of a new series are merged into the first. Slices 
+    are merged into their series together, and for a series that was 
+    already known only the new slices are saved. A file that is in the list 
+    more than once is registered once, as its last occurrence.
+
+    Args:
+        images (list): Files as returned by :py:func:`inspectNew`.
+
+    Returns:
+        list: For each file, the file itself or the series it was merged into.
+    """
+    repository = dependencies.getRepository()
+    listener = dependencies.getListener()
+    hasher = dependencies.getHasher()
+
+    given = images
+    unique = OrderedDict()
+    for img in given:
+        unique[img.location.toString()] = img
+    images = list(unique.values())
+
+    copies = _CopyFinder(images, repository, hasher)
+    locations = [img.location.toString() for img in images]
+    previous = {p.location.toString(): p for p in 
+        repository.byLocations(locations)}
+    seriesIds = set([img.getSeriesId() for img in images]) - set([None])
+    seriesById = {s.getSeriesId(): s for s in 
+        repository.byFieldValues('seriesuid', list(seriesIds))}
+
+    toAdd = OrderedDict()
+    toUpdate = OrderedDict()
+    slices = OrderedDict()
+    results = OrderedDict()
+    for img in images:
+        givenLocation = img.location.toString()
+        if not img.provenance.get('parents', []):
+            original = copies.of(img)
+            if original is not None:
+                inheritFrom(img.provenance, original.provenance)
+                img.provenance['parents'] = [original.location.toString()]
+                img.provenance['copy-as-parent'] = True
+                listener.usingCopyAsParent(original)
+        copies.remember(img)
+
+        location = img.location.toString()
+        seriesId = img.getSeriesId()
+        previousVersion = previous.get(location)
+        series = seriesById.get(seriesId) if seriesId is not None else None
+        merged = False
+        if previousVersion:
+            img.keepVersionsFromPrevious(previousVersion)
+        elif series:
+            if series.hasFile(img):
+                img.keepVersionsFromPrevious(series)
+            else:
+                slices.setdefault(series.location.toString(), 
+                    (series, []))[1].append(img)
+                img = series
+                merged = True
+
+        location = img.location.toString()
+        if not previousVersion and not series:
+            toAdd[location] = img
+            if seriesId is not None:
+                seriesById[seriesId] = img
+        elif not merged and location not in toAdd:
+            toUpdate[location] = img
+        previous[location] = img
+        results[givenLocation] = img
+
+    extensions = []
+    for location, (series, newSlices) in slices.items():
+        nbefore = len(series.provenance['filesInSeries'])
+        series.mergeWithMany(newSlices)
+        if location not in toAdd and location not in toUpdate:
+            extensions.append((series, 
+                series.provenance['filesInSeries'][nbefore:]))
+
+    if toAdd:
+        repository.addMany(list(toAdd.values()))
+    if toUpdate:
+        repository.updateMany(list(toUpdate.values()))
+    if extensions:
+        repository.extendSeries(extensions)
+    for img in results.values():
+        listener.fileAdded(img)
+    return [results[img.location.toString()] for img in given]
+
+
+class _CopyFinder(object):
+    """Finds copies of files that are registered together, with one query for 
+    full digests and one for sample digests."""
+
+    def __init__(self, images, repository, hasher):
+        self.hasher = hasher
+        self.known = {'hash':{}, 'hash-sample':{}}
+        for field, byValue in self.known.items():
+            values = set([i.provenance.get(field) for i in images 
+                if self._keyFor(i) == field])
+            for other in repository.byFieldValues(field, list(values)):
+                byValue.setdefault(other.provenance[field], []).append(other)
+
+    def of(self, img):
+        field = self._keyFor(img)
+        if field is None:
+            return None
+        for other in self.known[field].get(img.provenance[field], []):
+            if other.location == img.location:
+                continue
+            if field == 'hash' or self.hasher.sameContent(img, other):
+                return other
+
+    def remember(self, img):
+        for field, byValue in self.known.items():
+            value = img.provenance.get(field)
+            if value:
+                byValue.setdefault(value, []).append(img)
+
+    def _keyFor(self, img):
+        if img.provenance.get('size', 0) <= 0:
+            return None
+        if img.provenance.get('hash'):
+            return 'hash'
+        if img.provenance.get('hash-sample'):
+            return 'hash-sample'
@@ -20,11 +20,16 @@ class BaseFile(object):
         self.provenance.update(self.location.toDictionary())
         self.path = self.provenance['path']
         self.status = 'new'
+        self.replacedVersions = []
 
     def inspect(self):
         self.provenance['size'] = self.filesystem.getsize(self.path)
         self.provenance['created'] = self.filesystem.getctime(self.path)
-        self.provenance['hash'] = self.hasher.digest(self.path)
+        self.provenance['hash-algorithm'] = self.hasher.algorithm
+        if self.hasher.strategy == 'sampled':
+            self.provenance['hash-sample'] = self.hasher.sample(self.path)
+        else:
+            self.provenance['hash'] = self.hasher.digest(self.path)
         if not 'modality' in self.provenance:
             self.provenance['modality'] = 'other'
         return self.provenance
@@ -51,7 +56,11 @@ class BaseFile(object):
 
     @property
     def versions(self):
-        return self.provenance.get('_versions', [])
+        """Provenance of the previous versions of this file, oldest first.
+
+        These are loaded from the repository every time.
+        """
+        return self.dependencies.getRepository().versionsOf(self)
 
     def compare(self, other):
         return niprov.comparing.compare(self, other, self.dependencies)
@@ -67,12 +76,46 @@ class BaseFile(object):
     def getSnapshotFilepath(self):
         return self.pictures.getFilepath(for_=self)
 
+    def copy(self):
+        """A copy of this file object with its own provenance, so that 
+        changing one does not change the other. Versions that are to be 
+        saved with this file are not copied.
+
+        Returns:
+            :class:`.BaseFile`: The copy.
+        """
+        other = copy.copy(self)
+        other.provenance = copyProvenance(self.provenance)
+        other.replacedVersions = []
+        return other
+
     def keepVersionsFromPrevious(self, previous):
-        history = previous.provenance.get('_versions', [])
+        """Keep the provenance of the file that this one replaces as a 
+        version.
+
+        The version is stored by the repository when this file is saved, 
+        as the difference with this file's provenance. Versions that the 
+        previous file still has inside its provenance are moved along.
+
+        Args:
+            previous (:class:`.BaseFile`): Known file at the same location.
+        """
+        history = list(previous.provenance.get('_versions', []))
         prevprov = copy.copy(previous.provenance)
         if '_versions' in prevprov:
             del prevprov['_versions']
         history.append(prevprov)
-        self.provenance['_versions'] = history
+        self.replacedVersions = history
+        self.provenance.pop('_versions', None)
         self.status = 'new-version'
 
+
+def copyProvenance(value):
+    """Copy of provenance, with the dictionaries and lists in it copied as 
+    well, while other values, which are not changed in place, are shared."""
+    if isinstance(value, dict):
+        return {k:copyProvenance(v) for k, v in value.iteritems()}
+    if isinstance(value, list):
+        return [copyProvenance(v) for v in value]
+    return value
+
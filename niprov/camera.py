@@ -1,3 +1,4 @@
+import numpy
 from niprov.dependencies import Dependencies
 
 
@@ -15,7 +16,8 @@ class Camera(object):
         Calls takeSnapshot() to do the actual plotting.
 
         Args:
-            data (numpy.ndarray): Array of 2, 3 or 4 dimensions with image data.
+            data (numpy.ndarray): Array of 2, 3 or 4 dimensions with image 
+                data, or an array proxy such as nibabel's ``img.dataobj``.
         """
         newPicture = self.film.new()
         success = self.takeSnapshot(data, on=newPicture)
@@ -25,8 +27,15 @@ class Camera(object):
     def takeSnapshot(self, data, on):
         """Plot an overview of the image using matplotlib.pyplot.
 
+        Only the middle slice along each of the first three dimensions is 
+        read, of the first volume if there are more dimensions, so that data 
+        that is proxied or memory-mapped is not loaded in full. The maximum 
+        intensity is estimated from these slices. A 2-dimensional image is 
+        plotted as it is.
+
         Args:
-            data (numpy.ndarray): Array of 2, 3 or 4 dimensions with image data.
+            data (numpy.ndarray): Array of 2, 3 or 4 dimensions with image 
+                data, or an array proxy such as nibabel's ``img.dataobj``.
             on (str or file-like object): Where to save figure to.
         """
         tookSnapshot = False
@@ -40,14 +49,15 @@ class Camera(object):
             plt.ioff()
 
         try:
-            ndims = len(data.shape)
-            sliceOrder = [1, 0, 2]
-            fig, axs = plt.subplots(nrows=1, ncols=ndims, figsize=(8, 3), dpi=100)
-            for d in range(ndims):
-                slicing = [slice(None)]*ndims
-                slicing[sliceOrder[d]] = int(data.shape[d]/2)
-                axs[d].matshow(data[slicing].T, origin='lower', 
-                    cmap = plt.get_cmap('gray'), vmin = 0, vmax = data.max())
+            slices = self.middleSlices(data)
+            vmax = max([s.max() for s in slices])
+            fig, axs = plt.subplots(nrows=1, ncols=len(slices), figsize=(8, 3), 
+                dpi=100)
+            if len(slices) == 1:
+                axs = [axs]
+            for d, slice2d in enumerate(slices):
+                axs[d].matshow(slice2d.T, origin='lower', 
+                    cmap = plt.get_cmap('gray'), vmin = 0, vmax = vmax)
                 axs[d].locator_params(nbins=3)
                 axs[d].tick_params(axis='both', which='major', labelsize=8)
             plt.tight_layout()
@@ -60,3 +70,25 @@ class Camera(object):
                 ## Turn interactive mode back on.
                 plt.ion()
         return tookSnapshot
+
+    def middleSlices(self, data):
+        """Read the middle slice along each of the first three dimensions.
+
+        Args:
+            data (numpy.ndarray): Array of 2 or more dimensions with image data, 
+                or an array proxy.
+
+        Returns:
+            list: Three 2-dimensional numpy arrays, or for an image with less
+                than 3 dimensions, the image itself.
+        """
+        shape = data.shape
+        if len(shape) < 3:
+            return [numpy.asarray(data[tuple([slice(None)]*len(shape))])]
+        sliceOrder = [1, 0, 2]
+        slices = []
+        for d in range(3):
+            slicing = [slice(None)]*3 + [0]*(len(shape)-3)
+            slicing[sliceOrder[d]] = int(shape[sliceOrder[d]]/2)
+            slices.append(numpy.asarray(data[tuple(slicing)]))
+        return slices
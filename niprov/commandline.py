@@ -46,9 +46,10 @@ class Commandline(object):
     def renamedDicom(self, fpath):
         self.log('info', 'Renamed dicom file: '+fpath)
 
-    def discoveryFinished(self, nnew, nadded, nfailed, ntotal):
+    def discoveryFinished(self, nnew, nadded, nfailed, ntotal, nunchanged=0):
         self.log('info', 'Discovered {0} new, added {1} to series, failed to read {2}, '
-           'processed {3} total files.'.format(nnew, nadded, nfailed, ntotal))
+           'skipped {4} unchanged, processed {3} total files.'.format(nnew, 
+           nadded, nfailed, ntotal, nunchanged))
 
     def mnefunEventReceived(self, operationName):
         self.log('info', 'Mnefun operation: '+operationName)
@@ -63,6 +64,22 @@ class Commandline(object):
     def exportedToFile(self, fname):
         self.log('info', 'Exported to file: {0}'.format(fname))
 
+    def indexesEnsured(self, names):
+        if names:
+            self.log('info', 'Created indexes: {0}'.format(', '.join(names)))
+        else:
+            self.log('info', 'All indexes are in place.')
+
+    def indexesRebuilt(self, names):
+        self.log('info', 'Rebuilt indexes: {0}'.format(', '.join(names)))
+
+    def versionsPruned(self, n):
+        self.log('info', 'Removed {0} old versions.'.format(n))
+
+    def indexFailed(self, name, error):
+        self.log('warning', 'Could not create index {0}: {1}'.format(name, 
+            error))
+
     def log(self, level, message, exceptionClass=None):
         if self.vlevels.index(level) >= self.vlevels.index(self.verbosity):
             if level == 'error':
@@ -0,0 +1,67 @@
+"""Conditional responses of the web app.
+
+Pages are made from the provenance only, so they stay the same until
+files are saved, or niprov is upgraded. Views that use 
+:py:func:`conditional` have an ETag made from the version of niprov, the 
+route and the revision of the repository, and requests with an If-None-Match 
+header that has that ETag are answered with 304 Not Modified without 
+rendering the page. Pages of views that ask for it are also kept in 
+memory, up to 'web_cache_memory' megabytes, until the revision changes.
+"""
+import pkg_resources
+from pyramid.httpexceptions import HTTPNotModified
+from pyramid.response import Response
+from niprov.pictures import LruCache, MEGABYTE
+
+_PAGES = LruCache(16*MEGABYTE)
+_VERSION = pkg_resources.get_distribution('niprov').version
+
+
+def conditional(keep=False):
+    """Decorator for views that answers with 304 Not Modified if the client
+    has the page for the current revision of the repository.
+
+    Pass it to view_config as decorator.
+
+    Args:
+        keep (bool): Whether to keep the page in memory for later requests 
+            while the revision is the same.
+
+    Returns:
+        function: Decorator that wraps the rendered view.
+    """
+    def decorator(view):
+        def conditionalView(context, request):
+            dependencies = request.dependencies
+            etag = '{0}-{1}-{2}'.format(_VERSION, request.matched_route.name,
+                dependencies.getRepository().revision())
+            if etag in request.if_none_match:
+                return HTTPNotModified(etag=etag)
+            if keep:
+                config = dependencies.getConfiguration()
+                _PAGES.maxbytes = config.web_cache_memory * MEGABYTE
+                key = (etag, request.url)
+                page = _PAGES.get(key)
+                if page is not None:
+                    contentType, body = page.split('\n', 1)
+                    response = Response(body=body)
+                    response.headers['Content-Type'] = contentType
+                    return _validated(response, etag)
+            response = view(context, request)
+            if keep and response.status_int == 200:
+                _PAGES.put(key, '{0}\n{1}'.format(
+                    response.headers['Content-Type'], response.body))
+            return _validated(response, etag)
+        return conditionalView
+    return decorator
+
+
+def clear():
+    """Remove all pages kept in memory."""
+    _PAGES.clear()
+
+
+def _validated(response, etag):
+    response.etag = etag
+    response.cache_control.no_cache = True
+    return response
@@ -14,13 +14,24 @@ class Configuration(object):
     All settings:
     """
     database_type = 'file'
-    """str: Type of backend in which to store provenance. Currently only 'file' 
-    or 'MongoDB'
+    """str: Type of backend in which to store provenance. One of 'file', 
+    'journal', 'sqlite' or 'MongoDB'. A 'journal' is a file to which changes 
+    are appended, which is faster than 'file' for large collections. 'sqlite' 
+    stores provenance in an indexed database file and does not need a server.
     """
 
     database_url = '~/provenance.json'
-    """str: URL of the database. If ``database-type`` is ``file``, this is the 
-    path to the file."""
+    """str: URL of the database. If ``database-type`` is ``file``, 
+    ``journal`` or ``sqlite``, this is the path to the file."""
+
+    database_pool_size = 100
+    """int: Maximum number of connections to a MongoDB database that a 
+    process keeps open. Connections are shared by all operations in the 
+    process."""
+
+    database_pool_min = 0
+    """int: Number of connections to a MongoDB database that a process keeps 
+    open even when they are not used."""
 
     dryrun = False
     """bool: Do not execute commands or make lasting changes to the 
@@ -36,6 +47,54 @@ class Configuration(object):
     Not strictly extensions, can be any string that appears in the file name. 
     Use comma's to separate items."""
 
+    discover_incremental = True
+    """bool: Discover skips files whose size, modification time and inode are 
+    the same as when they were last added. Set to False to inspect all files 
+    again."""
+
+    hash_algorithm = 'md5'
+    """string: Algorithm used to make digests of file content. Any algorithm 
+    provided by hashlib, such as 'md5' or 'sha1', or 'xxh64', 'xxh128' or 
+    'blake3' if the python package of that name is installed. The algorithm 
+    used is recorded for each file as 'hash-algorithm'."""
+
+    hash_strategy = 'full'
+    """string: One of 'full' or 'sampled'. With 'full', a digest of the whole 
+    file is made when it is added. With 'sampled', only a quick digest of 
+    samples of the file is made, and a digest of the whole file is made only 
+    when the sample digest matches another file, to decide whether it is a 
+    copy."""
+
+    picture_cache_memory = 64
+    """int: Maximum size in megabytes of the snapshot pictures that are kept 
+    in memory. The least recently used pictures are removed first."""
+
+    web_cache_memory = 16
+    """int: Maximum size in megabytes of the pages of the web app that are 
+    kept in memory for the current revision of the provenance. The least 
+    recently used pages are removed first."""
+
+    picture_cache_disk = 0
+    """int: Maximum size in megabytes of the snapshot pictures in the 
+    ~/.niprov-snapshots directory, or 0 for no limit. The least recently used 
+    pictures are removed first. Only set a limit if database_type is 
+    'MongoDB', which also stores the pictures in the database. For the other 
+    types, the directory holds the only copy of the pictures."""
+
+    versions_kept = 0
+    """int: Maximum number of previous versions kept for each file, or 0 to 
+    keep all. The oldest versions are removed first. For MongoDB and SQLite 
+    this happens when a version is added, for the other database types when 
+    niprov.pruneVersions() is called or the journal is compacted."""
+
+    json_codec = 1
+    """int: Version of the json encoding written for the 'file', 'journal' and
+    'sqlite' database types and for exports. Version 1 writes datetimes as 
+    an object with a field for each part, version 2 as a number of 
+    microseconds, which is smaller and faster to read and write, but can not
+    be read by niprov 0.5 and earlier, nor by other tools that expect 
+    version 1. Files in either version can be read."""
+
     attach = False
     """bool: Attach provenance to image files. For nifti files for instance,
     this means inserting a header extension with serialized provenance. See 
@@ -53,6 +112,14 @@ class Configuration(object):
     be determined based on OS information or as passed as an argument to the
     provenance operation. See also :py:mod:`niprov.users`"""
 
+    _revision = 0
+
+    def __setattr__(self, name, value):
+        """Count changes to settings, so that components that were created 
+        with the old settings are not reused."""
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, '_revision', self._revision + 1)
+
     def __init__(self, configFilePath='~/niprov.cfg'):
         configFilePath = os.path.expanduser(configFilePath)
         if os.path.isfile(configFilePath):
@@ -68,6 +135,8 @@ class Configuration(object):
                     val = parser.get('main', key)
                 elif types[key] is bool:
                     val = parser.getboolean('main', key)
+                elif types[key] is int:
+                    val = parser.getint('main', key)
                 elif types[key] is list:
                     items = parser.get('main', key).split(',')
                     val = [i.strip() for i in items if i is not '']
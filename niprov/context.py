@@ -13,6 +13,11 @@ class ProvenanceContext(object):
         """See :py:mod:`niprov.adding`  """
         return niprov.adding.add(filepath, transient, provenance, self.deps)
 
+    def addMany(self, filepaths, transient=False, provenance=None):
+        """See :py:mod:`niprov.adding`  """
+        return niprov.adding.addMany(filepaths, transient, provenance, 
+            self.deps)
+
     def approve(self, filepath):
         """See :py:mod:`niprov.approval`  """
         return niprov.approval.approve(filepath, dependencies=self.deps)
@@ -25,9 +30,14 @@ class ProvenanceContext(object):
         """See :py:mod:`niprov.comparing`  """
         return niprov.comparing.compare(file1, file2, dependencies=self.deps)
 
-    def discover(self, root):
+    def discover(self, root, workers=1):
         """See :py:mod:`niprov.discovery`  """
-        return niprov.discovery.discover(root, dependencies=self.deps)
+        return niprov.discovery.discover(root, workers=workers, 
+            dependencies=self.deps)
+
+    def ensureIndexes(self):
+        """See :py:mod:`niprov.indexing`  """
+        return niprov.indexing.ensureIndexes(self.deps)
 
     def export(self, images, medium, form, pipeline=False):
         """See :py:mod:`niprov.exporting`  """
@@ -65,19 +75,27 @@ class ProvenanceContext(object):
         """See :py:mod:`niprov.exporting`  """
         return niprov.exporting.print_(images, pipeline, self.deps)
 
+    def pruneVersions(self):
+        """See :py:mod:`niprov.versioning`  """
+        return niprov.versioning.pruneVersions(self.deps)
+
     def renameDicoms(self, dicomdir):
         """See :py:mod:`niprov.renaming`  """
         return niprov.renaming.renameDicoms(dicomdir, dependencies=self.deps)
 
+    def reindex(self):
+        """See :py:mod:`niprov.indexing`  """
+        return niprov.indexing.reindex(self.deps)
+
     def record(self, command, new=None, parents=None, transient=False, 
         args=None, kwargs=None, user=None, opts=None):
         """See :py:mod:`niprov.recording`  """
         return niprov.recording.record(command, new, parents, transient, 
             args, kwargs, user, opts, self.deps)
 
-    def search(self, text):
+    def search(self, text, n=20, start=0):
         """See :py:mod:`niprov.searching`  """
-        return niprov.searching.search(text, dependencies=self.deps)
+        return niprov.searching.search(text, n, start, dependencies=self.deps)
 
     def selectApproved(self, files):
         """See :py:mod:`niprov.approval`  """
@@ -3,6 +3,9 @@ from niprov.basefile import BaseFile
 from niprov.libraries import Libraries
 
 
+DEFER_SIZE = 1024
+
+
 class DicomFile(BaseFile):
 
     def __init__(self, location, **kwargs):
@@ -15,13 +18,13 @@ class DicomFile(BaseFile):
 
         If a general AcquisitionDateTime attribute is not present, the 
         SeriesDate and SeriesTime will be used to set the :ref:`field-acquired` 
-        provenance field.
+        provenance field. Only the header is read, see :py:func:`readHeader`.
 
         Returns:
             dict: Provenance for the inspected file.
         """
         super(DicomFile, self).inspect()
-        img = self.libs.dicom.read_file(self.path)
+        img = readHeader(self.path, self.libs)
         self.provenance['subject'] = img.PatientID
         self.provenance['protocol'] = img.SeriesDescription
         self.provenance['seriesuid'] = img.SeriesInstanceUID
@@ -70,16 +73,57 @@ class DicomFile(BaseFile):
 
         The file will be stored in provenance in the 'filesInSeries' list.
         """
-        self.provenance['filesInSeries'].append(img.path)
+        return self.mergeWithMany([img])
+
+    def mergeWithMany(self, images):
+        """
+        Add several DICOM file objects to this series at once.
+
+        Files that are already part of the series are skipped, and fields 
+        that depend on the number of files are only updated once.
+        """
+        files = self._seriesFileSet()
+        for img in images:
+            if img.path not in files:
+                files.add(img.path)
+                self.provenance['filesInSeries'].append(img.path)
         self._updateNfilesDependentFields()
         self.status = 'series-new-file'
         return self
 
+    def copy(self):
+        other = super(DicomFile, self).copy()
+        other.__dict__.pop('_files', None)
+        return other
+
     def hasFile(self, other):
-        return other.path in self.provenance['filesInSeries']
+        return other.path in self._seriesFileSet()
+
+    def _seriesFileSet(self):
+        filesInSeries = self.provenance['filesInSeries']
+        if len(getattr(self, '_files', ())) != len(filesInSeries):
+            self._files = set(filesInSeries)
+        return self._files
 
     def _updateNfilesDependentFields(self):
         if (not self.provenance['multiframeDicom']) and 'dimensions' in self.provenance:
             nfiles = len(self.provenance['filesInSeries'])
             self.provenance['dimensions'][2] = nfiles
 
+
+def readHeader(path, libs=Libraries()):
+    """
+    Read the attributes of a DICOM file, but not the image data.
+
+    Reading stops before the pixel data, and other large values are only 
+    read when they are accessed. For multiframe files this avoids loading 
+    the frames just to read a few attributes.
+
+    Args:
+        path (str): Path to the DICOM file.
+
+    Returns:
+        Dataset: pydicom dataset without pixel data.
+    """
+    return libs.dicom.read_file(path, stop_before_pixels=True, 
+        defer_size=DEFER_SIZE)
@@ -1,12 +1,48 @@
 from niprov.config import Configuration
 
 
+_SINGLETONS = {}
+
+
 class Dependencies(object):
+    """Provides the objects that niprov components use.
+
+    Objects are created when they are first asked for, and then reused:
+
+    - The filesystem, libraries, clock and externals do not depend on 
+      settings, and are shared by the whole process.
+    - Other components are kept by this Dependencies object, until its 
+      configuration is replaced or a setting is changed. Use one 
+      Dependencies object for an operation or a web request.
+    - The repository, query and fingerprint cache hold state, and are new 
+      every time.
+    """
 
     def __init__(self, config=None):
         if config is None:
             config = Configuration()
         self.config = config
+        self._services = {}
+        self._servicesConfig = None
+        self._servicesRevision = None
+
+    def _scoped(self, name, create):
+        """Get the component for this configuration, creating it if needed."""
+        revision = getattr(self.config, '_revision', None)
+        if (self._servicesConfig is not self.config or 
+                self._servicesRevision != revision):
+            self._services = {}
+            self._servicesConfig = self.config
+            self._servicesRevision = revision
+        if name not in self._services:
+            self._services[name] = create()
+        return self._services[name]
+
+    def _singleton(self, name, create):
+        """Get the component shared by the process, creating it if needed."""
+        if name not in _SINGLETONS:
+            _SINGLETONS[name] = create()
+        return _SINGLETONS[name]
 
     def reconfigureOrGetConfiguration(self, newConfiguration):
         if newConfiguration is not None:
@@ -15,74 +51,95 @@ class Dependencies(object):
 
     def getCamera(self):
         import niprov.camera
-        return niprov.camera.Camera(dependencies=self)
+        return self._scoped('camera', 
+            lambda: niprov.camera.Camera(dependencies=self))
 
     def getClock(self):
         import niprov.clock
-        return niprov.clock.Clock()
+        return self._singleton('clock', niprov.clock.Clock)
 
     def getConfiguration(self):
         return self.config
 
     def getExternals(self):
         import niprov.externals
-        return niprov.externals.Externals()
+        return self._singleton('externals', niprov.externals.Externals)
 
     def getFileFactory(self):
         import niprov.files
-        return niprov.files.FileFactory(dependencies=self)
+        return self._scoped('fileFactory', 
+            lambda: niprov.files.FileFactory(dependencies=self))
 
     def getFileFilter(self):
         import niprov.filefilter
-        return niprov.filefilter.FileFilter(dependencies=self)
+        return self._scoped('fileFilter', 
+            lambda: niprov.filefilter.FileFilter(dependencies=self))
+
+    def getFingerprintCache(self):
+        import niprov.fingerprints
+        return niprov.fingerprints.FingerprintCache(dependencies=self)
 
     def getFilesystem(self):
         import niprov.filesystem
-        return niprov.filesystem.Filesystem()
+        return self._singleton('filesystem', niprov.filesystem.Filesystem)
 
     def getFormatFactory(self):
         import niprov.formatfactory
-        return niprov.formatfactory.FormatFactory(dependencies=self)
+        return self._scoped('formatFactory', 
+            lambda: niprov.formatfactory.FormatFactory(dependencies=self))
 
     def getHasher(self):
         import niprov.hashing
-        return niprov.hashing.Hasher()
+        return self._scoped('hasher', 
+            lambda: niprov.hashing.Hasher(dependencies=self))
 
     def getLibraries(self):
         import niprov.libraries
-        return niprov.libraries.Libraries()
+        return self._singleton('libraries', niprov.libraries.Libraries)
 
     def getListener(self):
         import niprov.commandline
-        return niprov.commandline.Commandline(dependencies=self)
+        return self._scoped('listener', 
+            lambda: niprov.commandline.Commandline(dependencies=self))
 
     def getLocationFactory(self):
         import niprov.locationfactory
-        return niprov.locationfactory.LocationFactory(dependencies=self)
+        return self._scoped('locationFactory', 
+            lambda: niprov.locationfactory.LocationFactory(dependencies=self))
 
     def getMediumFactory(self):
         import niprov.mediumfactory
-        return niprov.mediumfactory.MediumFactory(dependencies=self)
+        return self._scoped('mediumFactory', 
+            lambda: niprov.mediumfactory.MediumFactory(dependencies=self))
 
     def getRepository(self):
         import niprov.jsonfile
+        import niprov.journalfile
         import niprov.mongo
+        import niprov.sqlitedb
         if self.config.database_type == 'file':
             return niprov.jsonfile.JsonFile(dependencies=self)
+        elif self.config.database_type == 'journal':
+            return niprov.journalfile.JournalFile(dependencies=self)
         elif self.config.database_type == 'MongoDB':
             return niprov.mongo.MongoRepository(dependencies=self)
+        elif self.config.database_type == 'sqlite':
+            return niprov.sqlitedb.SqliteRepository(dependencies=self)
 
     def getSerializer(self):
         import niprov.formatjson
-        return niprov.formatjson.JsonFormat(self)
+        return self._scoped('serializer', 
+            lambda: niprov.formatjson.JsonFormat(self))
 
     def getPictureCache(self):
         import niprov.pictures
-        return niprov.pictures.PictureCache(dependencies=self)
+        return self._scoped('pictureCache', 
+            lambda: niprov.pictures.PictureCache(dependencies=self))
 
     def getPipelineFactory(self):
         import niprov.pipelinefactory
-        return niprov.pipelinefactory.PipelineFactory(dependencies=self)
+        return self._scoped('pipelineFactory', 
+            lambda: niprov.pipelinefactory.PipelineFactory(dependencies=self))
 
     def getQuery(self):
         import niprov.querying
@@ -90,5 +147,6 @@ class Dependencies(object):
 
     def getUsers(self):
         import niprov.users
-        return niprov.users.Users(dependencies=self)
+        return self._scoped('users', 
+            lambda: niprov.users.Users(dependencies=self))
 
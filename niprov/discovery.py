@@ -1,36 +1,170 @@
 #!/usr/bin/python
 # -*- coding: UTF-8 -*-
-import os
+import os, multiprocessing
 from niprov.dependencies import Dependencies
-from niprov.adding import add
+from niprov.adding import addMany, locateNew, inspectNew, registerMany
+from niprov.streaming import batches
 
 
-def discover(root, dependencies=Dependencies()):
+BATCHSIZE = 500
+
+
+def discover(root, workers=1, dependencies=Dependencies()):
     """
     Search a directory for image files, and add them to your provenance collection.
 
-    Files are only included if they match the filters in the 
-    'discover_file_extensions' settings.
+    Files are only included if they match the filters in the
+    'discover_file_extensions' settings. Unless the 'discover_incremental'
+    setting is off, files that have not changed since they were last 
+    discovered are skipped without being opened, as long as the provenance 
+    they were registered as is still in the repository.
+    Files are registered in batches with niprov.addMany, such that the slices 
+    of a DICOM series are merged and saved together. Each batch is 
+    registered as soon as the walk through the directory has filled it.
     Refer to niprov.add for details on what happens to individual files.
 
     Args:
         root (str): The top directory in which to look for new files.
+        workers (int, optional): Number of processes used to inspect files.
+            When larger than 1, files are inspected in parallel, while the
+            provenance is still saved by the calling process, a batch at a 
+            time. Defaults to 1.
     """
-    filesys = dependencies.getFilesystem()
-    filefilter = dependencies.getFileFilter()
     listener = dependencies.getListener()
+    config = dependencies.getConfiguration()
+    fingerprints = dependencies.getFingerprintCache()
+    incremental = config.discover_incremental and not config.dryrun
+
+    stats = {'total':0, 'new':0, 'series-new-file':0, 'failed':0,
+        'new-version':0, 'unchanged':0}
+    filepaths = _walk(root, stats, fingerprints if incremental else None, 
+        dependencies)
+    if workers > 1:
+        images = _addInParallel(filepaths, workers, dependencies)
+    else:
+        images = _addInBatches(filepaths, dependencies)
+    for filepath, p in images:
+        stats[p.status] = stats[p.status] + 1
+        if incremental and p.status != 'failed':
+            fingerprints.remember(filepath, *_storedAs(p, filepath))
+    if incremental:
+        fingerprints.save()
+    listener.discoveryFinished(nnew=stats['new'],
+        nadded=stats['series-new-file'], nfailed=stats['failed'],
+        ntotal=stats['total'], nunchanged=stats['unchanged'])
+
 
-    dirs = filesys.walk(root)
-    stats = {'total':0, 'new':0, 'series-new-file':0, 'failed':0, 
-        'new-version':0}
-    for (root, sdirs, files) in dirs:
+def _walk(root, stats, fingerprints, dependencies):
+    """The files to add below root, as the directory is walked.
+
+    With fingerprints, files that did not change are left out, once a 
+    batch of them has been checked against the repository. The files found
+    and left out are counted in stats.
+    """
+    filesys = dependencies.getFilesystem()
+    filefilter = dependencies.getFileFilter()
+    unchanged = []
+    for (dirpath, sdirs, files) in filesys.walk(root):
         for filename in files:
-            filepath = os.path.join(root, filename)
+            filepath = os.path.join(dirpath, filename)
             if filefilter.include(filename):
                 stats['total'] = stats['total'] + 1
-                p = add(filepath, transient=False, dependencies=dependencies)
-                stats[p.status] = stats[p.status] + 1
-    listener.discoveryFinished(nnew=stats['new'], 
-        nadded=stats['series-new-file'], nfailed=stats['failed'], 
-        ntotal=stats['total'])
+                if fingerprints and fingerprints.unchanged(filepath):
+                    unchanged.append(filepath)
+                else:
+                    yield filepath
+                if len(unchanged) == BATCHSIZE:
+                    for filepath in _notStored(unchanged, fingerprints, 
+                            stats, dependencies):
+                        yield filepath
+                    unchanged = []
+    for filepath in _notStored(unchanged, fingerprints, stats, dependencies):
+        yield filepath
+
+
+def _addInBatches(filepaths, dependencies):
+    """Add files a batch at a time."""
+    for batch in batches(filepaths, BATCHSIZE):
+        images = addMany(batch, transient=False, dependencies=dependencies)
+        for filepath, img in zip(batch, images):
+            yield filepath, img
+
+
+def _addInParallel(filepaths, workers, dependencies):
+    """Inspect files in a pool of processes and register them in batches."""
+    config = dependencies.getConfiguration()
+    factory = dependencies.getFileFactory()
+    pictures = dependencies.getPictureCache()
+    pool = multiprocessing.Pool(workers)
+    try:
+        inspected = []
+        for batch in batches(filepaths, BATCHSIZE):
+            tasks = [(filepath, config) for filepath in batch]
+            for provenance, status, snapshot in pool.imap_unordered(
+                    _inspectInWorker, tasks, chunksize=4):
+                img = factory.fromProvenance(provenance)
+                img.status = status
+                if status == 'failed' or config.dryrun:
+                    yield img.path, img
+                    continue
+                if snapshot:
+                    pictures.keep(snapshot, for_=img)
+                inspected.append(img)
+                if len(inspected) == BATCHSIZE:
+                    for pair in _registerBatch(inspected, dependencies):
+                        yield pair
+                    inspected = []
+        for pair in _registerBatch(inspected, dependencies):
+            yield pair
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+
+
+def _registerBatch(images, dependencies):
+    if not images:
+        return []
+    paths = [img.path for img in images]
+    return zip(paths, registerMany(images, dependencies))
+
+
+def _storedAs(img, filepath):
+    """The hash of the image, or if add() returned the series it was 
+    merged into, the location of the series."""
+    if img.path == os.path.abspath(filepath):
+        return img.provenance.get('hash'), None
+    return None, img.location.toString()
+
+
+def _notStored(filepaths, fingerprints, stats, dependencies):
+    """The unchanged files whose provenance the repository no longer has, 
+    or has with a different hash, as the database may have been replaced 
+    since they were remembered. The others are counted as unchanged."""
+    if not filepaths:
+        return []
+    repository = dependencies.getRepository()
+    stored = dict([(f, fingerprints.stored(f)) for f in filepaths])
+    locations = list(set([location for location, _ in stored.values()]))
+    hashes = dict([(img.location.toString(), img.provenance.get('hash')) 
+        for img in repository.byLocations(locations)])
+    missing = [f for f in filepaths if stored[f][0] not in hashes or 
+        stored[f][1] not in (None, hashes[stored[f][0]])]
+    stats['unchanged'] = stats['unchanged'] + len(filepaths) - len(missing)
+    return missing
+
+
+def _inspectInWorker(task):
+    """Inspect one file in a worker process.
+
+    Returns:
+        tuple: Provenance, status and snapshot picture of the file.
+    """
+    filepath, config = task
+    dependencies = Dependencies(config)
+    img = locateNew(filepath, transient=False, dependencies=dependencies)
+    if not config.dryrun:
+        inspectNew(img, transient=False, dependencies=dependencies)
+    snapshot = dependencies.getPictureCache().getBytes(for_=img)
+    return img.provenance, img.status, snapshot
 
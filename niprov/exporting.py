@@ -1,6 +1,7 @@
 #!/usr/bin/python
 # -*- coding: UTF-8 -*-
 from niprov.dependencies import Dependencies
+from niprov.versioning import withVersions
 
 
 def export(provenance, medium, form, pipeline=False, dependencies=Dependencies()):
@@ -46,8 +47,13 @@ def print_(provenance, pipeline=False, dependencies=Dependencies()):
 
 def backup(dependencies=Dependencies()):
     """Shortcut for export(medium='file', form='json') for all provenance.
+
+    Provenance is read from the repository and written to the file one file 
+    at a time, so that the whole collection does not have to fit in memory.
+    The previous versions of each file are included under '_versions'.
     """
-    provenance = dependencies.getQuery().all()
+    repository = dependencies.getRepository()
+    provenance = withVersions(repository.iterAll(), repository)
     return export(provenance, medium='file', form='json', 
                   dependencies=dependencies)
 
@@ -6,6 +6,7 @@ from parrec import ParrecFile
 from fif import FifFile
 from nifti import NiftiFile
 from niprov.cnt import NeuroscanFile
+from niprov.record import Record
 
 
 class FileFactory(object):
@@ -25,6 +26,7 @@ class FileFactory(object):
     def __init__(self, dependencies=Dependencies()):
         self.libs = dependencies.getLibraries()
         self.listener = dependencies.getListener()
+        self.locations = dependencies.getLocationFactory()
         self.dependencies = dependencies
     
     def locatedAt(self, location, provenance=None):
@@ -59,6 +61,18 @@ class FileFactory(object):
     def fromProvenance(self, provenance):
         return self.locatedAt(provenance['location'], provenance)
 
+    def recordFromProvenance(self, provenance):
+        """Return a lightweight :class:`.Record` for the provenance, which 
+        creates the file object only when needed.
+
+        Args:
+            provenance (dict): Provenance of the file, with its location.
+
+        Returns:
+            :class:`.Record`: View of the provenance.
+        """
+        return Record(provenance, self)
+
 
 
 
@@ -37,6 +37,23 @@ class Filesystem(object):
             contents = fhandle.read()
         return contents
 
+    def readChunks(self, path, size=64*1024):
+        """Read the contents of a textfile a piece at a time.
+
+        Args:
+            path: Path to the file to read.
+            size (int): Number of bytes per piece.
+
+        Returns:
+            generator: Pieces of the contents of the file.
+
+        Raises:
+            IOError: [Errno 2] No such file or directory: 'xyz'
+        """
+        with open(path) as fhandle:
+            for chunk in iter(lambda: fhandle.read(size), ''):
+                yield chunk
+
     def write(self, path, content):
         """Write string content to a textfile.
 
@@ -47,6 +64,29 @@ class Filesystem(object):
         with open(path, 'w') as fhandle:
             fhandle.write(content)
 
+    def writeChunks(self, path, chunks):
+        """Write pieces of string content to a textfile one after the other.
+
+        Args:
+            path: Path to the file to write.
+            chunks: Iterable of strings to fill the file with.
+        """
+        with open(path, 'w') as fhandle:
+            for chunk in chunks:
+                fhandle.write(chunk)
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def rename(self, path, newpath):
+        """Move a file to a new path, replacing any file there.
+
+        Args:
+            path: Path to the file to move.
+            newpath: Path to move it to.
+        """
+        os.rename(path, newpath)
+
     def getsize(self, path):
         return os.path.getsize(path)
 
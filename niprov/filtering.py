@@ -0,0 +1,165 @@
+"""Conditions on provenance fields, as collected by :class:`.Query`, and
+the means for the repositories to apply them.
+
+A filter is a list of conditions that files must all meet. A condition is
+either a :py:data:`Condition` on one field, or an :py:data:`Either` of
+several filters of which files must meet at least one. Repositories hand
+as much of a filter as they can to their storage, with :py:func:`toMongo`
+or by looking up the values of a :py:func:`pushdown` condition, and test
+the files found against the rest with :py:func:`matches`.
+"""
+from collections import namedtuple
+from niprov.streaming import ordered
+
+Condition = namedtuple('Condition', ['name', 'op', 'value'])
+"""A test of one provenance field. The operation is one of
+:py:data:`OPERATORS`."""
+
+Either = namedtuple('Either', ['alternatives'])
+"""Alternative filters, of which a file has to match at least one."""
+
+OPERATORS = ('eq', 'in', 'gt', 'gte', 'lt', 'lte', 'exists')
+"""Operations of a :py:data:`Condition`. 'eq' and 'in' match fields with
+a list of values if one of them matches, as in MongoDB, and 'exists' tests
+whether the file has the field or not, depending on the value."""
+
+_COMPARISONS = {
+    'gt': lambda a, b: a > b,
+    'gte': lambda a, b: a >= b,
+    'lt': lambda a, b: a < b,
+    'lte': lambda a, b: a <= b,
+}
+
+
+def matches(provenance, conditions):
+    """Whether provenance meets all conditions of a filter.
+
+    Args:
+        provenance (dict): Provenance of a file.
+        conditions (list): :py:data:`Condition` and :py:data:`Either` items.
+
+    Returns:
+        bool: True if the file matches.
+    """
+    for condition in conditions:
+        if isinstance(condition, Either):
+            if not any([matches(provenance, alternative)
+                        for alternative in condition.alternatives]):
+                return False
+        elif not _meets(provenance, condition):
+            return False
+    return True
+
+
+def _meets(provenance, condition):
+    name, op, value = condition
+    if op == 'exists':
+        return (name in provenance) == bool(value)
+    if name not in provenance:
+        return False
+    actual = provenance[name]
+    if op in ('eq', 'in'):
+        wanted = [value] if op == 'eq' else value
+        candidates = actual if isinstance(actual, list) else [actual]
+        return any([c in wanted for c in candidates])
+    if actual is None:
+        return False
+    try:
+        return _COMPARISONS[op](actual, value)
+    except TypeError:
+        return False
+
+
+def toMongo(conditions):
+    """Translate a filter to a MongoDB query document.
+
+    Args:
+        conditions (list): :py:data:`Condition` and :py:data:`Either` items.
+
+    Returns:
+        dict: Query for the find(), count_documents() and distinct()
+            methods of a collection.
+    """
+    parts = []
+    for condition in conditions:
+        if isinstance(condition, Either):
+            parts.append({'$or':[toMongo(alternative)
+                for alternative in condition.alternatives]})
+        elif condition.op == 'eq':
+            parts.append({condition.name:condition.value})
+        elif condition.op == 'exists':
+            parts.append({condition.name:{'$exists':bool(condition.value)}})
+        else:
+            value = condition.value
+            if condition.op == 'in':
+                value = list(value)
+            parts.append({condition.name:{'$'+condition.op:value}})
+    if not parts:
+        return {}
+    if len(parts) == 1:
+        return parts[0]
+    return {'$and':parts}
+
+
+def pushdown(conditions, indexed=None):
+    """The condition of a filter that storage can answer by looking up the
+    values of a field.
+
+    Args:
+        conditions (list): :py:data:`Condition` and :py:data:`Either` items.
+        indexed (collection, optional): Names of the fields that can be
+            looked up. Defaults to any field.
+
+    Returns:
+        tuple: Name of the field and list of values looked for, or None if
+            no 'eq' or 'in' condition is on a field that can be looked up.
+    """
+    for condition in conditions:
+        if isinstance(condition, Either) or condition.op not in ('eq', 'in'):
+            continue
+        if indexed is not None and condition.name not in indexed:
+            continue
+        if condition.op == 'eq':
+            return condition.name, [condition.value]
+        return condition.name, list(condition.value)
+
+
+def select(images, query):
+    """Apply a query to files that have not been filtered by storage.
+
+    Args:
+        images: Iterable of :class:`.BaseFile` objects.
+        query (:class:`.Query`): Conditions, sort order and range of
+            results.
+
+    Returns:
+        list: The files that match in order, or if the query asks for all
+            values of a field, the distinct values of that field.
+    """
+    conditions = query.getFilter()
+    found = [i for i in images if matches(i.provenance, conditions)]
+    distinct = query.getDistinct()
+    if distinct is not None:
+        values = []
+        for image in found:
+            if distinct in image.provenance:
+                if image.provenance[distinct] not in values:
+                    values.append(image.provenance[distinct])
+        return values
+    if query.getSort() is not None:
+        found = ordered(found, query.getSort())
+    return window(found, query)
+
+
+def window(results, query):
+    """The part of results after the query's offset, up to its limit."""
+    start = query.getOffset()
+    limit = query.getLimit()
+    if limit is None:
+        return results[start:]
+    return results[start:start+limit]
+
+
+def countMatching(images, conditions):
+    """Number of files that match a filter, without keeping them."""
+    return sum(1 for i in images if matches(i.provenance, conditions))
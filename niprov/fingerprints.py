@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+import os, json
+from niprov.dependencies import Dependencies
+
+
+class FingerprintCache(object):
+    """Remembers the size, modification time and inode of discovered files.
+
+    Used by discover to skip files that have not changed since they were last
+    registered, without opening them. Fingerprints are kept separately for
+    each database, in a file in the home directory, with the location and 
+    hash of the provenance that the file was registered as, so that discover
+    can check that the database still holds it.
+    """
+
+    def __init__(self, dependencies=Dependencies()):
+        self.filesys = dependencies.getFilesystem()
+        self.location = dependencies.getLocationFactory()
+        config = dependencies.getConfiguration()
+        self.database = config.database_type + ':' + config.database_url
+        self.cachefile = os.path.expanduser('~/.niprov-fingerprints.json')
+        self.databases = None
+        self.changed = False
+
+    def unchanged(self, filepath):
+        """Whether the file is the same as when it was last remembered.
+
+        Args:
+            filepath (str): Path to the file.
+
+        Returns:
+            bool: True if the file's size, modification time and inode match
+                the fingerprint remembered for it.
+        """
+        known = self._fingerprints().get(self.location.completeString(filepath))
+        if known is None:
+            return False
+        return known[:3] == self._fingerprint(filepath)
+
+    def remember(self, filepath, hash=None, location=None):
+        """Store the current fingerprint of the file.
+
+        Args:
+            filepath (str): Path to the file.
+            hash (str, optional): Hash digest of the file's content.
+            location (str, optional): Location of the provenance the file 
+                was registered as, if that is not the file itself, such as
+                the DICOM series it is part of.
+        """
+        fingerprint = self._fingerprint(filepath) + [hash, location]
+        self._fingerprints()[self.location.completeString(filepath)] = fingerprint
+        self.changed = True
+
+    def stored(self, filepath):
+        """Where the provenance of a remembered file is, and its hash.
+
+        Args:
+            filepath (str): Path to the file.
+
+        Returns:
+            tuple: Location of the provenance the file was registered as, and 
+                the hash remembered for it, or None if no hash was.
+        """
+        location = self.location.completeString(filepath)
+        known = self._fingerprints().get(location, [])
+        known = known + [None] * (5 - len(known))
+        return known[4] or location, known[3]
+
+    def save(self):
+        """Write the fingerprints to disk, if any were remembered.
+
+        They are written to a temporary file first, which then replaces the
+        cache file, so that an interrupted run does not leave half of it.
+        """
+        if self.changed:
+            tmppath = '{0}.{1}.tmp'.format(self.cachefile, os.getpid())
+            self.filesys.write(tmppath, json.dumps(self.databases))
+            self.filesys.rename(tmppath, self.cachefile)
+            self.changed = False
+
+    def _fingerprint(self, filepath):
+        stat = self.filesys.stat(filepath)
+        return [stat.st_size, stat.st_mtime, stat.st_ino]
+
+    def _fingerprints(self):
+        if self.databases is None:
+            try:
+                self.databases = json.loads(self.filesys.read(self.cachefile))
+            except (IOError, ValueError):
+                self.databases = {}
+        return self.databases.setdefault(self.database, {})
+
@@ -1,16 +1,41 @@
-import json, copy
-from datetime import datetime
+import re, collections, itertools
+from datetime import datetime, timedelta
 from niprov.format import Format
+try:
+    import simplejson as json
+except ImportError:
+    import json
 
 
 class JsonFormat(Format):
     """Helper to convert provenance data to and from json encoded strings.
+
+    Datetimes are written in the encoding set with the 'json_codec' setting, 
+    see :py:data:`CODECS`. Provenance in any of the encodings can be read.
+    The simplejson package is used if it is installed, as it is faster than 
+    the json module of the standard library.
     """
 
     def __init__(self, dependencies):
         super(JsonFormat, self).__init__(dependencies)
         self.fileExtension = 'json'
         self.file = dependencies.getFileFactory()
+        codec = dependencies.getConfiguration().json_codec
+        if codec not in CODECS:
+            raise ValueError('Unknown json_codec: {0}'.format(codec))
+        self.encoder = CODECS[codec]()
+        self.decoder = DateTimeAwareJSONDecoder()
+
+    def serialize(self, provenance):
+        """Convert provenance to json.
+
+        Iterators such as the generator returned by 
+        :py:meth:`.Repository.iterAll` are converted one item at a time with 
+        serializeIter. Other provenance is treated as by :class:`.Format`.
+        """
+        if isinstance(provenance, collections.Iterator):
+            return self.serializeIter(provenance)
+        return super(JsonFormat, self).serialize(provenance)
 
     def serializeSingle(self, record):
         """
@@ -24,7 +49,7 @@ class JsonFormat(Format):
             str: Json version of the provenance.
         """
         flat = self._deflate(record.provenance)
-        return json.dumps(flat, cls=DateTimeAwareJSONEncoder)
+        return self.encoder.encode(flat)
 
     def deserialize(self, jsonRecord):
         """
@@ -38,9 +63,24 @@ class JsonFormat(Format):
         Returns:
             dict: Python dictionary of the provenance.
         """
-        provenance = json.loads(jsonRecord, cls=DateTimeAwareJSONDecoder)
+        provenance = self.decoder.decode(jsonRecord)
         return self.file.fromProvenance(provenance)
 
+    def deserializeRecord(self, jsonRecord):
+        """
+        Convert one provenance item from its json string version to a 
+        lightweight :class:`.Record`, for listing.
+
+        Args:
+            jsonRecord (str): The provenance item to convert as json-encoded 
+                string.
+
+        Returns:
+            :class:`.Record`: View of the provenance.
+        """
+        provenance = self.decoder.decode(jsonRecord)
+        return self.file.recordFromProvenance(provenance)
+
     def serializeList(self, listOfRecords):
         """
         Convert a list of provenance items from its native list of python dict 
@@ -53,7 +93,7 @@ class JsonFormat(Format):
             str: Json version of the provenance items.
         """
         flatRecords = [self._deflate(r.provenance) for r in listOfRecords]
-        return json.dumps(flatRecords, cls=DateTimeAwareJSONEncoder)
+        return self.encoder.encode(flatRecords)
 
     def deserializeList(self, jsonListOfRecords):
         """
@@ -67,32 +107,171 @@ class JsonFormat(Format):
         Returns:
             list: Python list of dictionaries of the provenance.
         """
-        provenanceList = json.loads(jsonListOfRecords, cls=DateTimeAwareJSONDecoder)
+        provenanceList = self.decoder.decode(jsonListOfRecords)
         return [self.file.fromProvenance(p) for p in provenanceList]
 
+    def encode(self, value):
+        """
+        Convert a value made of dicts, lists and simple types, such as a 
+        difference between versions, to json, in the same way as provenance.
+
+        Args:
+            value: The value to convert.
+
+        Returns:
+            str: Json version of the value.
+        """
+        return self.encoder.encode(value)
+
+    def decode(self, jsonValue):
+        """
+        Convert json made by encode back to the value.
+
+        Args:
+            jsonValue (str): The json to convert.
+
+        Returns:
+            The value.
+        """
+        return self.decoder.decode(jsonValue)
+
+    def serializeIter(self, records):
+        """
+        Convert provenance items to a json list, one item at a time.
+
+        The text yielded adds up to the same json as that of serializeList,
+        but only one item is converted at a time.
+
+        Args:
+            records: Iterable of the provenance items to convert.
+
+        Returns:
+            generator: Pieces of the json text.
+        """
+        yield '['
+        separator = ''
+        for record in records:
+            yield separator + self.serializeSingle(record)
+            separator = ', '
+        yield ']'
+
+    def deserializeIter(self, chunks):
+        """
+        Convert a json list of provenance items, read in pieces, to 
+        lightweight records one at a time.
+
+        Items are converted as soon as the text for them has been read, so 
+        only one item has to be kept in memory at a time. An item that is 
+        not complete yet is only parsed again once the text read for it has 
+        doubled, so that large items do not take quadratic time.
+
+        Args:
+            chunks: Iterable of pieces of the json text, for instance as read 
+                from a file.
+
+        Returns:
+            generator: :class:`.Record` objects for the provenance items.
+        """
+        decoder = self.decoder
+        buf = ''
+        pos = 0
+        pending = []
+        npending = 0
+        waitFor = 0
+        started = False
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is not None:
+                pending.append(chunk)
+                npending += len(chunk)
+                if len(buf) - pos + npending < waitFor:
+                    continue
+            buf = buf[pos:] + ''.join(pending)
+            pos = 0
+            pending = []
+            npending = 0
+            while True:
+                pos = _SEPARATORS.match(buf, pos).end()
+                if not started:
+                    if pos == len(buf):
+                        break
+                    if buf[pos] != '[':
+                        raise ValueError('Expected a json list.')
+                    started = True
+                    pos += 1
+                    continue
+                if pos == len(buf) or buf[pos] == ']':
+                    break
+                try:
+                    provenance, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    waitFor = 2 * (len(buf) - pos)
+                    break
+                waitFor = 0
+                pos = end
+                yield self.file.recordFromProvenance(provenance)
+        rest = buf[pos:].strip()
+        if rest and rest != ']':
+            raise ValueError('Incomplete json list.')
+
     def _deflate(self, record):
-        flatRecord = copy.deepcopy(record)
-        def deflateOne(prov):
-            if 'args' in prov:
-                prov['args'] = [self._strcust(a) for a in prov['args']]
-            if 'kwargs' in prov:
-                kwargs = prov['kwargs']
-                prov['kwargs'] = {k: self._strcust(kwargs[k]) 
-                    for k in kwargs.keys()}
-            if '_id' in prov:
-                del prov['_id']
-            return prov
-        deflateOne(flatRecord)
-        for version in flatRecord.get('_versions', []):
-            deflateOne(version)
+        """Provenance as it is written to json.
+
+        Values of 'args' and 'kwargs' that json can not encode are converted 
+        to strings, and a MongoDB '_id' is left out, for the provenance and 
+        each of its '_versions'. The provenance is not copied, except for the 
+        dictionaries and lists that change, which are copied shallowly.
+        """
+        flatRecord = self._deflateOne(record)
+        versions = record.get('_versions')
+        if versions:
+            flatVersions = [self._deflateOne(v) for v in versions]
+            if any(f is not v for f, v in zip(flatVersions, versions)):
+                if flatRecord is record:
+                    flatRecord = dict(record)
+                flatRecord['_versions'] = flatVersions
         return flatRecord
 
+    def _deflateOne(self, prov):
+        if not ('args' in prov or 'kwargs' in prov or '_id' in prov):
+            return prov
+        prov = dict(prov)
+        if 'args' in prov:
+            prov['args'] = [self._strcust(a) for a in prov['args']]
+        if 'kwargs' in prov:
+            kwargs = prov['kwargs']
+            prov['kwargs'] = {k: self._strcust(kwargs[k]) 
+                for k in kwargs.keys()}
+        prov.pop('_id', None)
+        return prov
+
     def _strcust(self, val):
         """Stringify an object that is not of a simple type."""
         if not isinstance(val, (str, unicode, int, float, bool, type(None))):
             return str(val)
         return val
 
+_SEPARATORS = re.compile(r'[\s,]*')
+EPOCH = datetime(1970, 1, 1)
+
+
+class CompactJSONEncoder(json.JSONEncoder):
+    """
+    Converts datetime objects into an object with the number of microseconds 
+    since 1970-01-01 00:00 under the '$dt' key, which can be decoded using 
+    the DateTimeAwareJSONDecoder. Datetimes with a timezone are converted 
+    to UTC, and the timezone is not kept.
+    """
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            offset = obj.utcoffset()
+            obj = obj.replace(tzinfo=None)
+            if offset is not None:
+                obj = obj - offset
+            delta = obj - EPOCH
+            return {'$dt':(delta.days * 86400 + delta.seconds) * 1000000 
+                + delta.microseconds}
+        return json.JSONEncoder.default(self, obj)
+
 # Taken from http://taketwoprogramming.blogspot.com/2009/06/subclassing-jsonencoder-and-jsondecoder.html
 
 class DateTimeAwareJSONEncoder(json.JSONEncoder):
@@ -119,13 +298,16 @@ class DateTimeAwareJSONEncoder(json.JSONEncoder):
 class DateTimeAwareJSONDecoder(json.JSONDecoder):
     """ 
     Converts a json string, where datetime and timedelta objects were converted
-    into objects using the DateTimeAwareJSONEncoder, back into a python object.
+    into objects using the DateTimeAwareJSONEncoder or the CompactJSONEncoder, 
+    back into a python object.
     """
 
     def __init__(self, **kwargs):
         json.JSONDecoder.__init__(self, object_hook=self.dict_to_object)
 
     def dict_to_object(self, d):
+        if '$dt' in d and len(d) == 1 and isinstance(d['$dt'], (int, long)):
+            return EPOCH + timedelta(microseconds=d['$dt'])
         if '__type__' not in d:
             return d
 
@@ -136,3 +318,10 @@ class DateTimeAwareJSONDecoder(json.JSONDecoder):
             # Oops... better put this back together.
             d['__type__'] = type
             return d
+
+
+CODECS = {1:DateTimeAwareJSONEncoder, 2:CompactJSONEncoder}
+"""Encoders for each version of the json encoding of provenance. Version 1 
+writes datetimes as an object with a field for each of their parts, version 
+2 as an object with a single number, which is much shorter and faster to 
+read."""
@@ -1,5 +1,4 @@
 from __future__ import print_function
-import copy
 from niprov.format import Format
 
 
@@ -42,13 +41,11 @@ class SimpleFormat(Format):
         Args:
             provenance (dict): Provenance for one image file
         """
-        provcopy = copy.deepcopy(image.provenance)
-        for field in self._expectedFields:
-            if field not in provcopy:
-                provcopy[field] = None
+        provenance = image.provenance
+        fields = {f:provenance.get(f) for f in self._expectedFields}
         tmp = ('{0[acquired]!s}  {0[subject]!s:12} {0[protocol]!s:24} '
             '{0[dimensions]!s:20} {0[path]!s:24}')
-        return tmp.format(provcopy)
+        return tmp.format(fields)
 
     def serializeStatistics(self, stats):
         """Publish statistics for collected provenance in the terminal.
@@ -53,7 +53,8 @@ class XmlFormat(Format):
                 fileHash.setAttribute('id', hashId)
 
                 hashAlgo = dom.createElementNS(nfo, 'nfo:hashAlgorithm')
-                hashAlgoVal = dom.createTextNode('MD5')
+                hashAlgoVal = dom.createTextNode(
+                    item.provenance.get('hash-algorithm', 'md5').upper())
                 hashAlgo.appendChild(hashAlgoVal)
                 fileHash.appendChild(hashAlgo)
 
@@ -1,27 +1,121 @@
 #!/usr/bin/python
 # -*- coding: UTF-8 -*-
-import hashlib
+import hashlib, mmap, os
+from niprov.dependencies import Dependencies
 
 
 class Hasher(object):
+    """Creates digests of file content.
+
+    The algorithm is set with the 'hash_algorithm' setting. This can be any
+    algorithm provided by hashlib, or 'xxh64', 'xxh128' or 'blake3' if the
+    python package of that name is installed.
+    """
 
     blocksize = 512*8*128
+    sampleblocks = 16
+    sampleblocksize = 64*1024
+
+    def __init__(self, dependencies=Dependencies()):
+        config = dependencies.getConfiguration()
+        self.algorithm = config.hash_algorithm
+        self.strategy = config.hash_strategy
+        self.digests = {}
 
     def digest(self, filename):
         """Determine the unique hash digest for a file.
 
-        Note: takes 26s for a 14GB file.
+        Large files are read through a memory map. With md5, this takes 26s
+        for a 14GB file.
 
         Args:
             filename (str): Path to the file for which a hash digest should be made.
         """
-        hash = hashlib.md5()
+        hash = self._new()
         with open(filename, "rb") as f:
-            for block in iter(lambda: f.read(self.blocksize), ""):
+            if os.fstat(f.fileno()).st_size > self.blocksize:
+                try:
+                    self._updateFromMap(hash, f)
+                    return hash.hexdigest()
+                except (EnvironmentError, ValueError):
+                    hash = self._new()
+                    f.seek(0)
+            for block in iter(lambda: f.read(self.blocksize), b""):
                 hash.update(block)
         return hash.hexdigest()
 
+    def sample(self, filename):
+        """Determine a quick fingerprint of the file content.
+
+        Hashes the file size together with the first and last block of the
+        file and blocks at regular intervals in between. Files with different
+        content can have the same sample digest, but files with the same
+        content always do.
+
+        Args:
+            filename (str): Path to the file for which a sample digest should
+                be made.
+        """
+        hash = self._new()
+        with open(filename, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            hash.update(str(size).encode())
+            lastblock = max(size - self.sampleblocksize, 0)
+            nsamples = self.sampleblocks if lastblock else 1
+            for s in range(nsamples):
+                f.seek(int(lastblock * s / max(nsamples - 1, 1)))
+                hash.update(f.read(self.sampleblocksize))
+        return hash.hexdigest()
 
+    def completeDigest(self, image):
+        """Get the digest of the full content of the file.
+
+        If the provenance for the file does not have one made with the current
+        algorithm, and the file is available, a digest is made with the 
+        current algorithm. It is kept 
+        by the hasher for as long as the file does not change, rather than 
+        stored with the provenance, which may be shared with the cache of 
+        the repository.
+
+        Args:
+            image (:class:`.BaseFile`): File for which the digest is needed.
+
+        Returns:
+            str: The hash digest, or None if it can not be determined.
+        """
+        provenance = image.provenance
+        algorithm = provenance.get('hash-algorithm', 'md5')
+        if 'hash' in provenance and algorithm == self.algorithm:
+            return provenance['hash']
+        if not os.path.isfile(image.path):
+            return None
+        stat = os.stat(image.path)
+        key = (image.path, stat.st_size, stat.st_mtime)
+        if key not in self.digests:
+            self.digests[key] = self.digest(image.path)
+        return self.digests[key]
+
+    def sameContent(self, image, other):
+        """Whether two files have the same content according to their full
+        hash digest.
+        """
+        digest = self.completeDigest(image)
+        return digest is not None and digest == self.completeDigest(other)
 
+    def _updateFromMap(self, hash, f):
+        filemap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for start in range(0, len(filemap), self.blocksize):
+                hash.update(buffer(filemap, start, self.blocksize))
+        finally:
+            filemap.close()
 
+    def _new(self):
+        if self.algorithm in ('xxh64', 'xxh128'):
+            import xxhash
+            return getattr(xxhash, self.algorithm)()
+        if self.algorithm == 'blake3':
+            import blake3
+            return blake3.blake3()
+        return hashlib.new(self.algorithm)
 
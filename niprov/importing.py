@@ -1,5 +1,7 @@
 from niprov.dependencies import Dependencies
 from niprov.jsonfile import JsonFile
+from niprov.streaming import BATCHSIZE, batches
+from niprov.versioning import unpackVersions
 from datetime import datetime as dt
 
 def importp(filepath, dependencies=Dependencies()):
@@ -9,11 +11,22 @@ def importp(filepath, dependencies=Dependencies()):
     in Python.
 
     This can serve as a backup, migration tool, or for exchange.
+    The file is read a piece at a time, and the provenance is added to the 
+    repository in batches. Files at locations that the repository already
+    has replace the provenance there. Previous versions of files that the 
+    file has under '_versions', as written by backup(), are kept as versions.
     """
     repository = dependencies.getRepository()
     importDeps = Dependencies()
     importDeps.getConfiguration().database_url = filepath
     importRepo = JsonFile(importDeps)
-    allFiles = importRepo.all()
-    for pfile in allFiles:
-        repository.add(pfile)
+    for batch in batches(importRepo.iterAll(), BATCHSIZE):
+        images = [unpackVersions(image) for image in batch]
+        known = set([i.location.toString() for i in 
+            repository.byLocations([i.location.toString() for i in images])])
+        new = [i for i in images if i.location.toString() not in known]
+        existing = [i for i in images if i.location.toString() in known]
+        if new:
+            repository.addMany(new)
+        if existing:
+            repository.updateMany(existing)
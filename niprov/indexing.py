@@ -0,0 +1,30 @@
+from niprov.dependencies import Dependencies
+
+
+def ensureIndexes(dependencies=Dependencies()):
+    """Create any indexes that the provenance database is missing.
+
+    For MongoDB this is also done once per process when connecting. Does 
+    nothing for the 'file' and 'journal' database types.
+
+    Returns:
+        list: Names of the indexes created.
+    """
+    repository = dependencies.getRepository()
+    listener = dependencies.getListener()
+    created = repository.ensureIndexes()
+    listener.indexesEnsured(created)
+    return created
+
+
+def reindex(dependencies=Dependencies()):
+    """Rebuild the indexes of the provenance database.
+
+    Returns:
+        list: Names of the indexes rebuilt.
+    """
+    repository = dependencies.getRepository()
+    listener = dependencies.getListener()
+    rebuilt = repository.reindex()
+    listener.indexesRebuilt(rebuilt)
+    return rebuilt
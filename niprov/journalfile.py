@@ -0,0 +1,413 @@
+import os, threading
+from niprov.dependencies import Dependencies
+from niprov.jsonfile import JsonFile, Collection, _CACHE
+from niprov.streaming import lastPerLocation
+from niprov.filtering import pushdown
+from niprov.formatjson import DateTimeAwareJSONDecoder
+from niprov.tallying import Tally
+
+
+_JOURNALS = {}
+_JOURNALS_LOCK = threading.Lock()
+_decode = DateTimeAwareJSONDecoder().decode
+
+
+class JournalFile(JsonFile):
+    """Stores provenance in a local append-only journal of json records.
+
+    Every add or update appends one line with the serialized provenance of the
+    file to the journal, so registering a file does not require reading or
+    rewriting the rest of the collection. The most recent line for a location
+    is the current provenance for that file. An in-memory index of line
+    offsets is kept per journal and shared by all JournalFile objects in the
+    process. Lookups on fields that it does not cover use the parsed current
+    lines, which are kept in memory until the journal changes. Once 
+    superseded lines outnumber current ones, the journal is compacted in a 
+    background thread. Several processes can append to the same journal, 
+    but compaction assumes that no other process is writing at the same 
+    time.
+
+    Set ``database_type`` to ``journal`` to use this backend.
+    """
+
+    def __init__(self, dependencies=Dependencies()):
+        super(JournalFile, self).__init__(dependencies)
+        self.journal = openJournal(self.datafile)
+
+    def add(self, image):
+        """Add the provenance for one file to storage.
+
+        Args:
+            image (:class:`.BaseFile`): Image file to store.
+        """
+        self.journal.append(image.location.toString(),
+            self.json.serializeSingle(image))
+        self._saved([image])
+        self.pictureCache.saveToDisk(for_=image)
+
+    def addMany(self, images):
+        """Add the provenance for several files to storage at once.
+
+        Args:
+            images (list): List of :class:`.BaseFile` objects to store.
+        """
+        images = lastPerLocation(images)
+        self.updateMany(images)
+        for image in images:
+            self.pictureCache.saveToDisk(for_=image)
+
+    def update(self, image):
+        """Save changed provenance for this file..
+
+        Args:
+            image (:class:`.BaseFile`): Image file that has changed.
+        """
+        self.journal.append(image.location.toString(),
+            self.json.serializeSingle(image))
+        self._saved([image])
+
+    def updateMany(self, images):
+        """Save changed provenance for several files at once.
+
+        Args:
+            images (list): List of :class:`.BaseFile` objects that have changed.
+        """
+        if not images:
+            return
+        self.journal.appendMany([(i.location.toString(),
+            self.json.serializeSingle(i)) for i in images])
+        self._saved(images)
+
+    def all(self):
+        """Retrieve all known provenance from storage.
+
+        Returns:
+            list: List of provenance for known files.
+        """
+        return [self.json.deserializeRecord(l) 
+            for l in self.journal.currentLines()]
+
+    def byLocation(self, locationString):
+        """Get the provenance for a file at the given location.
+
+        In the case of a dicom series, this returns the provenance for the
+        series.
+
+        Args:
+            locationString (str): Location of the image file.
+
+        Returns:
+            dict: Provenance for one image file.
+        """
+        line = self.journal.lineFor(locationString)
+        if line is not None:
+            return self.json.deserialize(line)
+
+    def byLocations(self, listOfLocations):
+        lines = self.journal.linesFor(listOfLocations)
+        return [self.json.deserialize(l) for l in lines]
+
+    def getSeries(self, image):
+        """Get the object that carries provenance for the series that the image
+        passed is in.
+
+        Args:
+            image (:class:`.DicomFile`): File that is part of a series.
+
+        Returns:
+            :class:`.DicomFile`: Image object that caries provenance for the series.
+        """
+        seriesId = image.getSeriesId()
+        if seriesId is None:
+            return None
+        locations = self.journal.locationsWith('seriesuid', seriesId)
+        if locations:
+            return self.byLocation(locations[0])
+
+    def byFieldValues(self, fieldName, listOfValues):
+        if fieldName not in Journal.indexedFields:
+            return super(JournalFile, self).byFieldValues(fieldName,
+                listOfValues)
+        locations = set()
+        for value in listOfValues:
+            locations.update(self.journal.locationsWith(fieldName, value))
+        return self.byLocations(sorted(locations))
+
+    def byParents(self, listOfParentLocations):
+        """Get the files that have any of these locations as parent, looked 
+        up with the journal index.
+
+        Args:
+            listOfParentLocations (list): Locations of parent files.
+
+        Returns:
+            list: Child files.
+        """
+        return self.byFieldValues('parents', listOfParentLocations)
+
+    def byId(self, uid):
+        locations = self.journal.locationsWith('id', uid)
+        if locations:
+            return self.byLocation(locations[0])
+
+    def _candidates(self, query):
+        """Files that may match the query, looked up with the journal index 
+        if the query tests an indexed field, or else streamed."""
+        lookup = pushdown(query.getFilter(), Journal.indexedFields)
+        if lookup is None:
+            return self._stream()
+        field, values = lookup
+        locations, seen = [], set()
+        for value in values:
+            for location in self.journal.locationsWith(field, value):
+                if location not in seen:
+                    seen.add(location)
+                    locations.append(location)
+        return self.byLocations(locations)
+
+    def _handedOut(self, candidates):
+        return candidates
+
+    def _collection(self):
+        """All current files, for the lookups that the journal index does 
+        not cover, parsed again only when the journal has changed."""
+        state = self.journal.state()
+        cached = _CACHE.get(self.datafile)
+        if cached is not None and cached.fingerprint == state:
+            return cached
+        collection = Collection(self.all(), state, shared=True)
+        _CACHE[self.datafile] = collection
+        return collection
+
+    def _tally(self):
+        return self.journal.tallied()
+
+    def _stream(self):
+        for line in self.journal.iterCurrentLines():
+            yield self.json.deserializeRecord(line)
+
+    def compact(self):
+        """Rewrite the journal with only the current line for each file, and 
+        remove versions beyond the number set with 'versions_kept'.
+
+        The journal is normally compacted automatically in the background.
+        """
+        self.journal.compact()
+        self.pruneVersions()
+
+
+def openJournal(path):
+    """Get the shared Journal object for the journal file at this path."""
+    with _JOURNALS_LOCK:
+        if path not in _JOURNALS:
+            _JOURNALS[path] = Journal(path)
+        return _JOURNALS[path]
+
+
+class Journal(object):
+    """Index of the lines in a journal file.
+
+    Keeps track of the offset of the current line for each location, as well
+    as which locations have a given value for a few fields used for lookups,
+    or for list fields such as 'parents', contain it, and the tallies of the
+    current lines. Lines appended by other processes 
+    are indexed when the file is found to have grown. The inode of the file
+    is kept with the offsets, so that if another process compacts the 
+    journal and replaces the file, it is indexed anew.
+    """
+
+    indexedFields = ['id', 'hash', 'hash-sample', 'seriesuid', 'parents']
+    compactionRatio = 2
+    compactionMinimum = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.compacting = None
+        self._reset()
+
+    def _reset(self):
+        self.offsets = {}
+        self.values = {}
+        self.fields = {f:{} for f in self.indexedFields}
+        self.tally = Tally()
+        self.nlines = 0
+        self.end = 0
+        self.inode = None
+
+    def append(self, location, line):
+        self.appendMany([(location, line)])
+
+    def appendMany(self, locationsAndLines):
+        with self.lock:
+            self._refresh()
+            with open(self.path, 'ab') as fhandle:
+                fhandle.seek(0, os.SEEK_END)
+                offset = fhandle.tell()
+                fhandle.write(''.join([l + '\n' for _, l in locationsAndLines]))
+                inode = os.fstat(fhandle.fileno()).st_ino
+            if inode != self.inode or offset != self.end:
+                self._refresh()
+            else:
+                for location, line in locationsAndLines:
+                    self._index(location, _decode(line), offset)
+                    offset += len(line) + 1
+                self.end = offset
+            self._compactIfNeeded()
+
+    def lineFor(self, location):
+        with self.lock:
+            fhandle = self._openCurrent()
+            if fhandle is None:
+                return None
+            with fhandle:
+                if location not in self.offsets:
+                    return None
+                fhandle.seek(self.offsets[location])
+                return fhandle.readline().rstrip('\n')
+
+    def linesFor(self, locations):
+        """Current lines for the known locations, in the order given, read 
+        with one pass through the file."""
+        with self.lock:
+            fhandle = self._openCurrent()
+            if fhandle is None:
+                return []
+            lines = {}
+            with fhandle:
+                wanted = sorted(set([(self.offsets[l], l) for l in locations 
+                    if l in self.offsets]))
+                for offset, location in wanted:
+                    fhandle.seek(offset)
+                    lines[location] = fhandle.readline().rstrip('\n')
+        return [lines[l] for l in locations if l in lines]
+
+    def currentLines(self):
+        return list(self.iterCurrentLines())
+
+    def iterCurrentLines(self):
+        """The current line for each location, read one at a time.
+
+        The file is opened right away, so lines appended or a compaction 
+        started while going through it do not affect the lines yielded.
+        """
+        with self.lock:
+            fhandle = self._openCurrent()
+            if fhandle is None:
+                return
+            current = set(self.offsets.values())
+        with fhandle:
+            for offset, line in _linesFrom(fhandle, 0):
+                if offset in current:
+                    yield line
+
+    def state(self):
+        """The inode of the journal and the offset up to which it has been 
+        read, which change whenever lines are appended or it is replaced."""
+        with self.lock:
+            self._refresh()
+            return (self.inode, self.end)
+
+    def tallied(self):
+        """The :class:`.Tally` of the current lines."""
+        with self.lock:
+            self._refresh()
+            return self.tally
+
+    def locationsWith(self, field, value):
+        with self.lock:
+            self._refresh()
+            return sorted(self.fields[field].get(value, ()))
+
+    def compact(self):
+        with self.lock:
+            journal = self._openCurrent()
+            if journal is None:
+                return
+            current = set(self.offsets.values())
+            tmppath = self.path + '.compacting'
+            with journal, open(tmppath, 'wb') as fhandle:
+                for offset, line in _linesFrom(journal, 0):
+                    if offset in current:
+                        fhandle.write(line + '\n')
+            os.rename(tmppath, self.path)
+            self._reset()
+            self._refresh()
+
+    def _compactIfNeeded(self):
+        nstale = self.nlines - len(self.offsets)
+        if nstale < self.compactionMinimum:
+            return
+        if nstale < len(self.offsets) * (self.compactionRatio - 1):
+            return
+        if self.compacting is not None and self.compacting.is_alive():
+            return
+        self.compacting = threading.Thread(target=self.compact)
+        self.compacting.daemon = True
+        self.compacting.start()
+
+    def _refresh(self):
+        """Index any lines that were appended since we last looked, or the 
+        whole file if it was replaced."""
+        try:
+            fhandle = open(self.path, 'rb')
+        except IOError:
+            self._reset()
+            return
+        with fhandle:
+            stat = os.fstat(fhandle.fileno())
+            if stat.st_ino != self.inode or stat.st_size < self.end:
+                self._reset()
+                self.inode = stat.st_ino
+            for offset, line in _linesFrom(fhandle, self.end):
+                record = _decode(line)
+                self._index(record['location'], record, offset)
+                self.end = offset + len(line) + 1
+
+    def _openCurrent(self):
+        """Index any new lines, and open the file that the offsets are of.
+
+        Returns:
+            file: Open journal, or None if there is no journal.
+        """
+        while True:
+            self._refresh()
+            try:
+                fhandle = open(self.path, 'rb')
+            except IOError:
+                self._reset()
+                return None
+            if os.fstat(fhandle.fileno()).st_ino == self.inode:
+                return fhandle
+            fhandle.close()
+
+    def _index(self, location, record, offset):
+        for field, values in self.values.get(location, {}).items():
+            for value in values:
+                self.fields[field][value].discard(location)
+        values = {f:_listed(record[f]) for f in self.indexedFields 
+            if f in record}
+        for field, fieldValues in values.items():
+            for value in fieldValues:
+                self.fields[field].setdefault(value, set()).add(location)
+        self.values[location] = values
+        self.tally.set(location, record)
+        self.offsets[location] = offset
+        self.nlines += 1
+
+
+def _listed(value):
+    """The hashable values of a field, which may have a list of values."""
+    values = value if isinstance(value, list) else [value]
+    return [v for v in values if not isinstance(v, (list, dict))]
+
+
+def _linesFrom(fhandle, start):
+    """Complete lines in the file from the start offset, with their offset."""
+    fhandle.seek(start)
+    while True:
+        offset = fhandle.tell()
+        line = fhandle.readline()
+        if not line.endswith('\n'):
+            break
+        yield offset, line.rstrip('\n')
@@ -1,10 +1,31 @@
 import os
-from operator import itemgetter
 from niprov.dependencies import Dependencies
+from niprov.streaming import (BATCHSIZE, ordered, project, 
+    lastPerLocation)
+from niprov.versioning import VersionFile, takeDeltas, restoreVersions
+from niprov.filtering import pushdown, select, countMatching
+from niprov.textindex import openTextIndex
+from niprov.tallying import Tally
+
+
+_CACHE = {}
+_TALLIES = {}
 
 
 class JsonFile(object):
     """Stores provenance in a local text file encoded as json.
+
+    The parsed contents of the file are kept in memory, shared by all 
+    JsonFile objects in the process, and only read again when the size, 
+    modification time or inode of the file has changed. Writes of this 
+    process update them. Lookups by location, id, series, hash and parents 
+    use dictionaries built from the contents. The file objects returned are
+    copies, so changing them does not change the contents kept unless they 
+    are saved. Previous versions of files are kept in a 
+    separate file next to it, with the extension '.versions', and the index
+    used by search() in one with the extension '.search'. The tallies for
+    statistics() and facet() are counted when first asked for, and kept up
+    to date by the writes of this process.
     """
 
     def __init__(self, dependencies=Dependencies()):
@@ -12,12 +33,33 @@ class JsonFile(object):
         self.json = dependencies.getSerializer()
         self.factory = dependencies.getFileFactory()
         self.pictureCache = dependencies.getPictureCache()
-        url = dependencies.getConfiguration().database_url
-        self.datafile = os.path.expanduser(url)
+        config = dependencies.getConfiguration()
+        self.kept = config.versions_kept
+        self.datafile = os.path.expanduser(config.database_url)
+        self.versions = VersionFile(self.datafile + '.versions', self.json)
+        self.textIndex = openTextIndex(self.datafile + '.search')
+
+    def serializeAndWrite(self, images, saved=()):
+        """Write the files to storage, replacing its contents, and keep them
+        in memory.
 
-    def serializeAndWrite(self, images):
+        Args:
+            images (list): All files, the ones kept in memory or saved.
+            saved (list): Files among them that are new or changed, which 
+                are copied, as the caller may go on to change them.
+        """
+        tally = self._knownTally()
         jsonstr = self.json.serializeList(images)
+        _CACHE.pop(self.datafile, None)
         self.filesys.write(self.datafile, jsonstr)
+        fingerprint = self._fingerprint()
+        savedIds = set([id(i) for i in saved])
+        _CACHE[self.datafile] = Collection([i.copy() if id(i) in savedIds 
+            else i for i in images], fingerprint, shared=True)
+        if tally is not None:
+            for image in saved:
+                tally.set(image.location.toString(), image.provenance)
+            _TALLIES[self.datafile] = (fingerprint, tally)
 
     def add(self, image):
         """Add the provenance for one file to storage.
@@ -25,22 +67,61 @@ class JsonFile(object):
         Args:
             image (:class:`.BaseFile`): Image file to store.
         """
-        current = self.all()
+        current = self._stored()
         current.append(image)
-        self.serializeAndWrite(current)
+        self.serializeAndWrite(current, [image])
+        self._saved([image])
         self.pictureCache.saveToDisk(for_=image)
 
+    def addMany(self, images):
+        """Add the provenance for several files to storage at once.
+
+        Args:
+            images (list): List of :class:`.BaseFile` objects to store.
+        """
+        images = lastPerLocation(images)
+        if not images:
+            return
+        current = self._stored()
+        current.extend(images)
+        self.serializeAndWrite(current, images)
+        self._saved(images)
+        for image in images:
+            self.pictureCache.saveToDisk(for_=image)
+
     def update(self, image):
         """Save changed provenance for this file..
 
         Args:
             image (:class:`.BaseFile`): Image file that has changed.
         """
-        current = self.all()
+        current = self._stored()
+        saved = []
         for r in range(len(current)):
             if current[r].location.toString() == image.location.toString():
                 current[r] = image
-        self.serializeAndWrite(current)
+                saved = [image]
+        self.serializeAndWrite(current, saved)
+        self._saved([image])
+
+    def updateMany(self, images):
+        """Save changed provenance for several files at once.
+
+        Args:
+            images (list): List of :class:`.BaseFile` objects that have changed.
+        """
+        if not images:
+            return
+        changed = {i.location.toString(): i for i in images}
+        current = self._stored()
+        saved = []
+        for r in range(len(current)):
+            location = current[r].location.toString()
+            if location in changed:
+                current[r] = changed[location]
+                saved.append(current[r])
+        self.serializeAndWrite(current, saved)
+        self._saved(lastPerLocation(images))
 
     def all(self):
         """Retrieve all known provenance from storage.
@@ -48,11 +129,33 @@ class JsonFile(object):
         Returns:
             list: List of provenance for known files.
         """
-        try:
-            jsonstr = self.filesys.read(self.datafile)
-        except IOError:
-            return []
-        return self.json.deserializeList(jsonstr)
+        return self._collection().copies()
+
+    def iterAll(self, batchsize=BATCHSIZE, projection=None, sort=None):
+        """Go through all known provenance, without loading it all at once.
+
+        Unless the contents of the file are already in memory, the file is 
+        read and parsed a piece at a time. Sorting requires all files to be 
+        loaded. The batchsize is not used, as the file is read in pieces of 
+        a fixed size.
+
+        Args:
+            batchsize (int): Number of records fetched from storage at once.
+            projection (list, optional): Names of the provenance fields to 
+                retrieve. The location is always retrieved. Defaults to all 
+                fields.
+            sort (str, optional): Field to sort on, prefixed with a '-' for 
+                descending order.
+
+        Returns:
+            generator: :class:`.BaseFile` objects for known files.
+        """
+        images = self._stream()
+        if sort is not None:
+            images = ordered(images, sort)
+        if projection is not None:
+            images = project(images, projection, self.factory)
+        return iter(images)
 
     def byLocation(self, locationString):
         """Get the provenance for a file at the given location. 
@@ -66,12 +169,22 @@ class JsonFile(object):
         Returns:
             dict: Provenance for one image file.
         """
-        for image in self.all():
-            if image.location.toString() == locationString:
-                return image
+        return self._collection().first('location', locationString)
 
     def byLocations(self, listOfLocations):
-        return [f for f in self.all() if f.location.toString() in listOfLocations]
+        return self._collection().withValues('location', listOfLocations)
+
+    def byFieldValues(self, fieldName, listOfValues):
+        """Get any files for which the given field has one of these values.
+
+        Args:
+            fieldName (str): Name of the provenance field.
+            listOfValues (list): Values to look for.
+
+        Returns:
+            list: List with BaseFile objects
+        """
+        return self._collection().withValues(fieldName, listOfValues)
 
     def getSeries(self, image):
         """Get the object that carries provenance for the series that the image 
@@ -86,10 +199,35 @@ class JsonFile(object):
         seriesId = image.getSeriesId()
         if seriesId is None:
             return None
-        for image in self.all():
-            if 'seriesuid' in image.provenance and (
-                image.provenance['seriesuid'] == seriesId):
-                return image
+        return self._collection().first('seriesuid', seriesId)
+
+    def extendSeries(self, extensions):
+        """Save files that were merged into known series.
+
+        Args:
+            extensions (list): Tuples of a series object and the list of 
+                paths that were added to its 'filesInSeries'.
+        """
+        if extensions:
+            self.updateMany([series for series, _ in extensions])
+
+    def ensureIndexes(self):
+        """Lookups use dictionaries made in memory, and the search index is 
+        built when first searched, so this does nothing.
+
+        Returns:
+            list: Empty list.
+        """
+        return []
+
+    def reindex(self):
+        """Build the search index anew.
+
+        Returns:
+            list: Name of the search index.
+        """
+        self.textIndex.rebuild(self.iterAll())
+        return ['search']
 
     def updateApproval(self, fpath, approvalStatus):
         img = self.byLocation(fpath)
@@ -99,52 +237,278 @@ class JsonFile(object):
     def latest(self, n=20):
         def dateTimeAdded(img):
             return img.provenance.get('added')
-        sortedImages = sorted(self.all(), key=dateTimeAdded, reverse=True)
-        return sortedImages[:n]
+        collection = self._collection()
+        sortedImages = sorted(collection.images, key=dateTimeAdded, 
+            reverse=True)
+        return collection.copies(sortedImages[:n])
+
+    def versionsOf(self, image):
+        """Get the previous versions of a file.
+
+        Args:
+            image (:class:`.BaseFile`): File for which to get the versions.
+
+        Returns:
+            list: Provenance of the previous versions, oldest first.
+        """
+        deltas = self.versions.deltasFor(image.location.toString())
+        return restoreVersions(image.provenance, deltas)
+
+    def _saved(self, images):
+        """Keep the versions that saved files replace, and index their 
+        text."""
+        self.keepVersions(images)
+        self.textIndex.update(images)
+
+    def keepVersions(self, images):
+        """Store the differences with the versions that the images replace.
+
+        Args:
+            images (list): Files that were saved.
+        """
+        self.versions.append([(i.location.toString(), d) 
+            for i in images for d in takeDeltas(i)])
+
+    def pruneVersions(self):
+        """Remove the oldest versions of files beyond the number set with 
+        the 'versions_kept' setting.
+
+        Returns:
+            int: Number of versions removed.
+        """
+        if not self.kept:
+            return 0
+        return self.versions.prune(self.kept)
 
     def statistics(self):
-        stats = {}
-        images = self.all()
-        stats['count'] = len(images)
-        sizes = [img.provenance['size'] for img in images if 'size' in img.provenance]
-        stats['totalsize'] = sum(sizes)
-        return stats
+        """Number of files and their total size.
+
+        Returns:
+            dict: With 'count' and 'totalsize'.
+        """
+        return self._tally().statistics()
+
+    def facet(self, field):
+        """Number of files and their total size for each value of a field.
+
+        Args:
+            field (str): One of the :py:data:`.FACETS`, or 'acquired' for 
+                the number of files acquired on each day.
+
+        Returns:
+            dict: For each value a dict with 'count' and 'totalsize'.
+        """
+        return self._tally().facet(field)
 
     def byId(self, uid):
-        for image in self.all():
-            if image.provenance['id'] == uid:
-                return image
+        return self._collection().first('id', uid)
+
+    def revision(self):
+        """A string that changes whenever the file is written, made from its 
+        size, modification time and inode.
+
+        Returns:
+            str: Revision of the contents of storage.
+        """
+        fingerprint = self._fingerprint()
+        if fingerprint is None:
+            return '0'
+        return '{0}-{1!r}-{2}'.format(*fingerprint)
 
     def byParents(self, listOfParentLocations):
-        return [f for f in self.all() if set(listOfParentLocations).intersection(
-            f.provenance.get('parents',[]))]
+        return self._collection().withValues('parents', listOfParentLocations)
 
     def inquire(self, query):
-        field = query.getFields()[0]
-        matches = []
-        for image in self.all():
-            if field.name in image.provenance:
-                if field.all:
-                    if not image.provenance[field.name] in matches:
-                        matches.append(image.provenance[field.name])
-                else:
-                    if image.provenance[field.name] == field.value:
-                        matches.append(image)
-        return matches
-
-    def search(self, text):
-        fields = ['location','user','subject','project','protocol',
-                  'transformation','technique','modality']
-        matches = []
-        for image in self.all():
-            score = 0
-            for word in text.split():
-                for field in fields:
-                    if field in image.provenance:
-                        score += image.provenance[field].count(word)
-            if score > 0:
-                matches.append((image, score))
-        sortedResults = sorted(matches, key=itemgetter(1), reverse=True)
-        return [i for i, s in sortedResults[:20]]
-        
+        """Files that match a query, or the values of a field asked for.
+
+        If the query tests a field for one or more values, the files are 
+        looked up by that field first.
+
+        Args:
+            query (:class:`.Query`): Conditions, sort order and range.
+
+        Returns:
+            list: Matching files, or distinct values of a field.
+        """
+        results = select(self._candidates(query), query)
+        if query.getDistinct() is not None:
+            return results
+        return self._handedOut(results)
+
+    def count(self, query):
+        """Number of files that match a query.
+
+        Args:
+            query (:class:`.Query`): Conditions to match.
+
+        Returns:
+            int: Number of files.
+        """
+        return countMatching(self._candidates(query), query.getFilter())
+
+    def _candidates(self, query):
+        """Files that may match the query, narrowed down by a lookup if 
+        possible."""
+        collection = self._collection()
+        lookup = pushdown(query.getFilter())
+        if lookup is None:
+            return collection.images
+        try:
+            return collection.matching(*lookup)
+        except TypeError:
+            return collection.images
+
+    def _handedOut(self, candidates):
+        """Copies of files from :py:meth:`_candidates`, which are the ones
+        kept in memory."""
+        return [i.copy() for i in candidates]
+
+    def search(self, text, n=20, start=0):
+        """Files with the given words in their searchable fields, best match 
+        first, ranked with the index in :py:mod:`niprov.textindex`.
 
+        Args:
+            text (str): Words to look for.
+            n (int): Maximum number of files returned.
+            start (int): Number of better matching files to skip.
+
+        Returns:
+            list: Matching files.
+        """
+        if not self.textIndex.exists():
+            self.textIndex.rebuild(self.iterAll())
+        locations = self.textIndex.search(text, n, start)
+        found = {i.location.toString():i for i in self.byLocations(locations)}
+        return [found[l] for l in locations if l in found]
+
+    def _collection(self):
+        """The contents of the file, read again only if it has changed."""
+        fingerprint = self._fingerprint()
+        if fingerprint is None:
+            return Collection([])
+        cached = _CACHE.get(self.datafile)
+        if cached is not None and cached.fingerprint == fingerprint:
+            return cached
+        try:
+            jsonstr = self.filesys.read(self.datafile)
+        except IOError:
+            return Collection([])
+        collection = Collection(self.json.deserializeList(jsonstr), 
+            fingerprint, shared=True)
+        _CACHE[self.datafile] = collection
+        return collection
+
+    def _stored(self):
+        """The files in storage, as kept in memory, to write along with 
+        files saved."""
+        return list(self._collection().images)
+
+    def _stream(self):
+        """The files in storage, parsed one at a time if they are not in 
+        memory already."""
+        fingerprint = self._fingerprint()
+        if fingerprint is None:
+            return
+        cached = _CACHE.get(self.datafile)
+        if cached is not None and cached.fingerprint == fingerprint:
+            for image in cached.images:
+                yield image.copy()
+            return
+        try:
+            chunks = self.filesys.readChunks(self.datafile)
+            for image in self.json.deserializeIter(chunks):
+                yield image
+        except IOError:
+            return
+
+    def _tally(self):
+        """The tallies of the files in storage, counted again only if the 
+        file was written by another process."""
+        tally = self._knownTally()
+        if tally is None:
+            fingerprint = self._fingerprint()
+            tally = Tally()
+            for image in self._stream():
+                tally.set(image.location.toString(), image.provenance)
+            _TALLIES[self.datafile] = (fingerprint, tally)
+        return tally
+
+    def _knownTally(self):
+        """The tallies kept for the file as it is now, or None."""
+        known = _TALLIES.get(self.datafile)
+        if known is not None and known[0] == self._fingerprint():
+            return known[1]
+
+    def _fingerprint(self):
+        """Size, modification time and inode of the file, or None if there 
+        is no file."""
+        try:
+            stat = self.filesys.stat(self.datafile)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime, stat.st_ino)
+
+
+class Collection(object):
+    """Image file objects with lookup dictionaries for their fields.
+
+    Dictionaries are made for a field when it is first looked up. If the 
+    collection is shared, the files it returns are copies.
+
+    Args:
+        images (list): File objects.
+        fingerprint (tuple, optional): Size, modification time and inode of 
+            the file that the images were read from.
+        shared (bool): Whether the file objects are shared by readers.
+    """
+
+    def __init__(self, images, fingerprint=None, shared=False):
+        self.images = images
+        self.fingerprint = fingerprint
+        self.shared = shared
+        self.indexes = {}
+
+    def copies(self, images=None):
+        """The files, or the given ones of them, to hand out."""
+        if images is None:
+            images = self.images
+        if self.shared:
+            return [i.copy() for i in images]
+        return list(images)
+
+    def first(self, field, value):
+        """The first file for which the field has this value, or None."""
+        positions = self._index(field).get(value)
+        if positions:
+            return self.copies([self.images[positions[0]]])[0]
+
+    def withValues(self, field, values):
+        """Files for which the field has any of these values, or for list 
+        fields, contains any of them, in the order in which they are stored."""
+        return self.copies(self.matching(field, values))
+
+    def matching(self, field, values):
+        """Like withValues(), but the files themselves, not copies."""
+        index = self._index(field)
+        positions = set()
+        for value in values:
+            positions.update(index.get(value, ()))
+        return [self.images[p] for p in sorted(positions)]
+
+    def _index(self, field):
+        if field not in self.indexes:
+            index = {}
+            for p, image in enumerate(self.images):
+                if field == 'location':
+                    values = [image.location.toString()]
+                else:
+                    values = image.provenance.get(field)
+                    if not isinstance(values, list):
+                        values = [values]
+                for value in values:
+                    try:
+                        index.setdefault(value, []).append(p)
+                    except TypeError:
+                        pass
+            self.indexes[field] = index
+        return self.indexes[field]
@@ -16,6 +16,9 @@ class FileMedium(object):
         else:
             fname = 'provenance_{0}.{1}'.format(self.clock.getNowString(),
                                                 form.fileExtension)
-            self.filesys.write(fname, formattedProvenance)
+            if isinstance(formattedProvenance, basestring):
+                self.filesys.write(fname, formattedProvenance)
+            else:
+                self.filesys.writeChunks(fname, formattedProvenance)
         self.listener.exportedToFile(fname)
         return fname
@@ -1,15 +1,168 @@
-import pymongo, copy, bson
+import pymongo, pymongo.monitoring, bson, os, threading
 from niprov.dependencies import Dependencies
+from niprov.streaming import BATCHSIZE, sortOrder, lastPerLocation
+from niprov.versioning import takeDeltas, restoreVersions
+from niprov.filtering import toMongo
+from niprov.tallying import Tally, FIELDS, TOTAL
+
+
+NOSNAPSHOT = {'_snapshot-data':False}
+"""Projection for queries of which the results are listed, for which 
+snapshot pictures are not needed."""
+
+SEARCHFIELDS = ['location','user','subject','project','protocol',
+                'transformation','technique','modality']
+
+INDEXES = [
+    ('location', [('location', pymongo.ASCENDING)], {'unique':True}),
+    ('id', [('id', pymongo.ASCENDING)], {'unique':True,
+        'partialFilterExpression':{'id':{'$exists':True}}}),
+    ('seriesuid', [('seriesuid', pymongo.ASCENDING)], {}),
+    ('hash', [('hash', pymongo.ASCENDING)], {}),
+    ('hash-sample', [('hash-sample', pymongo.ASCENDING)], {}),
+    ('parents', [('parents', pymongo.ASCENDING)], {}),
+    ('added', [('added', pymongo.DESCENDING)], {}),
+    ('subject', [('subject', pymongo.ASCENDING)], {}),
+    ('project', [('project', pymongo.ASCENDING)], {}),
+    ('modality', [('modality', pymongo.ASCENDING)], {}),
+    ('approval', [('approval', pymongo.ASCENDING)], {}),
+    ('user', [('user', pymongo.ASCENDING)], {}),
+    ('textsearch', [(f, pymongo.TEXT) for f in SEARCHFIELDS], {}),
+]
+"""Indexes on the provenance collection, as tuples of name, keys and 
+options."""
+
+VERSION_INDEXES = [
+    ('location', [('location', pymongo.ASCENDING), 
+        ('_id', pymongo.DESCENDING)], {}),
+]
+"""Indexes on the versions collection, in which the differences between 
+versions of files are kept."""
+
+STATISTICS_INDEXES = [
+    ('tally', [('facet', pymongo.ASCENDING), ('value', pymongo.ASCENDING)], 
+        {'unique':True}),
+]
+"""Indexes on the statistics collection, in which the tallies of 
+:py:mod:`niprov.tallying` are kept."""
+
+TALLIED = {f:True for f in FIELDS}
+"""Projection of the fields that the tallies depend on."""
+
+_ENSURED = set()
+_TALLIED = set()
+_CLIENTS = {}
+_CLIENTSLOCK = threading.Lock()
+
+
+def connect(config):
+    """Get the client for the MongoDB database in the configuration.
+
+    Clients are shared within a process, one for each database url, so that 
+    their pool of connections is reused by all repositories. The size of the 
+    pool is set with the 'database_pool_size' and 'database_pool_min' 
+    settings. A process started with fork gets its own client, since clients 
+    can not be used across processes.
+
+    Args:
+        config (:class:`.Configuration`): Settings with the database url.
+
+    Returns:
+        pymongo.MongoClient: Client for the database.
+    """
+    pid = os.getpid()
+    key = (config.database_url, pid)
+    with _CLIENTSLOCK:
+        if key not in _CLIENTS:
+            for other in [k for k in _CLIENTS if k[1] != pid]:
+                del _CLIENTS[other]
+            counter = _PoolCounter()
+            client = pymongo.MongoClient(config.database_url, 
+                maxPoolSize=config.database_pool_size, 
+                minPoolSize=config.database_pool_min, 
+                event_listeners=[counter], connect=False)
+            _CLIENTS[key] = (client, counter)
+        return _CLIENTS[key][0]
+
+
+def poolStatistics():
+    """Use of the connection pools of the clients in this process.
+
+    Returns:
+        dict: For each database url, the number of connections that are 
+            'open' and 'in-use', and the total numbers 'created', 
+            'checked-out' and 'failed' to check out.
+    """
+    pid = os.getpid()
+    with _CLIENTSLOCK:
+        return {url: counter.statistics() for (url, p), (client, counter) 
+            in _CLIENTS.items() if p == pid}
+
+
+class _PoolCounter(getattr(pymongo.monitoring, 'ConnectionPoolListener', 
+        object)):
+    """Counts connection pool events of a client."""
+
+    def __init__(self):
+        self.counts = {'created':0, 'closed':0, 'checked-out':0, 
+            'checked-in':0, 'failed':0}
+
+    def statistics(self):
+        counts = dict(self.counts)
+        counts['open'] = counts['created'] - counts['closed']
+        counts['in-use'] = counts['checked-out'] - counts['checked-in']
+        return counts
+
+    def connection_created(self, event):
+        self.counts['created'] += 1
+
+    def connection_closed(self, event):
+        self.counts['closed'] += 1
+
+    def connection_checked_out(self, event):
+        self.counts['checked-out'] += 1
+
+    def connection_checked_in(self, event):
+        self.counts['checked-in'] += 1
+
+    def connection_check_out_failed(self, event):
+        self.counts['failed'] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
 
 
 class MongoRepository(object):
+    """Stores provenance in a MongoDB database.
+
+    Provenance is kept in the 'provenance' collection, and previous versions
+    of files in the 'versions' collection, as the differences between 
+    versions. The 'statistics' collection has a document with the count and 
+    total size of files for each tally, which writes increment. It is filled
+    in when first used in a process if it is empty, and again by reindex().
+    The 'revision' collection counts writes.
+    """
 
     def __init__(self, dependencies=Dependencies()):
         self.config = dependencies.getConfiguration()
         self.factory = dependencies.getFileFactory()
         self.pictures = dependencies.getPictureCache()
-        client = pymongo.MongoClient(self.config.database_url)
-        self.db = client.get_default_database()
+        self.listener = dependencies.getListener()
+        self.db = connect(self.config).get_default_database()
+        if self.config.database_url not in _ENSURED:
+            self.ensureIndexes()
 
     def byLocation(self, locationString):
         """Get the provenance for a file at the given location. 
@@ -30,6 +183,10 @@ class MongoRepository(object):
         records = self.db.provenance.find({'location':{'$in':listOfLocations}})
         return [self.inflate(record) for record in records]
 
+    def byFieldValues(self, fieldName, listOfValues):
+        records = self.db.provenance.find({fieldName:{'$in':listOfValues}})
+        return [self.inflate(record) for record in records]
+
     def getSeries(self, image):
         """Get the object that carries provenance for the series that the image 
         passed is in. 
@@ -53,7 +210,25 @@ class MongoRepository(object):
         Args:
             image (:class:`.BaseFile`): Image file to store.
         """
+        self._ensureTallies()
         self.db.provenance.insert_one(self.deflate(image))
+        self._keepVersions([image])
+        self._tallySaved([image])
+        self._revise()
+
+    def addMany(self, images):
+        """Add the provenance for several files to storage at once.
+
+        Args:
+            images (list): List of :class:`.BaseFile` objects to store.
+        """
+        images = lastPerLocation(images)
+        if images:
+            self._ensureTallies()
+            self.db.provenance.insert_many([self.deflate(i) for i in images])
+            self._keepVersions(images)
+            self._tallySaved(images)
+            self._revise()
 
     def update(self, image):
         """Save changed provenance for this file..
@@ -61,73 +236,381 @@ class MongoRepository(object):
         Args:
             image (:class:`.BaseFile`): Image file that has changed.
         """
-        self.db.provenance.update({'location':image.location.toString()}, 
-            self.deflate(image))
+        self._ensureTallies()
+        previous = self._previous([image])
+        [(location, record)] = self._replacements([image])
+        self.db.provenance.update({'location':location}, record)
+        self._keepVersions([image])
+        self._tallySaved([image], previous)
+        self._revise()
+
+    def updateMany(self, images):
+        """Save changed provenance for several files at once.
+
+        Args:
+            images (list): List of :class:`.BaseFile` objects that have changed.
+        """
+        images = lastPerLocation(images)
+        if images:
+            self._ensureTallies()
+            previous = self._previous(images)
+            self.db.provenance.bulk_write([pymongo.ReplaceOne(
+                {'location':location}, record) 
+                for location, record in self._replacements(images)])
+            self._keepVersions(images)
+            self._tallySaved(images, previous)
+            self._revise()
+
+    def extendSeries(self, extensions):
+        """Save files that were merged into known series.
+
+        Args:
+            extensions (list): Tuples of a series object and the list of 
+                paths that were added to its 'filesInSeries'.
+
+        Instead of replacing the series document, the new paths are appended 
+        to it, and the dimensions are set.
+        """
+        updates = []
+        for series, newFiles in extensions:
+            change = {'$push':{'filesInSeries':{'$each':newFiles}}}
+            if 'dimensions' in series.provenance:
+                change['$set'] = {'dimensions':series.provenance['dimensions']}
+            updates.append(pymongo.UpdateOne(
+                {'location':series.location.toString()}, change))
+        if updates:
+            self.db.provenance.bulk_write(updates)
+            self._revise()
 
     def updateApproval(self, locationString, approvalStatus):
         self.db.provenance.update({'location':locationString}, 
             {'$set': {'approval': approvalStatus}})
+        self._revise()
 
     def all(self):
         """Retrieve all known provenance from storage.
 
+        Snapshot pictures are not retrieved. 
+
         Returns:
             list: List of provenance for known files.
         """
-        records = self.db.provenance.find()
-        return [self.inflate(record) for record in records]
+        records = self.db.provenance.find(projection=NOSNAPSHOT)
+        return self.inflateRecords(records)
+
+    def iterAll(self, batchsize=BATCHSIZE, projection=None, sort=None):
+        """Go through all known provenance, with a cursor that fetches 
+        records from the database a batch at a time.
+
+        Snapshot pictures are not retrieved. 
+
+        Args:
+            batchsize (int): Number of records fetched from storage at once.
+            projection (list, optional): Names of the provenance fields to 
+                retrieve. The location is always retrieved. Defaults to all 
+                fields.
+            sort (str, optional): Field to sort on, prefixed with a '-' for 
+                descending order.
+
+        Returns:
+            generator: :class:`.BaseFile` objects for known files.
+        """
+        fields = NOSNAPSHOT
+        if projection is not None:
+            fields = {f:True for f in list(projection) + ['location']}
+        records = self.db.provenance.find(projection=fields, 
+            batch_size=batchsize)
+        if sort is not None:
+            field, descending = sortOrder(sort)
+            records = records.sort(field, 
+                pymongo.DESCENDING if descending else pymongo.ASCENDING)
+        return (self.factory.recordFromProvenance(r) for r in records)
 
     def latest(self):
-        records = self.db.provenance.find().sort('added', -1).limit(20)
-        return [self.inflate(record) for record in records]
+        records = self.db.provenance.find(projection=NOSNAPSHOT).sort(
+            'added', -1).limit(20)
+        return self.inflateRecords(records)
 
     def statistics(self):
-        grps = self.db.provenance.aggregate(
-           [{'$group':
-                 {
-                   '_id': None,
-                   'totalsize': { '$sum': '$size' },
-                   'count': { '$sum': 1 }
-                 }
-            }])
-        groups = list(grps)
-        if len(list(groups)) == 0:
-            return {'count':0}
-        return list(groups)[0]
+        """Number of files and their total size.
+
+        Returns:
+            dict: With 'count' and 'totalsize'.
+        """
+        self._ensureTallies()
+        doc = self.db.statistics.find_one({'facet':TOTAL[0], 
+            'value':TOTAL[1]}) or {}
+        return {'count':doc.get('count', 0), 
+                'totalsize':doc.get('totalsize', 0)}
+
+    def facet(self, field):
+        """Number of files and their total size for each value of a field.
+
+        Args:
+            field (str): One of the :py:data:`.FACETS`, or 'acquired' for 
+                the number of files acquired on each day.
+
+        Returns:
+            dict: For each value a dict with 'count' and 'totalsize'.
+        """
+        self._ensureTallies()
+        docs = self.db.statistics.find({'facet':field})
+        return {d['value']:{'count':d['count'], 'totalsize':d['totalsize']} 
+            for d in docs}
 
     def byId(self, uid):
         record = self.db.provenance.find_one({'id':uid})
         return self.inflate(record)
 
+    def revision(self):
+        """Number of writes to the provenance collection, counted in the 
+        'revision' collection.
+
+        Returns:
+            int: Revision of the contents of storage.
+        """
+        doc = self.db.revision.find_one({'_id':'revision'})
+        if doc is None:
+            return 0
+        return doc['number']
+
     def byParents(self, listOfParentLocations):
         records = self.db.provenance.find({'parents':{
-            '$in':listOfParentLocations}})
-        return [self.inflate(record) for record in records]
+            '$in':listOfParentLocations}}, projection=NOSNAPSHOT)
+        return self.inflateRecords(records)
 
     def inquire(self, query):
-        field = query.getFields()[0]
-        if field.all:
-            records = self.db.provenance.distinct(field.name)
-            return records
-        else:
-            records = self.db.provenance.find({field.name:field.value})
-            return [self.inflate(record) for record in records]
-
-    def search(self, text):
-        searchfields = ['location','user','subject','project','protocol',
-                  'transformation','technique','modality']
-        indexspec = [(field, pymongo.TEXT) for field in searchfields]
-        self.db.provenance.create_index(indexspec, name='textsearch')
-        records = self.db.provenance.find({'$text':{'$search': text}})
-        return [self.inflate(record) for record in records]
+        """Files that match a query, or the values of a field asked for.
+
+        Args:
+            query (:class:`.Query`): Conditions, sort order and range.
+
+        Returns:
+            list: Matching files, or distinct values of a field.
+        """
+        mongoFilter = toMongo(query.getFilter())
+        distinct = query.getDistinct()
+        if distinct is not None:
+            return self.db.provenance.distinct(distinct, mongoFilter)
+        cursor = self.db.provenance.find(mongoFilter, projection=NOSNAPSHOT)
+        if query.getSort() is not None:
+            field, descending = sortOrder(query.getSort())
+            cursor = cursor.sort(field, 
+                pymongo.DESCENDING if descending else pymongo.ASCENDING)
+        if query.getOffset():
+            cursor = cursor.skip(query.getOffset())
+        if query.getLimit() is not None:
+            cursor = cursor.limit(query.getLimit())
+        return self.inflateRecords(cursor)
+
+    def count(self, query):
+        """Number of files that match a query, counted by the server.
+
+        Args:
+            query (:class:`.Query`): Conditions to match.
+
+        Returns:
+            int: Number of files.
+        """
+        return self.db.provenance.count_documents(
+            toMongo(query.getFilter()))
+
+    def search(self, text, n=20, start=0):
+        """Files with the given words, using the text index of the server, 
+        best match first.
+
+        Args:
+            text (str): Words to look for.
+            n (int): Maximum number of files returned.
+            start (int): Number of better matching files to skip.
+
+        Returns:
+            list: Matching files.
+        """
+        projection = dict(NOSNAPSHOT, _score={'$meta':'textScore'})
+        records = self.db.provenance.find({'$text':{'$search': text}}, 
+            projection=projection).sort([('_score', {'$meta':'textScore'})])
+        records = records.skip(start).limit(n)
+        return self.inflateRecords([_withoutScore(r) for r in records])
+
+    def versionsOf(self, image):
+        """Get the previous versions of a file.
+
+        Args:
+            image (:class:`.BaseFile`): File for which to get the versions.
+
+        Returns:
+            list: Provenance of the previous versions, oldest first.
+        """
+        docs = self.db.versions.find({'location':image.location.toString()}, 
+            projection={'delta':True}).sort('_id', pymongo.DESCENDING)
+        return restoreVersions(image.provenance, [d['delta'] for d in docs])
+
+    def pruneVersions(self):
+        """Remove the oldest versions of files beyond the number set with 
+        the 'versions_kept' setting.
+
+        Returns:
+            int: Number of versions removed.
+        """
+        if not self.config.versions_kept:
+            return 0
+        return self._pruneVersionsOf(self.db.versions.distinct('location'))
+
+    def ensureIndexes(self):
+        """Create the indexes in :py:data:`INDEXES` and 
+        :py:data:`VERSION_INDEXES` that the collections do not have yet.
+
+        This is done when the first connection to a database is made in a 
+        process. If an index can not be created, for instance because a 
+        location occurs twice, the listener is informed.
+
+        Returns:
+            list: Names of the indexes created.
+        """
+        created = self._ensure(self.db.provenance, INDEXES, '')
+        created += self._ensure(self.db.versions, VERSION_INDEXES, 'versions.')
+        created += self._ensure(self.db.statistics, STATISTICS_INDEXES, 
+            'statistics.')
+        _ENSURED.add(self.config.database_url)
+        return created
+
+    def _ensure(self, collection, indexes, prefix):
+        existing = collection.index_information()
+        created = []
+        for name, keys, options in indexes:
+            if name in existing:
+                continue
+            try:
+                collection.create_index(keys, name=name, **options)
+                created.append(prefix + name)
+            except pymongo.errors.PyMongoError as e:
+                self.listener.indexFailed(prefix + name, e)
+        return created
+
+    def _keepVersions(self, images):
+        """Store the differences with the versions that the images replace."""
+        docs = [{'location':i.location.toString(), 'delta':d} 
+            for i in images for d in takeDeltas(i)]
+        if not docs:
+            return
+        self.db.versions.insert_many(docs)
+        if self.config.versions_kept:
+            self._pruneVersionsOf(set([d['location'] for d in docs]))
+
+    def _revise(self):
+        self.db.revision.update_one({'_id':'revision'}, 
+            {'$inc':{'number':1}}, upsert=True)
+
+    def _replacements(self, images):
+        """Locations and documents to replace the stored ones with. Files of
+        which the picture is no longer cached get the stored snapshot, so 
+        that replacing the document keeps it."""
+        replacements = [(i.location.toString(), self.deflate(i)) 
+            for i in images]
+        missing = [l for l, r in replacements if '_snapshot-data' not in r]
+        if missing:
+            stored = self.db.provenance.find({'location':{'$in':missing},
+                '_snapshot-data':{'$exists':True}}, 
+                projection=['location', '_snapshot-data'])
+            snapshots = {d['location']:d['_snapshot-data'] for d in stored}
+            for location, record in replacements:
+                if location in snapshots:
+                    record['_snapshot-data'] = snapshots[location]
+        return replacements
+
+    def _previous(self, images):
+        """The fields that the tallies depend on, as stored for the files 
+        before they are replaced."""
+        return list(self.db.provenance.find({'location':{'$in':
+            [i.location.toString() for i in images]}}, projection=TALLIED))
+
+    def _tallySaved(self, images, previous=()):
+        """Increment the tallies for saved files, and decrement them for 
+        the provenance these replaced. The tallies must have been counted 
+        before the files were saved, see :py:meth:`_ensureTallies`."""
+        changes = Tally()
+        for record in previous:
+            changes.add(record, -1)
+        for image in images:
+            changes.add(image.provenance)
+        increments = [pymongo.UpdateOne({'facet':f, 'value':v}, 
+            {'$inc':{'count':c, 'totalsize':s}}, upsert=True) 
+            for f, v, c, s in changes.items() if c or s]
+        if increments:
+            self.db.statistics.bulk_write(increments, ordered=False)
+        if previous:
+            self.db.statistics.delete_many({'count':{'$lte':0}, 
+                'facet':{'$ne':TOTAL[0]}})
+
+    def _ensureTallies(self):
+        """Count the tallies if this has not been done for the database."""
+        if self.config.database_url in _TALLIED:
+            return
+        if self.db.statistics.find_one({'facet':TOTAL[0], 
+                'value':TOTAL[1]}) is None:
+            self._countTallies()
+        _TALLIED.add(self.config.database_url)
+
+    def _countTallies(self):
+        """Fill the statistics collection anew from the provenance."""
+        tally = Tally()
+        for record in self.db.provenance.find(projection=TALLIED, 
+                batch_size=BATCHSIZE):
+            tally.add(record)
+        self.db.statistics.delete_many({})
+        self.db.statistics.insert_many([{'facet':f, 'value':v, 'count':c, 
+            'totalsize':s} for f, v, c, s in tally.items()])
+
+    def _pruneVersionsOf(self, locations):
+        kept = self.config.versions_kept
+        nremoved = 0
+        for location in locations:
+            old = self.db.versions.find({'location':location}, 
+                projection={'_id':True}).sort('_id', 
+                pymongo.DESCENDING).skip(kept)
+            ids = [d['_id'] for d in old]
+            if ids:
+                self.db.versions.delete_many({'_id':{'$in':ids}})
+                nremoved += len(ids)
+        return nremoved
+
+    def reindex(self):
+        """Drop and recreate the indexes in :py:data:`INDEXES`, 
+        :py:data:`VERSION_INDEXES` and :py:data:`STATISTICS_INDEXES`, and 
+        count the tallies again.
+
+        Returns:
+            list: Names of the indexes created.
+        """
+        for collection, indexes in [(self.db.provenance, INDEXES), 
+                (self.db.versions, VERSION_INDEXES),
+                (self.db.statistics, STATISTICS_INDEXES)]:
+            existing = collection.index_information()
+            for name, keys, options in indexes:
+                if name in existing:
+                    collection.drop_index(name)
+        self._countTallies()
+        _TALLIED.add(self.config.database_url)
+        return self.ensureIndexes()
 
     def deflate(self, img):
-        record = copy.deepcopy(img.provenance)
+        """The document to store for the file.
+
+        This is a shallow copy of the provenance, as pymongo adds the '_id' 
+        to inserted documents, with the snapshot picture if there is one.
+        """
+        record = dict(img.provenance)
         snapshotData = self.pictures.getBytes(for_=img)
         if snapshotData:
             record['_snapshot-data'] = bson.Binary(snapshotData)
         return record
 
+    def inflateRecords(self, records):
+        """Lightweight :class:`.Record` objects for records listed without 
+        snapshot."""
+        return [self.factory.recordFromProvenance(r) for r in records]
+
     def inflate(self, record):
         if record is None:
             return None
@@ -136,3 +619,7 @@ class MongoRepository(object):
             self.pictures.keep(record['_snapshot-data'], for_=img)
         return img
 
+
+def _withoutScore(record):
+    record.pop('_score', None)
+    return record
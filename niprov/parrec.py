@@ -44,7 +44,7 @@ class ParrecFile(BaseFile):
             provenance['modality'] = 'DWI'
         else:
             provenance['modality'] = 'MRI'
-        self.camera.saveSnapshot(img.get_data(), for_=self)
+        self.camera.saveSnapshot(img.dataobj, for_=self)
         return provenance
 
     def getProtocolFields(self):
@@ -1,14 +1,95 @@
 from niprov.format import Format
-import io, os
+from collections import OrderedDict
+import io, os, threading
+
+SNAPSHOTDIR = '~/.niprov-snapshots'
+MEGABYTE = 1024*1024
+
+
+class LruCache(object):
+    """Keeps values up to a total size in bytes, removing the least recently
+    used values first.
+
+    Args:
+        maxbytes (int): Maximum total size of the values kept.
+    """
+
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.items = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self.items[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            if key in self.items:
+                self.nbytes -= len(self.items.pop(key))
+            if len(value) > self.maxbytes:
+                return
+            self.items[key] = value
+            self.nbytes += len(value)
+            while self.nbytes > self.maxbytes:
+                oldkey, oldvalue = self.items.popitem(last=False)
+                self.nbytes -= len(oldvalue)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all values and reset the statistics."""
+        with self.lock:
+            self.items.clear()
+            self.nbytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def statistics(self):
+        return {'count':len(self.items), 'bytes':self.nbytes,
+            'maxbytes':self.maxbytes, 'hits':self.hits, 'misses':self.misses,
+            'evictions':self.evictions}
+
+
+_CACHE = LruCache(64*MEGABYTE)
+_MEMORY = {'configured':False}
+_DISK = {'bytes':None, 'evictions':0}
+_DISKLOCK = threading.Lock()
 
-_CACHE = {}
 
 class PictureCache(Format):
+    """Keeps snapshot pictures of images.
+
+    Pictures are kept in memory in a cache that is shared within the process,
+    up to 'picture_cache_memory' megabytes, and are written to the
+    ~/.niprov-snapshots directory, up to 'picture_cache_disk' megabytes.
+    In both cases, the least recently used pictures are removed first.
+    Pictures that are not in memory are read from disk. The size of the 
+    memory cache is set from the configuration of the first PictureCache 
+    in the process.
+    """
 
     def __init__(self, dependencies):
-        cachedir = os.path.expanduser('~/.niprov-snapshots')
-        if not os.path.isdir(cachedir):
-            os.mkdir(cachedir)
+        config = dependencies.getConfiguration()
+        with _CACHE.lock:
+            if not _MEMORY['configured']:
+                _CACHE.maxbytes = config.picture_cache_memory * MEGABYTE
+                _MEMORY['configured'] = True
+        self.maxdiskbytes = config.picture_cache_disk * MEGABYTE
+        self.cachedir = os.path.expanduser(SNAPSHOTDIR)
+        if not os.path.isdir(self.cachedir):
+            os.mkdir(self.cachedir)
 
     def new(self):
         return io.BytesIO()
@@ -20,33 +101,81 @@ class PictureCache(Format):
             bytes = picture.read()
         else:
             bytes = str(picture)
-        _CACHE[imgId] = bytes
+        _CACHE.put(imgId, bytes)
 
     def getBytes(self, for_):
         imgId = for_.provenance['id']
-        if imgId in _CACHE:
-            return _CACHE[imgId]
-        return None
+        bytes = _CACHE.get(imgId)
+        if bytes is None:
+            fpath = self._filepath(imgId)
+            if os.path.isfile(fpath):
+                with open(fpath, 'rb') as picfile:
+                    bytes = picfile.read()
+                _CACHE.put(imgId, bytes)
+        return bytes
 
     def getFilepath(self, for_):
         return self.saveToDisk(for_)
 
     def saveToDisk(self, for_):
         imgId = for_.provenance['id']
-        fpath = os.path.expanduser('~/.niprov-snapshots/{}.png'.format(imgId))
+        fpath = self._filepath(imgId)
         if os.path.isfile(fpath):
+            if self.maxdiskbytes:
+                os.utime(fpath, None)
             return fpath
-        elif imgId in _CACHE:
-            with open(fpath, 'w') as picfile:
-                picfile.write(_CACHE[imgId])
-            return fpath
-        else:
+        bytes = _CACHE.get(imgId)
+        if bytes is None:
             return None
+        with open(fpath, 'wb') as picfile:
+            picfile.write(bytes)
+        if self.maxdiskbytes:
+            self._limitDiskUsage(len(bytes))
+        return fpath
+
+    def statistics(self):
+        """Size and use of the memory and disk caches.
+
+        Returns:
+            dict: 'memory' has the number of pictures, bytes, hits, misses and
+                evictions of the memory cache. 'disk' has the bytes and
+                evictions on disk, where bytes is None if the size of the
+                directory has not been determined yet.
+        """
+        return {'memory':_CACHE.statistics(), 'disk':{'bytes':_DISK['bytes'],
+            'maxbytes':self.maxdiskbytes, 'evictions':_DISK['evictions']}}
 
     def serializeSingle(self, image):
         """Provides file path to picture of image.
 
-        This is part of the :class:`.Format` interface. 
+        This is part of the :class:`.Format` interface.
         """
         return self.getFilepath(for_=image)
 
+    def _filepath(self, imgId):
+        return os.path.join(self.cachedir, '{}.png'.format(imgId))
+
+    def _limitDiskUsage(self, nbytesAdded):
+        with _DISKLOCK:
+            if _DISK['bytes'] is None:
+                _DISK['bytes'] = sum([f[1] for f in self._filesOnDisk()])
+            else:
+                _DISK['bytes'] += nbytesAdded
+            if _DISK['bytes'] <= self.maxdiskbytes:
+                return
+            for fpath, size, mtime in sorted(self._filesOnDisk(),
+                    key=lambda f: f[2]):
+                if _DISK['bytes'] <= self.maxdiskbytes * 0.9:
+                    break
+                os.remove(fpath)
+                _DISK['bytes'] -= size
+                _DISK['evictions'] += 1
+
+    def _filesOnDisk(self):
+        files = []
+        for fname in os.listdir(self.cachedir):
+            fpath = os.path.join(self.cachedir, fname)
+            stat = os.stat(fpath)
+            files.append((fpath, stat.st_size, stat.st_mtime))
+        return files
+
@@ -2,20 +2,56 @@ import os
 
 
 class Pipeline(object):
+    """Files related by their 'parents' field, as a tree of locations.
+
+    The roots are the files that have none of their parents among the files.
+    A file with several parents is in the tree under each of them, and a
+    parent that is also a descendant of the file is left out, so that the
+    tree ends where the parents form a cycle.
+
+    Args:
+        files (list): :class:`.BaseFile` objects in the pipeline.
+    """
 
     def __init__(self, files):
         self.files = files
-        self.roots = set([f for f in files if f.parents == []])
-        def locationBranchRecurse(image):
-            branch = {}
-            loc = image.location.toString()
-            children = [f for f in files if loc in f.parents]
-            for child in children:
-                branch[child.location.toString()] = locationBranchRecurse(child)
-            return branch
+        locations = set([f.location.toString() for f in files])
+        children = {}
+        for f in files:
+            for parent in set(f.parents):
+                if parent in locations:
+                    children.setdefault(parent, []).append(f)
+        self.roots = set([f for f in files
+            if not [p for p in f.parents if p in locations]])
         self.locationTree = {}
         for f in self.roots:
-            self.locationTree[f.location.toString()] = locationBranchRecurse(f)
+            loc = f.location.toString()
+            self.locationTree[loc] = {}
+            self._growBranch(loc, self.locationTree[loc], children)
+
+    def _growBranch(self, loc, branch, children):
+        """Fill in the descendants of the file at loc.
+
+        The tree is walked with a stack rather than recursion, so that long 
+        chains of files do not reach the recursion limit, and the locations
+        on the path from the root are kept in one set, to which each file is
+        added on the way down and from which it is removed on the way up.
+        """
+        ancestors = set([loc])
+        stack = [(loc, branch, iter(children.get(loc, [])))]
+        while stack:
+            loc, branch, remaining = stack[-1]
+            child = next(remaining, None)
+            if child is None:
+                stack.pop()
+                ancestors.remove(loc)
+                continue
+            childLoc = child.location.toString()
+            if childLoc not in ancestors:
+                branch[childLoc] = {}
+                ancestors.add(childLoc)
+                stack.append((childLoc, branch[childLoc], 
+                    iter(children.get(childLoc, []))))
 
     def asFilenameTree(self):
         def toFilenameTree(d):
@@ -1,31 +1,243 @@
 from niprov.dependencies import Dependencies
 from niprov.pipeline import Pipeline
 
+FANOUT = 20
+"""Number of relatives of a file shown in a neighbourhood before the rest 
+are collapsed into a group."""
+
+NODEFIELDS = ['id', 'path', 'hostname', 'transformation', 'added', 'size']
+"""Provenance fields of the files in a neighbourhood."""
+
 
 class PipelineFactory(object):
 
     def __init__(self, dependencies=Dependencies()):
         self.files = dependencies.getRepository()
 
-    def forFile(self, image):
+    def forFile(self, image, depth=None):
         """Create a Pipeline object based on known files 'parents' field.
+
+        Ancestors and descendants are looked up a generation at a time, with
+        one repository call per generation in each direction. Files that
+        were found already are not looked up again, so that parents that
+        refer back to a descendant do not lead to endless lookups.
+
+        Args:
+            image (:class:`.BaseFile`): File for which to make the pipeline.
+            depth (int, optional): Number of generations to follow in each
+                direction. Defaults to all.
+
+        Returns:
+            :class:`.Pipeline`: The file and its relatives.
         """
         filesByLocation = {image.location.toString():image}
-
-        def lookupRelativesRecursive(images, relationToLookFor):
-            if relationToLookFor is 'parents':
-                parentLocations = set()
-                for image in images:
-                    parentLocations.update(image.provenance.get('parents',[]))
-                relatives = self.files.byLocations(list(parentLocations))
-            elif relationToLookFor is 'children':
-                thisGenerationLocations = [i.location.toString() for i in images]
-                relatives = self.files.byParents(thisGenerationLocations)
-            for relative in relatives:
-                filesByLocation[relative.location.toString()] = relative
-            if relatives:
-                lookupRelativesRecursive(relatives, relationToLookFor)
-
-        lookupRelativesRecursive([image], 'parents')
-        lookupRelativesRecursive([image], 'children')
+        self._walk(image, filesByLocation, depth, self._parentsOf)
+        self._walk(image, filesByLocation, depth, self._childrenOf)
         return Pipeline(filesByLocation.values())
+
+    def neighbourhood(self, image, depth=1, fanout=FANOUT, 
+            transformation=None, start=0):
+        """The part of the pipeline of a file around it, for drawing.
+
+        Parents and children are followed for at most depth generations. 
+        Children of a file that share a transformation are collapsed into a 
+        group, and relatives beyond the first fanout into one more group, 
+        so that the size of the result does not depend on the size of the 
+        pipeline. Only the relatives of the file in the center are complete;
+        other files are expanded by asking for their own neighbourhood, and 
+        groups by asking for that of their parent with the transformation 
+        and start of the group.
+
+        Args:
+            image (:class:`.BaseFile`): File in the center.
+            depth (int): Number of generations to follow in each direction.
+            fanout (int): Maximum number of relatives shown for a file, 
+                at least 1.
+            transformation (str, optional): Only list the children of the 
+                file with this transformation, '' for those without one.
+            start (int): Number of children, or of groups and children, to 
+                skip. If this or the transformation is given, only children 
+                of the file in the center are listed.
+
+        Returns:
+            dict: With the 'center' location, a list of 'nodes' and a list 
+                of 'links'. Nodes have a 'key', and their 'generation' 
+                relative to the center, negative for ancestors. Files have 
+                their 'location' and :py:data:`NODEFIELDS`, groups their 
+                'group', which is 'transformation' or 'more', 'parent' 
+                location and 'parentid', 'transformation', 'count' of files 
+                and 'start'. Links have the 'source' and 'target' key.
+        """
+        hood = _Neighbourhood(image, fanout)
+        if transformation is not None or start:
+            children = self._childrenOf([image], hood.keys)
+            if transformation is not None:
+                children = [c for c in children 
+                    if _transformationOf(c) == transformation]
+            hood.addChildren([image], children, 1, transformation, start)
+            return hood.asDict()
+        generation = [image]
+        for n in range(depth):
+            if not generation:
+                break
+            generation = hood.addParents(generation, 
+                self._parentsOf(generation, hood.keys), -n-1)
+        generation = [image]
+        for n in range(depth):
+            if not generation:
+                break
+            generation = hood.addChildren(generation, 
+                self._childrenOf(generation, hood.keys), n+1)
+        return hood.asDict()
+
+    def _walk(self, image, filesByLocation, depth, relativesOf):
+        """Add the relatives of the image to filesByLocation, breadth-first."""
+        generation = [image]
+        ngenerations = 0
+        while generation and (depth is None or ngenerations < depth):
+            newRelatives = []
+            for relative in relativesOf(generation, filesByLocation):
+                location = relative.location.toString()
+                if location not in filesByLocation:
+                    filesByLocation[location] = relative
+                    newRelatives.append(relative)
+            generation = newRelatives
+            ngenerations += 1
+
+    def _parentsOf(self, images, known):
+        parentLocations = set()
+        for image in images:
+            parentLocations.update(image.provenance.get('parents', []))
+        missing = sorted([l for l in parentLocations if l not in known])
+        if not missing:
+            return []
+        return self.files.byLocations(missing)
+
+    def _childrenOf(self, images, known):
+        return self.files.byParents([i.location.toString() for i in images])
+
+
+class _Neighbourhood(object):
+    """Nodes and links of a neighbourhood, see 
+    :py:meth:`PipelineFactory.neighbourhood`."""
+
+    def __init__(self, image, fanout):
+        self.center = image.location.toString()
+        self.fanout = max(1, fanout)
+        self.nodes = []
+        self.links = []
+        self.keys = set()
+        self._addFile(image, 0)
+
+    def asDict(self):
+        return {'center':self.center, 'nodes':self.nodes, 'links':self.links}
+
+    def addParents(self, generation, parents, number):
+        """Add the parents of the files in a generation, up to fanout for 
+        each file.
+
+        Returns:
+            list: The parents added.
+        """
+        parentsByLocation = {p.location.toString():p for p in parents}
+        added = []
+        for child in generation:
+            childKey = child.location.toString()
+            locations = [l for l in _unique(child.parents) 
+                if l in parentsByLocation or l in self.keys]
+            for location in locations[:self.fanout]:
+                if location not in self.keys:
+                    self._addFile(parentsByLocation[location], number)
+                    added.append(parentsByLocation[location])
+                self._link(location, childKey)
+        return added
+
+    def addChildren(self, generation, children, number, transformation=None,
+            start=0):
+        """Add the children of the files in a generation, each under the 
+        first of its parents in the generation.
+
+        Without a transformation, children that share one are collapsed into
+        a group. Past the fanout, the rest is collapsed into a group of 
+        the kind 'more'.
+
+        Returns:
+            list: The children added as files.
+        """
+        parentLocations = [i.location.toString() for i in generation]
+        byParent = {l:[] for l in parentLocations}
+        for child in children:
+            if child.location.toString() in self.keys:
+                continue
+            parents = [p for p in child.parents if p in byParent]
+            if parents:
+                byParent[parents[0]].append(child)
+        added = []
+        for parent in generation:
+            siblings = byParent[parent.location.toString()]
+            if transformation is None:
+                entries = _collapsed(siblings)
+            else:
+                entries = [(transformation, [c]) for c in siblings]
+            shown = entries[start:start+self.fanout]
+            for entryTransformation, members in shown:
+                if len(members) > 1:
+                    self._addGroup(parent, 'transformation', 
+                        entryTransformation, len(members), 0, number)
+                else:
+                    added.append(members[0])
+                    self._addFile(members[0], number)
+                    for other in _unique(members[0].parents):
+                        if other in self.keys:
+                            self._link(other, members[0].location.toString())
+            rest = entries[start+self.fanout:]
+            if rest:
+                self._addGroup(parent, 'more', transformation, 
+                    sum([len(m) for _, m in rest]), start+self.fanout, number)
+        return added
+
+    def _addFile(self, image, number):
+        location = image.location.toString()
+        node = {'key':location, 'location':location, 'generation':number}
+        for field in NODEFIELDS:
+            value = image.provenance.get(field)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            node[field] = value
+        self.nodes.append(node)
+        self.keys.add(location)
+
+    def _addGroup(self, parent, kind, transformation, count, start, number):
+        location = parent.location.toString()
+        key = '{0} {1}:{2}:{3}'.format(kind, location, transformation, start)
+        self.nodes.append({'key':key, 'generation':number, 'group':kind, 
+            'parent':location, 'parentid':parent.provenance.get('id'), 
+            'transformation':transformation, 'count':count, 'start':start})
+        self.keys.add(key)
+        self._link(location, key)
+
+    def _link(self, source, target):
+        self.links.append({'source':source, 'target':target})
+
+
+def _collapsed(siblings):
+    """Siblings grouped by transformation, in the order in which each 
+    transformation first occurs."""
+    groups = {}
+    order = []
+    for sibling in siblings:
+        transformation = _transformationOf(sibling)
+        if transformation not in groups:
+            groups[transformation] = []
+            order.append(transformation)
+        groups[transformation].append(sibling)
+    return [(t, groups[t]) for t in order]
+
+
+def _transformationOf(image):
+    return image.provenance.get('transformation') or ''
+
+
+def _unique(locations):
+    seen = set()
+    return [l for l in locations if not (l in seen or seen.add(l))]
@@ -1,28 +1,48 @@
 from collections import namedtuple
+from niprov.filtering import Condition, Either
+from niprov.tallying import FACETS
 QueryField = namedtuple('QueryField', ['name', 'value', 'all'])
 
 class Query(object):
+    """Files that meet all conditions added with the methods of this object.
+
+    Conditions are combined, so that for instance 
+    ``get().bySubject('x').byModality('MRI')`` finds the MRI files of 
+    subject x. Files are looked up when the results are first used, and 
+    repositories leave as much of the work as they can to their storage.
+    """
 
     def __init__(self, dependencies):
         self.fields = []
+        self.conditions = []
+        self.sort = None
+        self.start = 0
+        self.maximum = None
         self.repository = dependencies.getRepository()
         self.location = dependencies.getLocationFactory()
+        self.hasher = dependencies.getHasher()
         self.cachedResults = None
+        self.confirm = None
 
     def __iter__(self):
-        if self.cachedResults is None:
-            self.cachedResults = self.repository.inquire(self)
-        return self.cachedResults.__iter__()
+        return self._results().__iter__()
 
     def __len__(self):
-        if self.cachedResults is None:
-            self.cachedResults = self.repository.inquire(self)
-        return len(self.cachedResults)
+        return len(self._results())
 
     def __contains__(self, key):
+        return key in self._results()
+
+    def _results(self):
         if self.cachedResults is None:
-            self.cachedResults = self.repository.inquire(self)
-        return key in self.cachedResults
+            if self.getDistinct() in FACETS and not self.getFilter():
+                results = sorted(self.repository.facet(self.getDistinct()))
+            else:
+                results = self.repository.inquire(self)
+            if self.confirm is not None:
+                results = [r for r in results if self.confirm(r)]
+            self.cachedResults = results
+        return self.cachedResults
 
     def _fieldHasValue(self, field, value):
         return QueryField(field, value=value, all=False)
@@ -33,6 +53,43 @@ class Query(object):
     def getFields(self):
         return self.fields
 
+    def getFilter(self):
+        """All conditions of the query.
+
+        Returns:
+            list: :py:data:`.Condition` and :py:data:`.Either` items, which 
+                files have to meet all of.
+        """
+        equal = [Condition(f.name, 'eq', f.value) for f in self.fields 
+            if not f.all]
+        return equal + self.conditions
+
+    def getDistinct(self):
+        """Name of the field of which all values are asked for, or None."""
+        for field in self.fields:
+            if field.all:
+                return field.name
+
+    def getSort(self):
+        return self.sort
+
+    def getOffset(self):
+        return self.start
+
+    def getLimit(self):
+        return self.maximum
+
+    def count(self):
+        """Number of files that match, regardless of limit and offset.
+
+        Files are counted by storage where possible, without loading them.
+        Results that are already known, such as the absence of copies of a 
+        file without a digest, are counted as they are.
+        """
+        if self.cachedResults is not None or self.confirm is not None:
+            return len(self._results())
+        return self.repository.count(self)
+
     def byLocation(self, val):
         val = self.location.completeString(val)
         return self.repository.byLocation(val)
@@ -46,6 +103,11 @@ class Query(object):
     def statistics(self):
         return self.repository.statistics()
 
+    def facet(self, field):
+        """Number of files and total size for each value of a field, see 
+        :py:mod:`niprov.tallying`."""
+        return self.repository.facet(field)
+
     def byModality(self, val):
         self.fields.append(self._fieldHasValue('modality', val))
         return self
@@ -66,6 +128,82 @@ class Query(object):
         self.fields.append(self._fieldHasValue('approval', val))
         return self
 
+    def where(self, field, value):
+        """Files for which the field has this value, or for fields with a 
+        list of values, includes it."""
+        self.conditions.append(Condition(field, 'eq', value))
+        return self
+
+    def whereIn(self, field, values):
+        """Files for which the field has any of these values."""
+        self.conditions.append(Condition(field, 'in', list(values)))
+        return self
+
+    def between(self, field, low=None, high=None):
+        """Files for which the field is at least low and at most high.
+
+        Either end can be left out.
+        """
+        if low is not None:
+            self.conditions.append(Condition(field, 'gte', low))
+        if high is not None:
+            self.conditions.append(Condition(field, 'lte', high))
+        return self
+
+    def acquiredBetween(self, start=None, end=None):
+        return self.between('acquired', start, end)
+
+    def addedBetween(self, start=None, end=None):
+        return self.between('added', start, end)
+
+    def sizeBetween(self, smallest=None, largest=None):
+        return self.between('size', smallest, largest)
+
+    def having(self, field):
+        """Files that have the field."""
+        self.conditions.append(Condition(field, 'exists', True))
+        return self
+
+    def lacking(self, field):
+        """Files that do not have the field."""
+        self.conditions.append(Condition(field, 'exists', False))
+        return self
+
+    def either(self, *alternatives):
+        """Files that match at least one of several other queries.
+
+        Args:
+            alternatives: :class:`.Query` objects, for instance 
+                ``get().either(get().bySubject('a'), get().bySubject('b'))``.
+        """
+        self.conditions.append(Either([q.getFilter() for q in alternatives]))
+        return self
+
+    def sortBy(self, field):
+        """Order the results on a field, prefixed with a '-' for descending 
+        order."""
+        self.sort = field
+        return self
+
+    def limit(self, n):
+        """Return at most n files."""
+        self.maximum = n
+        return self
+
+    def offset(self, n):
+        """Skip the first n files."""
+        self.start = n
+        return self
+
+    def allValues(self, field):
+        """The distinct values of a field among the files that match.
+
+        Without other conditions, the values of the :py:data:`.FACETS` are 
+        read from the tallies kept by the repository, in sorted order.
+        """
+        self.fields.append(self._fieldAllValues(field))
+        return self
+
     def allModalities(self):
         self.fields.append(self._fieldAllValues('modality'))
         return self
@@ -79,10 +217,19 @@ class Query(object):
         return self
 
     def copiesOf(self, target):
+        """Files with the same content as the target.
+
+        If the target only has a sample digest, files with the same sample 
+        digest are looked up first, and then compared by full digest.
+        """
         checksum = target.provenance.get('hash', None)
+        sample = target.provenance.get('hash-sample', None)
         filesize = target.provenance.get('size', 0)
         if checksum and filesize > 0:
             self.fields.append(self._fieldHasValue('hash', checksum))
+        elif sample and filesize > 0:
+            self.fields.append(self._fieldHasValue('hash-sample', sample))
+            self.confirm = lambda other: self.hasher.sameContent(target, other)
         else:
             self.cachedResults = []
         return self
@@ -0,0 +1,64 @@
+class Record(object):
+    """Lightweight stand-in for a file, as listed by repositories.
+
+    Creating a file object for each record listed means determining the
+    format of the file and setting up the services it uses, while listing
+    mostly needs only the provenance. A Record wraps the provenance
+    dictionary, and only creates the :class:`.Location` or the file object
+    of the class for its format when these are first needed. Attributes that
+    a Record does not have are looked up on the file object, so that it can
+    be used wherever the file object could, except that it can not be given
+    new attributes. The Record is not read-only: its provenance is the 
+    dictionary it was made with, and methods of the file object that change 
+    the file work on the file object, which shares that dictionary.
+
+    Args:
+        provenance (dict): Provenance of the file.
+        factory (:class:`.FileFactory`): Used to create the file object.
+    """
+
+    __slots__ = ('provenance', '_factory', '_location', '_file')
+
+    def __init__(self, provenance, factory):
+        self.provenance = provenance
+        self._factory = factory
+        self._location = None
+        self._file = None
+
+    @property
+    def location(self):
+        if self._location is None:
+            self._location = self._factory.locations.fromString(
+                self.provenance['location'])
+        return self._location
+
+    @property
+    def path(self):
+        if 'path' in self.provenance:
+            return self.provenance['path']
+        return self.location.path
+
+    @property
+    def parents(self):
+        return self.provenance.get('parents', [])
+
+    @property
+    def file(self):
+        """The file object for the format of this file."""
+        if self._file is None:
+            self._file = self._factory.fromProvenance(self.provenance)
+        return self._file
+
+    def copy(self):
+        """A Record with a copy of the provenance, see 
+        :py:meth:`.BaseFile.copy`."""
+        from niprov.basefile import copyProvenance
+        return Record(copyProvenance(self.provenance), self._factory)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.file, name)
+
+    def __repr__(self):
+        return '<Record {0}>'.format(self.provenance.get('location'))
@@ -58,6 +58,13 @@ class Repository(object):
             image (:class:`.BaseFile`): Image file to store.
         """
 
+    def addMany(self, images):                                # pragma: no cover
+        """Add the provenance for several files to storage at once.
+
+        Args:
+            images (list): List of :class:`.BaseFile` objects to store.
+        """
+
     def update(self, image):                                  # pragma: no cover
         """Save changed provenance for this file..
 
@@ -65,6 +72,13 @@ class Repository(object):
             image (:class:`.BaseFile`): Image file that has changed.
         """
 
+    def updateMany(self, images):                             # pragma: no cover
+        """Save changed provenance for several files at once.
+
+        Args:
+            images (list): List of :class:`.BaseFile` objects that have changed.
+        """
+
     def all(self):                                            # pragma: no cover
         """Retrieve all known provenance from storage.
 
@@ -72,6 +86,112 @@ class Repository(object):
             list: List of provenance for known files.
         """
 
+    def iterAll(self, batchsize=500, projection=None, sort=None):  # pragma: no cover
+        """Go through all known provenance, without loading it all at once.
+
+        Args:
+            batchsize (int): Number of records fetched from storage at once.
+            projection (list, optional): Names of the provenance fields to 
+                retrieve. The location is always retrieved. Defaults to all 
+                fields.
+            sort (str, optional): Field to sort on, prefixed with a '-' for 
+                descending order. Backends that can not sort in storage 
+                have to load all provenance to sort it.
+
+        Returns:
+            generator: :class:`.BaseFile` objects for known files.
+        """
+
+    def inquire(self, query):                                 # pragma: no cover
+        """Files that match a query, or the values of a field asked for.
+
+        Repositories should have storage apply as much of the query as it 
+        can; see :py:mod:`niprov.filtering`.
+
+        Args:
+            query (:class:`.Query`): Conditions, sort order and range.
+
+        Returns:
+            list: Matching files in order, or if the query asks for all 
+                values of a field, the distinct values of that field.
+        """
+
+    def count(self, query):                                   # pragma: no cover
+        """Number of files that match a query, regardless of its limit and 
+        offset, without loading them if possible.
+
+        Args:
+            query (:class:`.Query`): Conditions to match.
+
+        Returns:
+            int: Number of files.
+        """
+
+    def search(self, text, n=20, start=0):                    # pragma: no cover
+        """Files with the given words in their searchable fields, best match 
+        first.
+
+        Args:
+            text (str): Words to look for.
+            n (int): Maximum number of files returned.
+            start (int): Number of better matching files to skip.
+
+        Returns:
+            list: Matching files.
+        """
+
+    def statistics(self):                                     # pragma: no cover
+        """Number of files and their total size.
+
+        Repositories keep tallies up to date as files are saved, so that
+        this does not go through all files; see :py:mod:`niprov.tallying`.
+
+        Returns:
+            dict: With 'count' and 'totalsize'.
+        """
+
+    def facet(self, field):                                   # pragma: no cover
+        """Number of files and their total size for each value of a field,
+        read from the tallies like statistics().
+
+        Args:
+            field (str): One of the :py:data:`.FACETS`, or 'acquired' for
+                the number of files acquired on each day, as 'YYYY-MM-DD'.
+
+        Returns:
+            dict: For each value a dict with 'count' and 'totalsize'.
+        """
+
+    def revision(self):                                       # pragma: no cover
+        """A value that changes whenever files are saved, for instance to 
+        tell whether pages made from the provenance are still current.
+
+        Returns:
+            Number or string of the revision of the contents of storage.
+        """
+
+    def versionsOf(self, image):                              # pragma: no cover
+        """Get the previous versions of a file.
+
+        Versions are stored apart from the provenance, as the differences 
+        between each version and the next, and are only loaded when asked 
+        for.
+
+        Args:
+            image (:class:`.BaseFile`): File for which to get the versions.
+
+        Returns:
+            list: Provenance of the previous versions, oldest first.
+        """
+
+    def pruneVersions(self):                                  # pragma: no cover
+        """Remove the oldest versions of files beyond the number set with 
+        the 'versions_kept' setting.
+
+        Returns:
+            int: Number of versions removed.
+        """
+
     def bySubject(self, subject):                             # pragma: no cover
         """Get the provenance for all files of a given participant. 
 
@@ -120,3 +240,36 @@ class Repository(object):
         Returns:
             list: List with BaseFile objects
         """
+
+    def byFieldValues(self, fieldName, listOfValues):         # pragma: no cover
+        """Get any files for which the given field has one of these values.
+
+        Args:
+            fieldName (str): Name of the provenance field, e.g. 'hash'.
+            listOfValues (list): Values to look for.
+
+        Returns:
+            list: List with BaseFile objects
+        """
+
+    def extendSeries(self, extensions):                       # pragma: no cover
+        """Save files that were merged into known series.
+
+        Args:
+            extensions (list): Tuples of a series object and the list of 
+                paths that were added to its 'filesInSeries'.
+        """
+
+    def ensureIndexes(self):                                  # pragma: no cover
+        """Create any indexes that the backend uses but does not have yet.
+
+        Returns:
+            list: Names of the indexes created.
+        """
+
+    def reindex(self):                                        # pragma: no cover
+        """Rebuild the indexes of the backend.
+
+        Returns:
+            list: Names of the indexes rebuilt.
+        """
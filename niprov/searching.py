@@ -3,14 +3,20 @@
 from niprov.dependencies import Dependencies
 
 
-def search(text, dependencies=Dependencies()):
+def search(text, n=20, start=0, dependencies=Dependencies()):
     """
     Search for files with the given text in their provenance fields.
 
+    Files are ranked by how well they match. Each word also matches longer 
+    words that start with it.
+
     Args:
         text (str): Words to look for.
+        n (int): Maximum number of files returned.
+        start (int): Number of better matching files to skip, to get the 
+            next page of results.
 
     Returns:
         list: List of BaseFile objects
     """
-    return dependencies.getRepository().search(text)
+    return dependencies.getRepository().search(text, n, start)
@@ -0,0 +1,609 @@
+import os, sqlite3, threading
+from niprov.dependencies import Dependencies
+from niprov.streaming import (BATCHSIZE, sortOrder, ordered, project, 
+    lastPerLocation)
+from niprov.versioning import takeDeltas, restoreVersions
+from niprov.filtering import Either, Condition, select, countMatching, matches
+from niprov.textindex import openTextIndex
+from niprov.tallying import Tally, FIELDS, TOTAL
+
+
+COLUMNS = ['location', 'id', 'hash', 'hash-sample', 'seriesuid', 'subject',
+           'project', 'modality', 'user', 'approval', 'added', 'acquired',
+           'size']
+INDEXED = ['id', 'hash', 'hash-sample', 'seriesuid', 'subject', 'project',
+           'modality', 'user', 'approval', 'added', 'acquired']
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS provenance (
+    location TEXT PRIMARY KEY,
+    id TEXT,
+    hash TEXT,
+    "hash-sample" TEXT,
+    seriesuid TEXT,
+    subject TEXT,
+    project TEXT,
+    modality TEXT,
+    user TEXT,
+    approval TEXT,
+    added TEXT,
+    acquired TEXT,
+    size INTEGER,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS parents (
+    location TEXT NOT NULL,
+    parent TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS parents_parent ON parents (parent);
+CREATE INDEX IF NOT EXISTS parents_location ON parents (location);
+CREATE TABLE IF NOT EXISTS versions (
+    location TEXT NOT NULL,
+    delta TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_location ON versions (location);
+CREATE TABLE IF NOT EXISTS tallies (
+    facet TEXT NOT NULL,
+    value NOT NULL,
+    count INTEGER NOT NULL,
+    totalsize INTEGER NOT NULL,
+    PRIMARY KEY (facet, value)
+);
+CREATE TABLE IF NOT EXISTS revision (
+    number INTEGER NOT NULL
+);
+INSERT INTO revision SELECT 0 WHERE NOT EXISTS (SELECT * FROM revision);
+"""
+TALLIED = 'SELECT {0} FROM provenance'.format(', '.join(
+    ['"'+f+'"' for f in FIELDS]))
+PRUNE = """
+DELETE FROM versions WHERE rowid IN (SELECT v.rowid FROM versions v WHERE {0}
+    (SELECT COUNT(*) FROM versions w WHERE w.location = v.location 
+    AND w.rowid > v.rowid) >= ?)
+"""
+MAXVARS = 500
+SQLOPS = {'eq':'=', 'gt':'>', 'gte':'>=', 'lt':'<', 'lte':'<='}
+_DATABASES = {}
+_PREPARED = set()
+_DATABASES_LOCK = threading.Lock()
+
+
+class SqliteRepository(object):
+    """Stores provenance in a local SQLite database.
+
+    Provenance is stored as json, with a number of fields copied to indexed
+    columns for fast lookups, and the parents of each file in a separate
+    table. Previous versions of files are kept in the versions table, as 
+    the differences between versions, and the tallies for statistics() and
+    facet() in the tallies table, which is updated in the same transaction 
+    as the files saved, as is the number in the revision table. The index 
+    used by search() is kept next to the database, see 
+    :py:mod:`niprov.textindex`. Unlike the MongoDB backend, this does not 
+    require a server. Objects for the same database share a connection in 
+    each thread, and the schema is brought up to date once per process.
+
+    Set ``database_type`` to ``sqlite`` to use this backend, and
+    ``database_url`` to the path of the database file.
+    """
+
+    def __init__(self, dependencies=Dependencies()):
+        self.json = dependencies.getSerializer()
+        self.factory = dependencies.getFileFactory()
+        self.pictureCache = dependencies.getPictureCache()
+        config = dependencies.getConfiguration()
+        self.kept = config.versions_kept
+        self.datafile = os.path.expanduser(config.database_url)
+        self.conn = openDatabase(self.datafile)
+        self.textIndex = openTextIndex(self.datafile + '.search')
+        with _DATABASES_LOCK:
+            if self.datafile not in _PREPARED:
+                self._prepare()
+                _PREPARED.add(self.datafile)
+
+    def byLocation(self, locationString):
+        """Get the provenance for a file at the given location.
+
+        In the case of a dicom series, this returns the provenance for the
+        series.
+
+        Args:
+            locationString (str): Location of the image file.
+
+        Returns:
+            dict: Provenance for one image file.
+        """
+        return self._findOne('location', locationString)
+
+    def byLocations(self, listOfLocations):
+        return self._findIn('location', listOfLocations)
+
+    def byFieldValues(self, fieldName, listOfValues):
+        if fieldName in COLUMNS:
+            return self._findIn(fieldName, listOfValues)
+        conditions = [Condition(fieldName, 'in', list(listOfValues))]
+        return [f for f in self.all() if matches(f.provenance, conditions)]
+
+    def getSeries(self, image):
+        """Get the object that carries provenance for the series that the image
+        passed is in.
+
+        Args:
+            image (:class:`.DicomFile`): File that is part of a series.
+
+        Returns:
+            :class:`.DicomFile`: Image object that caries provenance for
+                         the series.
+        """
+        seriesUid = image.getSeriesId()
+        if seriesUid is None:
+            return None
+        return self._findOne('seriesuid', seriesUid)
+
+    def add(self, image):
+        """Add the provenance for one file to storage.
+
+        Args:
+            image (:class:`.BaseFile`): Image file to store.
+        """
+        self._save([image])
+        self.pictureCache.saveToDisk(for_=image)
+
+    def addMany(self, images):
+        """Add the provenance for several files to storage at once.
+
+        Args:
+            images (list): List of :class:`.BaseFile` objects to store.
+        """
+        if not images:
+            return
+        self._save(images)
+        for image in images:
+            self.pictureCache.saveToDisk(for_=image)
+
+    def update(self, image):
+        """Save changed provenance for this file..
+
+        Args:
+            image (:class:`.BaseFile`): Image file that has changed.
+        """
+        self._save([image])
+
+    def updateMany(self, images):
+        """Save changed provenance for several files at once.
+
+        Args:
+            images (list): List of :class:`.BaseFile` objects that have changed.
+        """
+        if images:
+            self._save(images)
+
+    def extendSeries(self, extensions):
+        """Save files that were merged into known series.
+
+        Args:
+            extensions (list): Tuples of a series object and the list of 
+                paths that were added to its 'filesInSeries'.
+        """
+        if extensions:
+            self.updateMany([series for series, _ in extensions])
+
+    def updateApproval(self, locationString, approvalStatus):
+        img = self.byLocation(locationString)
+        img.provenance['approval'] = approvalStatus
+        self.update(img)
+
+    def all(self):
+        """Retrieve all known provenance from storage.
+
+        Returns:
+            list: List of provenance for known files.
+        """
+        return self._list('SELECT record FROM provenance')
+
+    def iterAll(self, batchsize=BATCHSIZE, projection=None, sort=None):
+        """Go through all known provenance, without loading it all at once.
+
+        Sorting on a field that is not one of the COLUMNS requires all files 
+        to be loaded.
+
+        Args:
+            batchsize (int): Number of records fetched from storage at once.
+            projection (list, optional): Names of the provenance fields to 
+                retrieve. The location is always retrieved. Defaults to all 
+                fields.
+            sort (str, optional): Field to sort on, prefixed with a '-' for 
+                descending order.
+
+        Returns:
+            generator: :class:`.BaseFile` objects for known files.
+        """
+        sql = 'SELECT record FROM provenance'
+        field, descending = sortOrder(sort or '')
+        if field in COLUMNS:
+            sql += ' ORDER BY "{0}" {1}'.format(field, 
+                'DESC' if descending else 'ASC')
+        images = self._fetchInBatches(self.conn.execute(sql), batchsize)
+        if sort is not None and field not in COLUMNS:
+            images = ordered(images, sort)
+        if projection is not None:
+            images = project(images, projection, self.factory)
+        return iter(images)
+
+    def latest(self, n=20):
+        return self._list('SELECT record FROM provenance '
+            'ORDER BY added DESC LIMIT ?', (n,))
+
+    def statistics(self):
+        """Number of files and their total size.
+
+        Returns:
+            dict: With 'count' and 'totalsize'.
+        """
+        count, totalsize = self._tallyOf(TOTAL) or (0, 0)
+        return {'count':count, 'totalsize':totalsize}
+
+    def facet(self, field):
+        """Number of files and their total size for each value of a field.
+
+        Args:
+            field (str): One of the :py:data:`.FACETS`, or 'acquired' for 
+                the number of files acquired on each day.
+
+        Returns:
+            dict: For each value a dict with 'count' and 'totalsize'.
+        """
+        rows = self.conn.execute('SELECT value, count, totalsize FROM '
+            'tallies WHERE facet = ?', (field,))
+        return {row[0]:{'count':row[1], 'totalsize':row[2]} for row in rows}
+
+    def byId(self, uid):
+        return self._findOne('id', uid)
+
+    def revision(self):
+        """Number of transactions in which files were saved.
+
+        Returns:
+            int: Revision of the contents of storage.
+        """
+        return self.conn.execute('SELECT number FROM revision').fetchone()[0]
+
+    def byParents(self, listOfParentLocations):
+        images = []
+        seen = set()
+        for chunk in _chunks(listOfParentLocations):
+            for image in self._list('SELECT record FROM provenance '
+                    'WHERE location IN (SELECT location FROM parents '
+                    'WHERE parent IN ({0}))'.format(_placeholders(chunk)), 
+                    chunk):
+                location = image.location.toString()
+                if location not in seen:
+                    seen.add(location)
+                    images.append(image)
+        return images
+
+    def inquire(self, query):
+        """Files that match a query, or the values of a field asked for.
+
+        Conditions on the COLUMNS are evaluated by SQLite, and if there are 
+        no others, so are sorting, limit and offset.
+
+        Args:
+            query (:class:`.Query`): Conditions, sort order and range.
+
+        Returns:
+            list: Matching files, or distinct values of a field.
+        """
+        clauses, params, rest = _where(query.getFilter())
+        distinct = query.getDistinct()
+        field, descending = sortOrder(query.getSort() or '')
+        inSql = (not rest and (distinct is None or distinct in COLUMNS) 
+            and (not field or field in COLUMNS))
+        if not inSql:
+            return select(self._list('SELECT record FROM provenance' + 
+                _clause(clauses), params), query)
+        if distinct is not None:
+            rows = self.conn.execute('SELECT DISTINCT "{0}" FROM provenance '
+                '{1}'.format(distinct, _clause(clauses + 
+                ['"{0}" IS NOT NULL'.format(distinct)])), params)
+            return [row[0] for row in rows]
+        sql = 'SELECT record FROM provenance' + _clause(clauses)
+        if field:
+            sql += ' ORDER BY "{0}" {1}'.format(field, 
+                'DESC' if descending else 'ASC')
+        limit = query.getLimit()
+        sql += ' LIMIT ? OFFSET ?'
+        params += [-1 if limit is None else limit, query.getOffset()]
+        return self._list(sql, params)
+
+    def count(self, query):
+        """Number of files that match a query.
+
+        Args:
+            query (:class:`.Query`): Conditions to match.
+
+        Returns:
+            int: Number of files.
+        """
+        clauses, params, rest = _where(query.getFilter())
+        if not rest:
+            return self.conn.execute('SELECT COUNT(*) FROM provenance' + 
+                _clause(clauses), params).fetchone()[0]
+        cursor = self.conn.execute('SELECT record FROM provenance' + 
+            _clause(clauses), params)
+        return countMatching(self._fetchInBatches(cursor, BATCHSIZE), 
+            query.getFilter())
+
+    def search(self, text, n=20, start=0):
+        """Files with the given words in their searchable fields, best match 
+        first, ranked with the index in :py:mod:`niprov.textindex`.
+
+        Args:
+            text (str): Words to look for.
+            n (int): Maximum number of files returned.
+            start (int): Number of better matching files to skip.
+
+        Returns:
+            list: Matching files.
+        """
+        if not self.textIndex.exists():
+            self.textIndex.rebuild(self.iterAll())
+        locations = self.textIndex.search(text, n, start)
+        found = {i.location.toString():i for i in self._findIn('location', 
+            locations)}
+        return [found[l] for l in locations if l in found]
+
+    def versionsOf(self, image):
+        """Get the previous versions of a file.
+
+        Args:
+            image (:class:`.BaseFile`): File for which to get the versions.
+
+        Returns:
+            list: Provenance of the previous versions, oldest first.
+        """
+        rows = self.conn.execute('SELECT delta FROM versions WHERE '
+            'location = ? ORDER BY rowid DESC', (image.location.toString(),))
+        return restoreVersions(image.provenance, 
+            [self.json.decode(row[0]) for row in rows])
+
+    def pruneVersions(self):
+        """Remove the oldest versions of files beyond the number set with 
+        the 'versions_kept' setting.
+
+        Returns:
+            int: Number of versions removed.
+        """
+        if not self.kept:
+            return 0
+        with self.conn:
+            return self.conn.execute(PRUNE.format(''), (self.kept,)).rowcount
+
+    def ensureIndexes(self):
+        """Create the indexes on the columns in INDEXED that do not exist yet.
+
+        Returns:
+            list: Names of the indexes created.
+        """
+        rows = self.conn.execute("SELECT name FROM sqlite_master "
+            "WHERE type = 'index'")
+        existing = set([row[0] for row in rows])
+        created = []
+        with self.conn:
+            for column in INDEXED:
+                name = 'provenance_' + column.replace('-', '_')
+                if name not in existing:
+                    self.conn.execute('CREATE INDEX {0} ON provenance '
+                        '("{1}")'.format(name, column))
+                    created.append(name)
+        return created
+
+    def reindex(self):
+        """Rebuild all indexes, including the search index, and count the 
+        tallies again.
+
+        Returns:
+            list: Names of the indexes rebuilt.
+        """
+        self.conn.execute('REINDEX')
+        rows = self.conn.execute("SELECT name FROM sqlite_master "
+            "WHERE type = 'index' AND sql IS NOT NULL")
+        self.textIndex.rebuild(self.iterAll())
+        self._countTallies()
+        return [row[0] for row in rows] + ['search', 'tallies']
+
+    def _save(self, images):
+        images = lastPerLocation(images)
+        locations = set([i.location.toString() for i in images])
+        with self.conn:
+            changes = Tally()
+            for provenance in self._tallied(locations):
+                changes.add(provenance, -1)
+            for image in images:
+                self._saveOne(image)
+            for provenance in self._tallied(locations):
+                changes.add(provenance)
+            self._applyTallies(changes)
+            self._keepVersions(images)
+            self.conn.execute('UPDATE revision SET number = number + 1')
+        self.textIndex.update(images)
+
+    def _tallied(self, locations):
+        """The columns that the tallies depend on for these locations."""
+        for chunk in _chunks(locations):
+            rows = self.conn.execute(TALLIED + ' WHERE location IN ({0})'
+                .format(_placeholders(chunk)), chunk)
+            for row in rows:
+                yield dict(zip(FIELDS, row))
+
+    def _applyTallies(self, changes):
+        """Add the changes in a :class:`.Tally` to the tallies table."""
+        rows = [(c, s, f, v) for f, v, c, s in changes.items() if c or s]
+        self.conn.executemany('INSERT OR IGNORE INTO tallies '
+            'VALUES (?, ?, 0, 0)', [(f, v) for _, _, f, v in rows])
+        self.conn.executemany('UPDATE tallies SET count = count + ?, '
+            'totalsize = totalsize + ? WHERE facet = ? AND value = ?', rows)
+        self.conn.execute("DELETE FROM tallies WHERE count <= 0 "
+            "AND facet != ''")
+
+    def _prepare(self):
+        """Create the tables, columns and indexes missing from the database,
+        and count the tallies if it has none."""
+        self.conn.executescript(SCHEMA)
+        self._addMissingColumns()
+        self.ensureIndexes()
+        if self._tallyOf(TOTAL) is None:
+            self._countTallies()
+
+    def _countTallies(self):
+        """Fill the tallies table anew from the provenance table."""
+        tally = Tally()
+        for row in self.conn.execute(TALLIED):
+            tally.add(dict(zip(FIELDS, row)))
+        with self.conn:
+            self.conn.execute('DELETE FROM tallies')
+            self.conn.executemany('INSERT INTO tallies VALUES (?, ?, ?, ?)',
+                tally.items())
+
+    def _tallyOf(self, key):
+        return self.conn.execute('SELECT count, totalsize FROM tallies '
+            'WHERE facet = ? AND value = ?', key).fetchone()
+
+    def _addMissingColumns(self):
+        """Add the COLUMNS that databases made by earlier versions do not 
+        have, filled in from the records."""
+        existing = [row[1] for row in 
+            self.conn.execute('PRAGMA table_info(provenance)')]
+        missing = [c for c in COLUMNS if c not in existing]
+        if not missing:
+            return
+        with self.conn:
+            for column in missing:
+                self.conn.execute('ALTER TABLE provenance ADD COLUMN '
+                    '"{0}"'.format(column))
+            rows = self.conn.execute('SELECT location, record FROM '
+                'provenance').fetchall()
+            for location, record in rows:
+                provenance = self.json.deserializeRecord(record).provenance
+                self.conn.execute('UPDATE provenance SET {0} WHERE '
+                    'location = ?'.format(', '.join(['"{0}" = ?'.format(c) 
+                    for c in missing])), [_columnValue(provenance.get(c)) 
+                    for c in missing] + [location])
+
+    def _keepVersions(self, images):
+        """Store the differences with the versions that the images replace."""
+        rows = [(i.location.toString(), self.json.encode(d)) 
+            for i in images for d in takeDeltas(i)]
+        self.conn.executemany('INSERT INTO versions VALUES (?, ?)', rows)
+        if self.kept:
+            for location in set([r[0] for r in rows]):
+                self.conn.execute(PRUNE.format('v.location = ? AND'), 
+                    (location, self.kept))
+
+    def _saveOne(self, image):
+        location = image.location.toString()
+        provenance = image.provenance
+        values = [location]
+        for column in COLUMNS[1:]:
+            values.append(_columnValue(provenance.get(column)))
+        values.append(self.json.serializeSingle(image))
+        self.conn.execute('INSERT OR REPLACE INTO provenance ({0}, record) '
+            'VALUES ({1})'.format(', '.join(['"'+c+'"' for c in COLUMNS]),
+            _placeholders(values)), values)
+        self.conn.execute('DELETE FROM parents WHERE location = ?',
+            (location,))
+        self.conn.executemany('INSERT INTO parents VALUES (?, ?)',
+            [(location, p) for p in provenance.get('parents', [])])
+
+    def _findOne(self, column, value):
+        row = self.conn.execute('SELECT record FROM provenance WHERE "{0}" = ? '
+            'LIMIT 1'.format(column), (value,)).fetchone()
+        if row is not None:
+            return self.json.deserialize(row[0])
+
+    def _findMany(self, column, value):
+        return self._list('SELECT record FROM provenance '
+            'WHERE "{0}" = ?'.format(column), (value,))
+
+    def _findIn(self, column, values):
+        images = []
+        for chunk in _chunks(values):
+            images += self._select('SELECT record FROM provenance WHERE "{0}" '
+                'IN ({1})'.format(column, _placeholders(chunk)), chunk)
+        return images
+
+    def _fetchInBatches(self, cursor, batchsize):
+        while True:
+            rows = cursor.fetchmany(batchsize)
+            if not rows:
+                break
+            for row in rows:
+                yield self.json.deserializeRecord(row[0])
+
+    def _select(self, sql, params=()):
+        rows = self.conn.execute(sql, params)
+        return [self.json.deserialize(row[0]) for row in rows]
+
+    def _list(self, sql, params=()):
+        """Like _select, but with lightweight records for listing."""
+        rows = self.conn.execute(sql, params)
+        return [self.json.deserializeRecord(row[0]) for row in rows]
+
+
+def openDatabase(path):
+    """Get the shared connection to the database file at this path.
+
+    SQLite connections can only be used in the thread that opened them, so 
+    one is kept for each thread, and closed when the thread ends.
+    """
+    with _DATABASES_LOCK:
+        if path not in _DATABASES:
+            _DATABASES[path] = threading.local()
+        local = _DATABASES[path]
+    if not hasattr(local, 'conn'):
+        local.conn = sqlite3.connect(path)
+        local.conn.text_factory = str
+    return local.conn
+
+
+def _where(conditions):
+    """SQL for the conditions of a filter on the COLUMNS.
+
+    Returns:
+        tuple: List of SQL conditions, list of their parameters, and list of
+            the conditions that could not be translated.
+    """
+    clauses, params, rest = [], [], []
+    for condition in conditions:
+        if (isinstance(condition, Either) or condition.name not in COLUMNS
+                or condition.op == 'exists' or (condition.op == 'in' and 
+                len(condition.value) > MAXVARS)):
+            rest.append(condition)
+        elif condition.op == 'in':
+            values = [_columnValue(v) for v in condition.value]
+            clauses.append('"{0}" IN ({1})'.format(condition.name, 
+                _placeholders(values)))
+            params += values
+        else:
+            clauses.append('"{0}" {1} ?'.format(condition.name, 
+                SQLOPS[condition.op]))
+            params.append(_columnValue(condition.value))
+    return clauses, params, rest
+
+def _clause(clauses):
+    if not clauses:
+        return ''
+    return ' WHERE ' + ' AND '.join(clauses)
+
+def _columnValue(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    elif isinstance(value, (list, dict)):
+        return None
+    return value
+
+def _placeholders(values):
+    return ', '.join(['?']*len(values))
+
+def _chunks(values):
+    values = list(values)
+    return [values[i:i+MAXVARS] for i in range(0, len(values), MAXVARS)]
+
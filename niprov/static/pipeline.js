@@ -1,86 +1,76 @@
-// function definitions
-
-var hasAsParent = function(file, parent) {
-    if ('parents' in file) {
-        return file.parents.indexOf(parent.location) > -1
+// Draws the neighbourhood of a file in its pipeline, as served by the 
+// neighbourhood view, one column per generation. Clicking a file adds its 
+// own neighbourhood, and clicking a group lists the files in it.
+
+var graph = {nodes: {}, links: {}};
+
+var neighbourhoodUrl = function(id, params) {
+    var url = neighbourhoodUrlTemplate.replace('__id__', 
+        encodeURIComponent(id));
+    var query = [];
+    for (var name in params) {
+        query.push(name + '=' + encodeURIComponent(params[name]));
     }
-    else {return false;}
+    return query.length ? url + '?' + query.join('&') : url;
 }
 
-var allParentsIn = function(file, fileHaystack) {
-    locationHaystack = fileHaystack.map(function (file) { 
-        return file.location; 
-    });
-    for (var i = 0; i < file.parents.length; i++) {
-        if (locationHaystack.indexOf(file.parents[i]) === -1) {
-            return false;
+var merge = function(hood, offset) {
+    hood.nodes.forEach(function(node) {
+        if (!(node.key in graph.nodes)) {
+            node.generation += offset;
+            graph.nodes[node.key] = node;
         }
+    });
+    hood.links.forEach(function(link) {
+        graph.links[link.source + '\n' + link.target] = link;
+    });
+    if (hood.center in graph.nodes) {
+        graph.nodes[hood.center].expanded = true;
     }
-    return true;
 }
 
-var findExistingParent = function(child, potentialParents) {
-    for (var i = 0; i < potentialParents.length; i++) {
-        potentialParent = potentialParents[i]
-        if ('children' in potentialParent) {
-            for (var j = 0; j < potentialParent.children.length; j++) {
-                if (potentialParent.children[j] === child) {
-                    return potentialParent;
-                }
-            }
+var removeNode = function(key) {
+    delete graph.nodes[key];
+    for (var linkKey in graph.links) {
+        if (graph.links[linkKey].target === key) {
+            delete graph.links[linkKey];
         }
     }
-    return null;
 }
 
-var findChildrenOfGeneration = function findChildrenOfGeneration (parents, prevGenFiles) {
-    prevGenFiles = prevGenFiles.concat(parents)
-    var generation = []
-    for (var p = 0; p < parents.length; p++) {
-        parents[p].children = [];
-        for (var f = 0; f < files.length; f++) {
-            if ( hasAsParent(files[f], parents[p]) && 
-                    allParentsIn(files[f], prevGenFiles)) {
-                if (!findExistingParent(files[f], files)) {
-                    generation.push(files[f]);
-                    parents[p].children.push(files[f]);
-                }
-            }
+var expand = function(node) {
+    if (node.group) {
+        var params = {start: node.start};
+        if (node.transformation !== null) {
+            params.transformation = node.transformation;
         }
+        var url = neighbourhoodUrl(node.parentid, params);
+        var offset = node.generation - 1;
+    } else if (!node.expanded && node.id) {
+        var url = neighbourhoodUrl(node.id, {depth: 1});
+        var offset = node.generation;
+    } else {
+        return;
     }
-    if (generation.length > 0) {
-        findChildrenOfGeneration(generation, prevGenFiles);
-    }
+    d3.json(url, function(error, hood) {
+        if (error) { return; }
+        var center = graph.nodes[hood.center];
+        var wasExpanded = center && center.expanded;
+        if (node.group) { removeNode(node.key); }
+        merge(hood, offset);
+        if (node.group && center) { center.expanded = wasExpanded; }
+        draw();
+    });
 }
 
-var fileByLocation = function(location, files) {
-    for (var f = 0; f < files.length; f++) {
-        if (files[f].location === location) {
-            return files[f];
-        }
+var label = function(node) {
+    if (node.group === 'more') {
+        return node.count + ' more';
     }
-}
-
-var addExtraParentLinks = function(links, files) {
-    for (var f = 0; f < files.length; f++) {
-        existingParent = findExistingParent(files[f], files)
-        if ('parents' in files[f]) {
-            for (var p = 0; p < files[f].parents.length; p++) {
-                parent = fileByLocation(files[f].parents[p], files)
-                if (parent != existingParent) {
-                    links.push({source: parent, target:files[f]});
-                }
-            }
-        }
+    if (node.group) {
+        return node.count + ' x ' + (node.transformation || 'files');
     }
-}
-    
-var filesToHierarchy = function(files) {
-    var rootfiles = files.filter(function(f){ return !('parents' in f) });
-    var root = {path: 'root', children: rootfiles};
-    var prevGenFiles = [];
-    findChildrenOfGeneration(rootfiles, prevGenFiles);
-    return root
+    return shortname(node.path || node.location);
 }
 
 var shortname = function(path) {
@@ -95,88 +85,115 @@ var translate = function(x, y) {
     return 'translate(' + x + ',' + y + ')'
 }
 
-window.onload = function() {
-
-//Width and height
-var svgWidth = 500;
-var svgHeight = 500;
-var tooltipfields = ["id", "added", "hostname", "path", "size"]
+var columnWidth = 220;
+var rowHeight = 30;
+var margin = 50;
+var tooltipfields = ["id", "added", "hostname", "path", "size", 
+    "transformation"]
 var fieldTypes = {"added":'datetime', "size":'filesize'}
+var svg, canvas, tooltipDiv;
+
+var layout = function() {
+    var nodes = d3.values(graph.nodes);
+    var generations = d3.extent(nodes, function(n) { return n.generation; });
+    var rows = {};
+    nodes.sort(function(a, b) { return d3.ascending(a.key, b.key); });
+    nodes.forEach(function(node) {
+        var row = rows[node.generation] || 0;
+        rows[node.generation] = row + 1;
+        node.x = (node.generation - generations[0]) * columnWidth;
+        node.y = row * rowHeight;
+    });
+    var height = d3.max(d3.values(rows)) * rowHeight;
+    var width = (generations[1] - generations[0] + 1) * columnWidth;
+    svg.attr('width', width + 2 * margin).attr('height', height + 2 * margin);
+    return nodes;
+}
 
-// Creat toolip container
-var tooltipDiv = d3.select('body')
-    .append('div')
-    .attr('class','tooltip')
-
-//Create SVG element
-var svg = d3.select('body')
-            .append('svg')
-            .attr('width', svgWidth)
-            .attr('height', svgHeight)
-                .append('g')
-                .attr('transform',translate(50,50));
-
-var tree = d3.layout.tree()
-    .size([svgHeight-100, svgWidth-100]);
-
-var root = filesToHierarchy(files)
-var nodes = tree.nodes(root)
-var links = tree.links(nodes)
-addExtraParentLinks(links, files)
-
-var nodeGroup = svg.selectAll('g.node')
-    .data(nodes)
-    .enter()
-    .append('g')
-        .attr('class','node')
+var draw = function() {
+    var nodes = layout();
+    var links = d3.values(graph.links).filter(function(link) {
+        return link.source in graph.nodes && link.target in graph.nodes;
+    }).map(function(link) {
+        return {source: graph.nodes[link.source], 
+                target: graph.nodes[link.target]};
+    });
+    var diagonal = d3.svg.diagonal()
+        .projection(function(d) { return [d.x, d.y]; });
+
+    var linkPaths = canvas.selectAll('path.link')
+        .data(links, function(d) { return d.source.key + '\n' + d.target.key; });
+    linkPaths.enter()
+        .insert('path', 'g')
+        .attr('class','link');
+    linkPaths.attr('d', diagonal);
+    linkPaths.exit().remove();
+
+    var nodeGroups = canvas.selectAll('g.node')
+        .data(nodes, function(d) { return d.key; });
+    var entered = nodeGroups.enter()
+        .append('g')
+        .attr('class', function(d) { return d.group ? 'node group' : 'node'; })
+        .on('click', expand);
+    entered.append('circle')
+        .attr('r', 5);
+    entered.append('text')
+        .text(label)
+        .attr('transform',translate(10,5))
+        .on("mouseover", showTooltip)
+        .on("mouseout", hideTooltip);
+    nodeGroups
+        .classed('expanded', function(d) { return d.expanded; })
         .attr('transform', function(d) {return translate(d.x, d.y)});
+    nodeGroups.exit().remove();
+}
 
-nodeGroup
-    .append('circle')
-    .attr('r', 5);
-
-nodeGroup
-    .append('text')
-    .text( function(d) { 
-        return shortname(d.path);
-    })
-    .attr('transform',translate(10,5))
-    .on("mouseover", function (d) {
-        
-        var matrix = this.getScreenCTM()
-                .translate(+this.getAttribute("cx"),
-                         +this.getAttribute("cy"));
-        tooltipDiv
-            .style("opacity", "1")
-            .style("left", 
-                   (window.pageXOffset + matrix.e) + "px")
-            .style("top",
-                   (window.pageYOffset + matrix.f + 30) + "px");
-        var deflist = tooltipDiv.insert('dl');
-        for (i = 0; i < tooltipfields.length; ++i) {
-            var field = tooltipfields[i]
-            if (field in d) {
-                deflist.insert('dt').text(field);
-                dd = deflist.insert('dd').text(d[field]);
-                if (field in fieldTypes) {
-                    dd.classed(fieldTypes[field], true);
-                }
+var showTooltip = function (d) {
+    var matrix = this.getScreenCTM()
+            .translate(+this.getAttribute("cx"),
+                     +this.getAttribute("cy"));
+    tooltipDiv
+        .style("opacity", "1")
+        .style("left", 
+               (window.pageXOffset + matrix.e) + "px")
+        .style("top",
+               (window.pageYOffset + matrix.f + 30) + "px");
+    var deflist = tooltipDiv.insert('dl');
+    for (i = 0; i < tooltipfields.length; ++i) {
+        var field = tooltipfields[i]
+        if (field in d && d[field] !== null) {
+            deflist.insert('dt').text(field);
+            dd = deflist.insert('dd').text(d[field]);
+            if (field in fieldTypes) {
+                dd.classed(fieldTypes[field], true);
             }
         }
-        makeFieldsHumanReadable();
-    })
-    .on("mouseout", function () {
-        tooltipDiv.selectAll('dl').remove()
-        return tooltipDiv.style("opacity", "0");
-    });
+    }
+    makeFieldsHumanReadable();
+}
+
+var hideTooltip = function () {
+    tooltipDiv.selectAll('dl').remove()
+    return tooltipDiv.style("opacity", "0");
+}
+
+window.onload = function() {
 
-svg.selectAll("path.link")
-    .data(links)
-    .enter()
-    .append('path')
-        .attr('class','link')
-        .attr('d', d3.svg.diagonal());
+tooltipDiv = d3.select('body')
+    .append('div')
+    .attr('class','tooltip')
 
-svgcrowbar();
+svg = d3.select('body')
+    .append('svg');
+canvas = svg.append('g')
+    .attr('transform',translate(margin,margin));
+
+d3.json(neighbourhoodUrl(centerId, {depth: centerDepth}), 
+    function(error, hood) {
+        if (error) { return; }
+        merge(hood, 0);
+        draw();
+        svgcrowbar();
+    });
 
 }
@@ -0,0 +1,81 @@
+"""Helpers for the repositories to stream files from storage with
+:py:meth:`.Repository.iterAll`, and to save them in batches.
+"""
+from operator import itemgetter
+
+BATCHSIZE = 500
+"""Default number of records fetched from storage at once."""
+
+
+def sortOrder(sort):
+    """Field and direction of a sort option.
+
+    Args:
+        sort (str): Name of a provenance field, prefixed with a '-' to sort
+            in descending order.
+
+    Returns:
+        tuple: Field name and whether the order is descending.
+    """
+    if sort.startswith('-'):
+        return sort[1:], True
+    return sort, False
+
+
+def ordered(images, sort):
+    """Sort image objects on a provenance field.
+
+    Files that do not have the field come first in ascending order. This
+    needs all images in memory, so only use it where storage can not sort.
+
+    Args:
+        images: Iterable of :class:`.BaseFile` objects.
+        sort (str): Field to sort on, see :py:func:`sortOrder`.
+
+    Returns:
+        list: The image objects in order.
+    """
+    field, descending = sortOrder(sort)
+    keyed = [((field in i.provenance, i.provenance.get(field)), i)
+        for i in images]
+    keyed.sort(key=itemgetter(0), reverse=descending)
+    return [i for key, i in keyed]
+
+
+def project(images, fields, factory):
+    """Make new image objects with only some of the provenance fields.
+
+    Args:
+        images: Iterable of :class:`.BaseFile` objects.
+        fields (list): Names of the fields to keep. The location is always
+            kept.
+        factory (:class:`.FileFactory`): Used to create the new objects.
+
+    Returns:
+        generator: Image objects with the fields that they have of those
+            requested.
+    """
+    fields = set(fields) | set(['location'])
+    for image in images:
+        provenance = image.provenance
+        yield factory.fromProvenance({f:provenance[f] for f in fields
+            if f in provenance})
+
+
+def batches(items, size):
+    """Split an iterable in lists of at most size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def lastPerLocation(images):
+    """The images in a batch that no later image has the location of, so 
+    that a file that is in the batch more than once is saved once."""
+    last = {i.location.toString(): i for i in images}
+    return [i for i in images if last[i.location.toString()] is i]
@@ -0,0 +1,114 @@
+"""Number of files and total size, overall and per value of a few fields.
+
+Repositories keep these tallies up to date as files are saved, so that
+statistics, the values of the fields in :py:data:`FACETS` and the number
+of files acquired per day can be read without going through all files.
+"""
+
+FACETS = ['modality', 'project', 'subject', 'user']
+"""Fields for which files are counted per value."""
+
+DAYS = 'acquired'
+"""Field by the day of which files are counted."""
+
+TOTAL = ('', '')
+"""Key of the tally of all files."""
+
+FIELDS = FACETS + [DAYS, 'size']
+"""Provenance fields that the tallies depend on."""
+
+
+def keysOf(provenance):
+    """The tallies that a file counts towards.
+
+    Args:
+        provenance (dict): Provenance of a file.
+
+    Returns:
+        list: Tuples of field name and value, including :py:data:`TOTAL`.
+    """
+    keys = [TOTAL]
+    for field in FACETS:
+        value = provenance.get(field)
+        if isinstance(value, (basestring, int, long, float)):
+            keys.append((field, value))
+    day = dayOf(provenance.get(DAYS))
+    if day is not None:
+        keys.append((DAYS, day))
+    return keys
+
+
+def dayOf(value):
+    """The date part of a datetime, as 'YYYY-MM-DD', or None."""
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    if isinstance(value, basestring) and len(value) >= 10:
+        return value[:10]
+
+
+def sizeOf(provenance):
+    size = provenance.get('size')
+    if isinstance(size, (int, long, float)):
+        return size
+    return 0
+
+
+class Tally(object):
+    """Counts and total sizes of files, per key from :py:func:`keysOf`.
+
+    Files can be counted anonymously with add(), or by location with
+    set(), in which case what the file counted for before is subtracted
+    when it is set again.
+    """
+
+    def __init__(self):
+        self.tallies = {TOTAL:[0, 0]}
+        self.contributions = {}
+
+    def add(self, provenance, sign=1):
+        """Count a file, or with a sign of -1, stop counting it."""
+        self._apply(keysOf(provenance), sizeOf(provenance), sign)
+
+    def set(self, location, provenance):
+        """Count the file at a location with its current provenance."""
+        if location in self.contributions:
+            keys, size = self.contributions[location]
+            self._apply(keys, size, -1)
+        keys, size = tuple(keysOf(provenance)), sizeOf(provenance)
+        self._apply(keys, size, 1)
+        self.contributions[location] = (keys, size)
+
+    def statistics(self):
+        """Number of files and their total size.
+
+        Returns:
+            dict: With 'count' and 'totalsize'.
+        """
+        count, totalsize = self.tallies.get(TOTAL, (0, 0))
+        return {'count':count, 'totalsize':totalsize}
+
+    def facet(self, field):
+        """Number of files and their total size per value of a field.
+
+        Args:
+            field (str): One of :py:data:`FACETS`, or :py:data:`DAYS`.
+
+        Returns:
+            dict: For each value a dict with 'count' and 'totalsize'.
+        """
+        return {value:{'count':count, 'totalsize':totalsize}
+            for (name, value), (count, totalsize) in self.tallies.items()
+            if name == field}
+
+    def items(self):
+        """Tuples of field, value, count and total size, with an empty field
+        and value for the tally of all files."""
+        return [(f, v, c, s) for (f, v), (c, s) in self.tallies.items()]
+
+    def _apply(self, keys, size, sign):
+        for key in keys:
+            tally = self.tallies.setdefault(key, [0, 0])
+            tally[0] += sign
+            tally[1] += sign * size
+            if tally == [0, 0] and key != TOTAL:
+                del self.tallies[key]
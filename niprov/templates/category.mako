@@ -2,14 +2,22 @@
 
 <h1>${categoryPlural}</h1>
 
-<ul>
-% for item in items:
-    <li>
-        <a href="${request.route_url(category,**{category:item})}">${item}</a>
-    </li>
+<table>
+<thead>
+<tr>
+<th>${category}</th>
+<th>Files</th>
+<th>Total size</th>
+</tr>
+</thead>
+<tbody>
+% for item in sorted(items):
+    <tr>
+        <td><a href="${request.route_url(category,**{category:item})}">${item}</a></td>
+        <td>${items[item]['count']}</td>
+        <td>${items[item]['totalsize']}</td>
+    </tr>
 % endfor
-</ul>
-
-
-
+</tbody>
+</table>
 
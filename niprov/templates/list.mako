@@ -32,4 +32,8 @@
 
 </tbody></table>
 
+% if context.get('more', None) is not None:
+<a href="${request.route_url('search', _query={'text':searchtext, 'start':more})}">more results</a>
+% endif
+
 
@@ -4,7 +4,11 @@
 
 <a class="download" download="provenance_pipeline_${sid}.svg">download pipeline image</a>
 
-<script>var files = ${request.dependencies.getSerializer().serializeList(pipeline.files) | n};</script>
+<script>
+var centerId = "${sid}";
+var centerDepth = ${depth};
+var neighbourhoodUrlTemplate = "${request.route_url('neighbourhood', id='__id__')}";
+</script>
 <script type="text/javascript" src="${request.static_url('niprov:static/niprov.js')}"></script>
 <script type="text/javascript" src="${request.static_url('niprov:static/pipeline.js')}"></script>
 <script type="text/javascript" src="${request.static_url('niprov:static/svg-crowbar.js')}"></script>
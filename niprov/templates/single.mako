@@ -62,13 +62,11 @@
 
 <h2 id="versions">versions</h2>
 <ol>
-% if '_versions' in image.provenance:
-% for version in image.provenance['_versions']:
+% for version in image.versions:
     <li>
-        <span class="datetime">${version['added']}</span>
+        <span class="datetime">${version.get('added')}</span>
     </li>
 % endfor
-% endif
 </ol>
 
 <script type="text/javascript" src="${request.static_url('niprov:static/niprov.js')}"></script>
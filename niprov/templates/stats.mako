@@ -7,3 +7,21 @@
     <dt>${k}</dt><dd>${v}</dd>
 % endfor
 </dl>
+
+% for facet in sorted(facets):
+<h2>Files by ${facet}</h2>
+<table>
+<tr><th>${facet}</th><th>Files</th><th>Total size</th></tr>
+% for value in sorted(facets[facet]):
+    <tr><td>${value}</td><td>${facets[facet][value]['count']}</td><td>${facets[facet][value]['totalsize']}</td></tr>
+% endfor
+</table>
+% endfor
+
+<h2>Files acquired per day</h2>
+<table>
+<tr><th>Day</th><th>Files</th><th>Total size</th></tr>
+% for day in sorted(days):
+    <tr><td>${day}</td><td>${days[day]['count']}</td><td>${days[day]['totalsize']}</td></tr>
+% endfor
+</table>
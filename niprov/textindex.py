@@ -0,0 +1,257 @@
+"""Full-text search for the 'file', 'journal' and 'sqlite' database types.
+
+The words in the searchable provenance fields of each file are kept in an
+inverted index, which maps each word to the files it occurs in and how
+often. Files are ranked with BM25. The index is stored as a json line per
+file next to the database, with the extension '.search', and lines are
+appended as files are saved, so that it does not have to be read again
+in full. Lines appended by other processes are picked up before searching,
+and if another process compacted or rebuilt the index, which replaces the
+file, it is read again in full.
+
+The index is built when first searched, and rebuilt with
+:py:func:`niprov.indexing.reindex`.
+"""
+import os, re, json, math, bisect, heapq, threading
+
+FIELDS = ['location', 'user', 'subject', 'project', 'protocol',
+          'transformation', 'technique', 'modality']
+"""Provenance fields that are searched."""
+
+K1 = 1.2
+"""BM25 parameter for how quickly more occurrences of a word stop adding
+to the score."""
+
+B = 0.75
+"""BM25 parameter for how much the score depends on the length of the
+fields."""
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def tokenize(text):
+    """Lowercase words in a text.
+
+    Args:
+        text (str): Text, as unicode or utf-8.
+
+    Returns:
+        list: Words in the order they occur.
+    """
+    if isinstance(text, str):
+        text = text.decode('utf-8', 'replace')
+    return _WORD.findall(text.lower())
+
+
+def termsOf(provenance):
+    """Number of times each word occurs in the searchable fields.
+
+    Args:
+        provenance (dict): Provenance of a file.
+
+    Returns:
+        dict: Count for each word.
+    """
+    counts = {}
+    for field in FIELDS:
+        value = provenance.get(field)
+        values = value if isinstance(value, list) else [value]
+        for value in values:
+            if not isinstance(value, basestring):
+                continue
+            for word in tokenize(value):
+                counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+class TextIndex(object):
+    """Inverted index of the words in the searchable fields of files.
+
+    Use :py:func:`openTextIndex` to get the index shared by all repository
+    objects in a process.
+
+    Args:
+        path (str): Path to the index file.
+    """
+
+    compactionMinimum = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.docs = {}
+        self.postings = {}
+        self.totalLength = 0
+        self.sortedTerms = None
+        self.norms = None
+        self.nlines = 0
+        self.end = 0
+        self.inode = None
+
+    def exists(self):
+        """Whether the index has been built."""
+        return os.path.isfile(self.path)
+
+    def update(self, images):
+        """Index the searchable fields of saved files, if the index has
+        been built.
+
+        Args:
+            images (list): :class:`.BaseFile` objects that were saved.
+        """
+        with self.lock:
+            if not self.exists():
+                return
+            with open(self.path, 'ab') as fhandle:
+                fhandle.write(''.join([_line(i.location.toString(), 
+                    termsOf(i.provenance)) for i in images]))
+            self._refresh()
+            self._compactIfNeeded()
+
+    def rebuild(self, images):
+        """Build the index anew.
+
+        Args:
+            images: Iterable of all :class:`.BaseFile` objects in storage.
+        """
+        with self.lock:
+            self._reset()
+            tmppath = self.path + '.building'
+            with open(tmppath, 'wb') as fhandle:
+                for image in images:
+                    location = image.location.toString()
+                    terms = termsOf(image.provenance)
+                    fhandle.write(_line(location, terms))
+                    self._index(location, terms)
+                self.end = fhandle.tell()
+                self.inode = os.fstat(fhandle.fileno()).st_ino
+            os.rename(tmppath, self.path)
+
+    def search(self, text, n=20, start=0):
+        """Locations of the files that best match the text.
+
+        Each word in the text matches the words in the index that start
+        with it. Files that match any of the words are ranked with BM25.
+
+        Args:
+            text (str): Words to look for.
+            n (int): Maximum number of locations returned.
+            start (int): Number of better ranked locations to skip.
+
+        Returns:
+            list: Locations, best match first.
+        """
+        with self.lock:
+            self._refresh()
+            if not self.docs:
+                return []
+            ndocs = len(self.docs)
+            norms = self._norms()
+            scores = {}
+            for word in set(tokenize(text)):
+                for term in self._expand(word):
+                    postings = self.postings[term]
+                    weight = (K1 + 1) * math.log(1 + (ndocs - 
+                        len(postings) + .5) / (len(postings) + .5))
+                    for location, tf in postings.iteritems():
+                        scores[location] = scores.get(location, 0.) + (
+                            weight * tf / (tf + norms[location]))
+        ranked = heapq.nsmallest(start + n, scores.iteritems(), 
+            key=lambda s: (-s[1], s[0]))
+        return [location for location, _ in ranked[start:]]
+
+    def compact(self):
+        """Rewrite the index file with only the current line for each file."""
+        with self.lock:
+            self._refresh()
+            tmppath = self.path + '.compacting'
+            with open(tmppath, 'wb') as fhandle:
+                for location, (terms, _) in self.docs.items():
+                    fhandle.write(_line(location, terms))
+                self.end = fhandle.tell()
+                self.inode = os.fstat(fhandle.fileno()).st_ino
+            os.rename(tmppath, self.path)
+            self.nlines = len(self.docs)
+
+    def _compactIfNeeded(self):
+        nstale = self.nlines - len(self.docs)
+        if nstale >= self.compactionMinimum and nstale >= len(self.docs):
+            self.compact()
+
+    def _refresh(self):
+        """Index any lines that were appended since we last looked, or the
+        whole file if it was replaced."""
+        try:
+            fhandle = open(self.path, 'rb')
+        except IOError:
+            self._reset()
+            return
+        with fhandle:
+            stat = os.fstat(fhandle.fileno())
+            if stat.st_ino != self.inode or stat.st_size < self.end:
+                self._reset()
+                self.inode = stat.st_ino
+            fhandle.seek(self.end)
+            for line in fhandle:
+                if not line.endswith('\n'):
+                    break
+                entry = json.loads(line)
+                self._index(entry['location'], entry['terms'])
+                self.end += len(line)
+
+    def _index(self, location, terms):
+        if location in self.docs:
+            oldTerms, oldLength = self.docs[location]
+            for term in oldTerms:
+                postings = self.postings[term]
+                del postings[location]
+                if not postings:
+                    del self.postings[term]
+                    self.sortedTerms = None
+            self.totalLength -= oldLength
+        length = sum(terms.values())
+        self.docs[location] = (terms, length)
+        for term, tf in terms.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                self.sortedTerms = None
+            self.postings[term][location] = tf
+        self.totalLength += length
+        self.norms = None
+        self.nlines += 1
+
+    def _norms(self):
+        """The part of the BM25 denominator that depends on the length of 
+        the fields of each file, kept until files are indexed again."""
+        if self.norms is None:
+            average = float(self.totalLength) / len(self.docs) or 1.
+            self.norms = {location: K1 * (1 - B + B * length / average)
+                for location, (_, length) in self.docs.iteritems()}
+        return self.norms
+
+    def _expand(self, word):
+        """Indexed words that start with the word."""
+        if self.sortedTerms is None:
+            self.sortedTerms = sorted(self.postings)
+        terms = self.sortedTerms
+        i = bisect.bisect_left(terms, word)
+        while i < len(terms) and terms[i].startswith(word):
+            yield terms[i]
+            i += 1
+
+
+def openTextIndex(path):
+    """Get the shared TextIndex object for the index file at this path."""
+    with _INDEXES_LOCK:
+        if path not in _INDEXES:
+            _INDEXES[path] = TextIndex(path)
+        return _INDEXES[path]
+
+
+def _line(location, terms):
+    return json.dumps({'location':location, 'terms':terms}) + '\n'
@@ -0,0 +1,251 @@
+"""Version history of files, stored as field-level differences.
+
+When a file is added again and its provenance has changed, the provenance it
+had before is kept as a version. Instead of a copy of each version inside
+the provenance, repositories store for each version the fields that differ
+from the version after it, apart from the provenance itself. The versions
+are restored from these deltas, starting from the current provenance, when
+they are asked for.
+"""
+import os
+from niprov.dependencies import Dependencies
+from niprov.record import Record
+
+IGNORED = ('_versions', '_id', '_snapshot-data')
+"""Fields that are not part of a version."""
+
+
+def pruneVersions(dependencies=Dependencies()):
+    """Remove the oldest versions of files beyond the number set with the
+    'versions_kept' setting.
+
+    For MongoDB and SQLite, this also happens whenever a version is added.
+
+    Returns:
+        int: Number of versions removed.
+    """
+    repository = dependencies.getRepository()
+    listener = dependencies.getListener()
+    nremoved = repository.pruneVersions()
+    listener.versionsPruned(nremoved)
+    return nremoved
+
+
+def delta(newer, older):
+    """The difference that turns the newer provenance into the older one.
+
+    Args:
+        newer (dict): Provenance of a version.
+        older (dict): Provenance of the version before it.
+
+    Returns:
+        dict: Under 'set', the fields of the older version that the newer
+            one does not have or that have a different value, and under
+            'unset', the fields that the older version does not have.
+    """
+    changed = {}
+    for field, value in older.items():
+        if field in IGNORED:
+            continue
+        if field not in newer or newer[field] != value:
+            changed[field] = value
+    removed = [f for f in newer if f not in older and f not in IGNORED]
+    difference = {}
+    if changed:
+        difference['set'] = changed
+    if removed:
+        difference['unset'] = removed
+    return difference
+
+
+def restore(newer, difference):
+    """Apply a difference made with :py:func:`delta` to the newer provenance.
+
+    Returns:
+        dict: Provenance of the older version.
+    """
+    older = {f:v for f, v in newer.items() if f not in IGNORED}
+    for field in difference.get('unset', []):
+        older.pop(field, None)
+    older.update(difference.get('set', {}))
+    return older
+
+
+def restoreVersions(provenance, differences):
+    """Restore the previous versions of a file.
+
+    Versions that were kept inside the provenance under '_versions', as
+    before they were stored separately, are included.
+
+    Args:
+        provenance (dict): Current provenance of the file.
+        differences (list): Stored deltas for the file, latest first.
+
+    Returns:
+        list: Provenance of the previous versions, oldest first.
+    """
+    versions = []
+    version = provenance
+    for difference in differences:
+        version = restore(version, difference)
+        versions.append(version)
+    versions.reverse()
+    return list(provenance.get('_versions', [])) + versions
+
+
+def takeDeltas(image):
+    """Deltas for the versions that the image replaces, which are then no
+    longer pending.
+
+    Args:
+        image (:class:`.BaseFile`): File about to be saved.
+
+    Returns:
+        list: Deltas for the versions replaced, oldest first.
+    """
+    replaced = getattr(image, 'replacedVersions', None)
+    if not replaced:
+        return []
+    chain = replaced + [image.provenance]
+    image.replacedVersions = []
+    return [delta(chain[v+1], chain[v]) for v in range(len(replaced))]
+
+
+def withVersions(images, repository):
+    """Copies of the images with their previous versions inside the 
+    provenance under '_versions', as they are written to backups.
+
+    Args:
+        images (iterable): Files from the repository.
+        repository: The repository that keeps their versions.
+
+    Returns:
+        generator: The files, copied if they have versions.
+    """
+    for image in images:
+        versions = repository.versionsOf(image)
+        if versions:
+            image = image.copy()
+            image.provenance['_versions'] = versions
+        yield image
+
+
+def unpackVersions(image):
+    """Turn the versions inside the provenance of an imported file into
+    versions that it replaces, so that the repository stores them as deltas
+    when it is saved.
+
+    Args:
+        image (:class:`.BaseFile`): File read from a backup.
+
+    Returns:
+        :class:`.BaseFile`: The image, or if it is a :class:`.Record` with 
+            versions, its file object, which can be given them.
+    """
+    versions = image.provenance.pop('_versions', None)
+    if not versions:
+        return image
+    if isinstance(image, Record):
+        image = image.file
+    image.replacedVersions = list(versions)
+    return image
+
+
+class VersionFile(object):
+    """Stores the version deltas for the 'file' and 'journal' database types,
+    one json line per version in a file next to the database.
+
+    The offsets of the lines are indexed by location the first time deltas
+    are asked for, after which only lines appended since are read, unless 
+    the file was replaced.
+
+    Args:
+        path (str): Path to the version file.
+        serializer (:class:`.JsonFormat`): Used to encode the deltas.
+    """
+
+    def __init__(self, path, serializer):
+        self.path = path
+        self.json = serializer
+        self._reset()
+
+    def append(self, locationsAndDeltas):
+        """Store deltas, in the order given.
+
+        Args:
+            locationsAndDeltas (list): Tuples of location and delta.
+        """
+        if not locationsAndDeltas:
+            return
+        with open(self.path, 'ab') as fhandle:
+            for location, difference in locationsAndDeltas:
+                fhandle.write(self.json.encode(
+                    {'location':location, 'delta':difference}) + '\n')
+
+    def deltasFor(self, location):
+        """The deltas stored for a location, latest first."""
+        if not os.path.isfile(self.path):
+            return []
+        deltas = []
+        with open(self.path, 'rb') as fhandle:
+            self._refresh(fhandle)
+            for offset in reversed(self.offsets.get(location, [])):
+                fhandle.seek(offset)
+                deltas.append(self.json.decode(fhandle.readline())['delta'])
+        return deltas
+
+    def prune(self, kept):
+        """Rewrite the file without the oldest deltas of any location beyond
+        the number kept.
+
+        Returns:
+            int: Number of deltas removed.
+        """
+        entries = self._entries()
+        counts = {}
+        for location, difference in entries:
+            counts[location] = counts.get(location, 0) + 1
+        nremoved = sum([max(n - kept, 0) for n in counts.values()])
+        if nremoved == 0:
+            return 0
+        tmppath = self.path + '.pruning'
+        with open(tmppath, 'wb') as fhandle:
+            for location, difference in entries:
+                if counts[location] > kept:
+                    counts[location] -= 1
+                    continue
+                fhandle.write(self.json.encode(
+                    {'location':location, 'delta':difference}) + '\n')
+        os.rename(tmppath, self.path)
+        return nremoved
+
+    def _reset(self):
+        self.offsets = {}
+        self.end = 0
+        self.inode = None
+
+    def _refresh(self, fhandle):
+        """Index the lines of the open file that were not indexed yet, or
+        all of them if it is not the file that was indexed before."""
+        stat = os.fstat(fhandle.fileno())
+        if stat.st_ino != self.inode or stat.st_size < self.end:
+            self._reset()
+            self.inode = stat.st_ino
+        fhandle.seek(self.end)
+        for line in iter(fhandle.readline, ''):
+            if not line.endswith('\n'):
+                break
+            location = self.json.decode(line)['location']
+            self.offsets.setdefault(location, []).append(self.end)
+            self.end += len(line)
+
+    def _entries(self):
+        if not os.path.isfile(self.path):
+            return []
+        entries = []
+        with open(self.path, 'rb') as fhandle:
+            for line in fhandle:
+                if line.endswith('\n'):
+                    entry = self.json.decode(line)
+                    entries.append((entry['location'], entry['delta']))
+        return entries
@@ -1,19 +1,26 @@
 from pyramid.view import view_config
 import os
 import niprov.searching as searching
-from pyramid.httpexceptions import HTTPNotFound
+from niprov.tallying import FACETS, DAYS
+from niprov.pipelinefactory import FANOUT
+from pyramid.httpexceptions import HTTPNotFound, HTTPBadRequest
+from niprov.conditional import conditional
+
+PAGESIZE = 20
 
 
 @view_config(route_name='home', renderer='templates/home.mako')
 def home(request):
     return {}
 
-@view_config(route_name='latest', renderer='templates/list.mako')
+@view_config(route_name='latest', renderer='templates/list.mako',
+    decorator=conditional(keep=True))
 def latest(request):
     repository = request.dependencies.getRepository()
     return {'images':repository.latest()}
 
-@view_config(route_name='short', renderer='templates/single.mako')
+@view_config(route_name='short', renderer='templates/single.mako',
+    decorator=conditional())
 def short(request):
     sid = request.matchdict['id']
     repository = request.dependencies.getRepository()
@@ -23,7 +30,8 @@ def short(request):
         raise HTTPNotFound
     return {'image': image, 'copies': query.copiesOf(image)}
 
-@view_config(route_name='location', renderer='templates/single.mako')
+@view_config(route_name='location', renderer='templates/single.mako',
+    decorator=conditional())
 def location(request):
     path = os.sep + os.path.join(*request.matchdict['path'])
     loc = request.matchdict['host'] + ':' + path
@@ -33,12 +41,16 @@ def location(request):
         raise HTTPNotFound
     return {'image': image, 'copies': query.copiesOf(image)}
 
-@view_config(route_name='stats', renderer='templates/stats.mako')
+@view_config(route_name='stats', renderer='templates/stats.mako',
+    decorator=conditional(keep=True))
 def stats(request):
     repository = request.dependencies.getRepository()
-    return {'stats':repository.statistics()}
+    return {'stats':repository.statistics(), 
+            'facets':{f:repository.facet(f) for f in FACETS},
+            'days':repository.facet(DAYS)}
 
-@view_config(route_name='pipeline', renderer='templates/pipeline.mako')
+@view_config(route_name='pipeline', renderer='templates/pipeline.mako',
+    decorator=conditional())
 def pipeline(request):
     sid = request.matchdict['id']
     files = request.dependencies.getRepository()
@@ -46,54 +58,87 @@ def pipeline(request):
     targetFile = files.byId(sid)
     if not targetFile:
         raise HTTPNotFound
-    return {'pipeline':pipeline.forFile(targetFile), 'sid':sid}
+    depth = _number(request, 'depth', 1)
+    return {'image':targetFile, 'sid':sid, 'depth':depth}
 
-@view_config(route_name='subject', renderer='templates/list.mako')
+@view_config(route_name='neighbourhood', renderer='json',
+    decorator=conditional())
+def neighbourhood(request):
+    sid = request.matchdict['id']
+    files = request.dependencies.getRepository()
+    pipeline = request.dependencies.getPipelineFactory()
+    targetFile = files.byId(sid)
+    if not targetFile:
+        raise HTTPNotFound
+    return pipeline.neighbourhood(targetFile, 
+        depth=_number(request, 'depth', 1), 
+        fanout=_number(request, 'fanout', FANOUT, minimum=1),
+        transformation=request.GET.get('transformation'),
+        start=_number(request, 'start', 0))
+
+@view_config(route_name='subject', renderer='templates/list.mako',
+    decorator=conditional())
 def subject(request):
     subj = request.matchdict['subject']
     query = request.dependencies.getQuery()
     return {'images':query.bySubject(subj)}
 
-@view_config(route_name='project', renderer='templates/list.mako')
+@view_config(route_name='project', renderer='templates/list.mako',
+    decorator=conditional())
 def project(request):
     project = request.matchdict['project']
     query = request.dependencies.getQuery()
     return {'images':query.byProject(project)}
 
-@view_config(route_name='user', renderer='templates/list.mako')
+@view_config(route_name='user', renderer='templates/list.mako',
+    decorator=conditional())
 def user(request):
     user = request.matchdict['user']
     query = request.dependencies.getQuery()
     return {'images':query.byUser(user)}
 
-@view_config(route_name='modality', renderer='templates/list.mako')
+@view_config(route_name='modality', renderer='templates/list.mako',
+    decorator=conditional())
 def modality(request):
     modality = request.matchdict['modality']
     query = request.dependencies.getQuery()
     return {'images':query.byModality(modality)}
 
-@view_config(route_name='search', renderer='templates/list.mako')
+@view_config(route_name='search', renderer='templates/list.mako',
+    decorator=conditional())
 def search(request):
     text = request.GET['text']
-    results = searching.search(text, request.dependencies)
-    return {'images':results, 'searchtext':text}
+    start = _number(request, 'start', 0)
+    results = searching.search(text, PAGESIZE, start, request.dependencies)
+    more = start + PAGESIZE if len(results) == PAGESIZE else None
+    return {'images':results, 'searchtext':text, 'more':more}
 
-@view_config(route_name='modalities', renderer='templates/category.mako')
+@view_config(route_name='modalities', renderer='templates/category.mako',
+    decorator=conditional(keep=True))
 def modalities(request):
     query = request.dependencies.getQuery()
     return {'category':'modality', 'categoryPlural':'modalities', 
-            'items':query.allModalities()}
+            'items':query.facet('modality')}
 
-@view_config(route_name='projects', renderer='templates/category.mako')
+@view_config(route_name='projects', renderer='templates/category.mako',
+    decorator=conditional(keep=True))
 def projects(request):
     query = request.dependencies.getQuery()
     return {'category':'project', 'categoryPlural':'projects', 
-            'items':query.allProjects()}
+            'items':query.facet('project')}
 
-@view_config(route_name='users', renderer='templates/category.mako')
+@view_config(route_name='users', renderer='templates/category.mako',
+    decorator=conditional(keep=True))
 def users(request):
     query = request.dependencies.getQuery()
     return {'category':'user', 'categoryPlural':'users', 
-            'items':query.allUsers()}
+            'items':query.facet('user')}
 
 
+def _number(request, name, default, minimum=0):
+    """Integer query parameter, at least minimum; 400 if it is not one."""
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        raise HTTPBadRequest('{0} must be a whole number'.format(name))
+    return max(minimum, value)
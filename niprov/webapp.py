@@ -24,6 +24,7 @@ def main(global_config, **settings):
     config.add_route('stats', '/stats')
     config.add_route('short', '/id/{id}')
     config.add_route('pipeline', '/id/{id}/pipeline')
+    config.add_route('neighbourhood', '/id/{id}/pipeline.json')
     config.add_route('location', '/locations/{host}*path')
     config.add_route('modality', '/modalities/{modality}')
     config.add_route('subject', '/subjects/{subject}')
@@ -0,0 +1,37 @@
+"""Measure how many records per second are turned into file objects, with 
+components reused by Dependencies, and with new components for every record 
+as before they were memoized.
+
+Usage: python scripts/benchmark-dependencies.py [nrecords]
+"""
+import sys, time
+from datetime import datetime
+from niprov.dependencies import Dependencies
+
+
+class UnmemoizedDependencies(Dependencies):
+
+    def _scoped(self, name, create):
+        return create()
+
+    def _singleton(self, name, create):
+        return create()
+
+
+def recordsPerSecond(dependencies, records):
+    start = time.time()
+    factory = dependencies.getFileFactory()
+    for record in records:
+        factory.fromProvenance(dict(record))
+    return len(records) / (time.time() - start)
+
+
+nrecords = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+records = [{'location':'localhost:/data/sub{0}/f{1}.nii'.format(r % 50, r), 
+    'id':str(r), 'added':datetime.now(), 'size':1000+r} 
+    for r in range(nrecords)]
+before = recordsPerSecond(UnmemoizedDependencies(), records)
+after = recordsPerSecond(Dependencies(), records)
+print('{0} records'.format(nrecords))
+print('new components for each record: {0:10.0f} records/s'.format(before))
+print('reused components:              {0:10.0f} records/s'.format(after))
@@ -0,0 +1,36 @@
+"""Measure how many records per second are converted to and from json, with
+each version of the json encoding of datetimes. Only the json conversion is
+timed, not the creation of file objects.
+
+Usage: python scripts/benchmark-jsonformat.py [nrecords]
+"""
+import sys, time
+from datetime import datetime
+from niprov.dependencies import Dependencies
+from niprov.formatjson import JsonFormat, CODECS, json
+
+
+def throughput(codec, records):
+    dependencies = Dependencies()
+    dependencies.getConfiguration().json_codec = codec
+    form = JsonFormat(dependencies)
+    start = time.time()
+    jsonstr = form.encoder.encode(records)
+    encoding = len(records) / (time.time() - start)
+    start = time.time()
+    form.decoder.decode(jsonstr)
+    decoding = len(records) / (time.time() - start)
+    return encoding, decoding, len(jsonstr)
+
+
+nrecords = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+records = [{'location':'localhost:/data/sub{0}/f{1}.nii'.format(r % 50, r),
+    'id':str(r), 'size':1000+r, 'subject':'sub{0}'.format(r % 50),
+    'added':datetime.now(), 'created':datetime.now(),
+    'acquired':datetime.now(), 'parents':['localhost:/data/raw{0}'.format(r)]}
+    for r in range(nrecords)]
+print('{0} records, using {1}'.format(nrecords, json.__name__))
+for codec in sorted(CODECS):
+    encoding, decoding, nbytes = throughput(codec, records)
+    print('codec {0}: encode {1:8.0f} records/s, decode {2:8.0f} records/s, '
+        '{3:6.1f} MB'.format(codec, encoding, decoding, nbytes / 1e6))
@@ -54,3 +54,15 @@ class ConfigurationTests(unittest.TestCase):
         conf = self.createConfiguration()
         self.assertEqual(['a1','b2','c3','d4'], conf.discover_file_extensions)
 
+    def test_Can_deal_with_integers(self):
+        self.ospath.isfile.return_value = True
+        self.parser.getint.side_effect = lambda s, k: 128
+        conf = self.createConfiguration()
+        self.assertEqual(128, conf.picture_cache_memory)
+
+    def test_Counts_changes_to_settings(self):
+        self.ospath.isfile.return_value = False
+        conf = self.createConfiguration()
+        revision = conf._revision
+        conf.verbosity = 'error'
+        self.assertEqual(revision + 1, conf._revision)
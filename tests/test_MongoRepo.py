@@ -1,6 +1,7 @@
 import unittest
-from mock import Mock, patch, sentinel
+from mock import Mock, patch, sentinel, ANY
 from tests.ditest import DependencyInjectionTestBase
+from niprov.querying import Query
 
 
 class MongoRepoTests(DependencyInjectionTestBase):
@@ -11,6 +12,10 @@ class MongoRepoTests(DependencyInjectionTestBase):
         self.db = Mock()
         self.db.provenance.find_one.return_value = {}
         self.db.provenance.find.return_value = {}
+        self.db.versions.index_information.return_value = {}
+        self.db.statistics.index_information.return_value = {}
+        self.db.statistics.find_one.return_value = {'facet':'', 'value':'', 
+            'count':3, 'totalsize':15}
         self.pymongo = None
 
     def setupRepo(self):
@@ -21,11 +26,38 @@ class MongoRepoTests(DependencyInjectionTestBase):
 
     def test_Connection(self):
         from niprov.mongo import MongoRepository
+        self.config.database_pool_size = 50
+        self.config.database_pool_min = 2
         with patch('niprov.mongo.pymongo') as pymongo:
             repo = MongoRepository(dependencies=self.dependencies)
-        pymongo.MongoClient.assert_called_with(self.config.database_url)
+        pymongo.MongoClient.assert_called_with(self.config.database_url,
+            maxPoolSize=50, minPoolSize=2, event_listeners=ANY, connect=False)
         self.assertEqual(pymongo.MongoClient().get_default_database(), repo.db)
 
+    def test_Client_is_shared_within_process_but_not_after_fork(self):
+        from niprov.mongo import connect
+        with patch('niprov.mongo.pymongo') as pymongo:
+            pymongo.MongoClient.side_effect = lambda *a, **kw: Mock()
+            with patch('niprov.mongo.os.getpid', return_value=1):
+                client = connect(self.config)
+                self.assertIs(client, connect(self.config))
+            with patch('niprov.mongo.os.getpid', return_value=2):
+                self.assertIsNot(client, connect(self.config))
+        self.assertEqual(2, pymongo.MongoClient.call_count)
+
+    def test_poolStatistics_counts_connection_events(self):
+        from niprov.mongo import connect, poolStatistics
+        with patch('niprov.mongo.pymongo') as pymongo:
+            connect(self.config)
+        counter = pymongo.MongoClient.call_args[1]['event_listeners'][0]
+        counter.connection_created(Mock())
+        counter.connection_created(Mock())
+        counter.connection_checked_out(Mock())
+        stats = poolStatistics()[self.config.database_url]
+        self.assertEqual(2, stats['open'])
+        self.assertEqual(1, stats['in-use'])
+        self.assertEqual(1, stats['checked-out'])
+
     def test_byLocation_returns_img_from_record_with_path(self):
         self.setupRepo()
         p = '/p/f1'
@@ -57,6 +89,7 @@ class MongoRepoTests(DependencyInjectionTestBase):
         self.setupRepo()
         img = Mock()
         img.provenance = {'a':1, 'b':2}
+        img.replacedVersions = []
         self.repo.add(img)
         self.db.provenance.insert_one.assert_called_with({'a':1, 'b':2})
 
@@ -64,20 +97,66 @@ class MongoRepoTests(DependencyInjectionTestBase):
         self.setupRepo()
         img = Mock()
         img.provenance = {'a':1, 'b':2}
+        img.replacedVersions = []
         self.repo.update(img)
         self.db.provenance.update.assert_called_with(
             {'location':img.location.toString()}, {'a':1, 'b':2})
 
+    def test_Replacing_document_keeps_stored_snapshot_if_not_cached(self):
+        self.setupRepo()
+        img = Mock()
+        img.location.toString.return_value = 'h:/f'
+        img.provenance = {'a':1}
+        img.replacedVersions = []
+        def find(query, projection=None):
+            if '_snapshot-data' in query:
+                return [{'location':'h:/f', '_snapshot-data':'png'}]
+            return []
+        self.db.provenance.find.side_effect = find
+        self.repo.update(img)
+        self.db.provenance.update.assert_called_with({'location':'h:/f'},
+            {'a':1, '_snapshot-data':'png'})
+        self.pictureCache.getBytes.return_value = 'new'
+        with patch('niprov.mongo.bson') as bson:
+            bson.Binary.side_effect = lambda b: b
+            self.repo.update(img)
+        self.db.provenance.update.assert_called_with({'location':'h:/f'},
+            {'a':1, '_snapshot-data':'new'})
+
     def test_all(self):
-        self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p
+        self.fileFactory.recordFromProvenance.side_effect = lambda p: 'img_'+p
         self.db.provenance.find.return_value = ['p1', 'p2']
         self.setupRepo()
         out = self.repo.all()
-        self.db.provenance.find.assert_called_with()
-        self.fileFactory.fromProvenance.assert_any_call('p1')
-        self.fileFactory.fromProvenance.assert_any_call('p2')
+        self.db.provenance.find.assert_called_with(
+            projection={'_snapshot-data':False})
+        self.fileFactory.recordFromProvenance.assert_any_call('p1')
+        self.fileFactory.recordFromProvenance.assert_any_call('p2')
         self.assertEqual(['img_p1', 'img_p2'], out)
 
+    def test_iterAll_uses_cursor_with_batch_size(self):
+        self.fileFactory.recordFromProvenance.side_effect = lambda p: 'img_'+p
+        self.db.provenance.find.return_value = iter(['p1', 'p2'])
+        self.setupRepo()
+        out = self.repo.iterAll(batchsize=50)
+        self.db.provenance.find.assert_called_with(
+            projection={'_snapshot-data':False}, batch_size=50)
+        self.assertEqual('img_p1', next(out))
+        self.assertEqual(1, self.fileFactory.recordFromProvenance.call_count)
+        self.assertEqual(['img_p2'], list(out))
+
+    def test_iterAll_projection_and_sort(self):
+        self.setupRepo()
+        cursor = Mock()
+        cursor.sort.return_value = ['p1']
+        self.db.provenance.find.return_value = cursor
+        with patch('niprov.mongo.pymongo') as pymongo:
+            out = list(self.repo.iterAll(projection=['size'], sort='-added'))
+        self.db.provenance.find.assert_called_with(
+            projection={'size':True, 'location':True}, batch_size=500)
+        cursor.sort.assert_called_with('added', pymongo.DESCENDING)
+        self.assertEqual(1, len(out))
+
     def test_updateApproval(self):
         self.setupRepo()
         img = Mock()
@@ -87,38 +166,104 @@ class MongoRepoTests(DependencyInjectionTestBase):
         self.db.provenance.update.assert_called_with(
             {'location':p}, {'$set': {'approval': newStatus}})
 
+    def test_Writes_increment_revision(self):
+        self.setupRepo()
+        self.repo.updateApproval('/p/f1', 'oh-oh')
+        self.db.revision.update_one.assert_called_with({'_id':'revision'},
+            {'$inc':{'number':1}}, upsert=True)
+
+    def test_revision(self):
+        self.setupRepo()
+        self.db.revision.find_one.return_value = {'_id':'revision', 
+            'number':5}
+        self.assertEqual(5, self.repo.revision())
+        self.db.revision.find_one.return_value = None
+        self.assertEqual(0, self.repo.revision())
+
     def test_latest(self):
-        self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p
+        self.fileFactory.recordFromProvenance.side_effect = lambda p: 'img_'+p
         self.db.provenance.find.return_value = Mock()
         self.db.provenance.find.return_value.sort.return_value.limit.return_value = ['px','py']
         self.setupRepo()
         out = self.repo.latest()
-        self.db.provenance.find.assert_called_with()
+        self.db.provenance.find.assert_called_with(
+            projection={'_snapshot-data':False})
         self.db.provenance.find().sort.assert_called_with('added', -1)
         self.db.provenance.find().sort().limit.assert_called_with(20)
-        self.fileFactory.fromProvenance.assert_any_call('px')
-        self.fileFactory.fromProvenance.assert_any_call('py')
+        self.fileFactory.recordFromProvenance.assert_any_call('px')
+        self.fileFactory.recordFromProvenance.assert_any_call('py')
         self.assertEqual(['img_px', 'img_py'], out)
 
     def test_statistics(self):
-        self.db.provenance.aggregate.return_value = [sentinel.stats,]
         self.setupRepo()
         out = self.repo.statistics()
-        self.db.provenance.aggregate.assert_called_with(
-           [{'$group':
-                 {
-                   '_id': None,
-                   'totalsize': { '$sum': '$size' },
-                   'count': { '$sum': 1 }
-                 }
-            }])
-        self.assertEqual(sentinel.stats, out)
-
-    def test_statistics_if_no_records(self):
-        self.db.provenance.aggregate.return_value = []
+        self.db.statistics.find_one.assert_called_with({'facet':'', 
+            'value':''})
+        self.assertEqual({'count':3, 'totalsize':15}, out)
+        assert not self.db.provenance.aggregate.called
+
+    def test_facet(self):
         self.setupRepo()
-        out = self.repo.statistics()
-        self.assertEqual({'count':0}, out)
+        self.db.statistics.find.return_value = [
+            {'facet':'modality', 'value':'MRI', 'count':2, 'totalsize':10}]
+        out = self.repo.facet('modality')
+        self.db.statistics.find.assert_called_with({'facet':'modality'})
+        self.assertEqual({'MRI':{'count':2, 'totalsize':10}}, out)
+
+    def test_Counts_tallies_if_statistics_collection_is_empty(self):
+        self.db.statistics.find_one.return_value = None
+        self.db.provenance.find.return_value = [
+            {'modality':'MRI', 'size':4}, {'modality':'EEG', 'size':6}]
+        self.setupRepo()
+        self.repo.statistics()
+        self.db.provenance.find.assert_called_with(projection={
+            'modality':True, 'project':True, 'subject':True, 'user':True,
+            'acquired':True, 'size':True}, batch_size=500)
+        self.db.statistics.delete_many.assert_called_with({})
+        docs = self.db.statistics.insert_many.call_args[0][0]
+        self.assertIn({'facet':'', 'value':'', 'count':2, 'totalsize':10}, 
+            docs)
+        self.assertIn({'facet':'modality', 'value':'EEG', 'count':1, 
+            'totalsize':6}, docs)
+        self.db.statistics.insert_many.reset_mock()
+        self.db.statistics.find.return_value = []
+        self.repo.facet('modality')
+        assert not self.db.statistics.insert_many.called
+
+    def test_Counts_tallies_of_empty_statistics_before_saving(self):
+        self.db.statistics.find_one.return_value = None
+        self.setupRepo()
+        saved = []
+        self.db.provenance.insert_one.side_effect = saved.append
+        self.db.provenance.find.side_effect = lambda **kw: list(saved)
+        img = Mock()
+        img.provenance = {'modality':'EEG', 'size':4}
+        img.replacedVersions = []
+        with patch('niprov.mongo.pymongo') as pymongo:
+            self.repo.add(img)
+        self.assertEqual([{'facet':'', 'value':'', 'count':0, 'totalsize':0}],
+            self.db.statistics.insert_many.call_args[0][0])
+        pymongo.UpdateOne.assert_any_call({'facet':'', 'value':''}, 
+            {'$inc':{'count':1, 'totalsize':4}}, upsert=True)
+
+    def test_Saving_increments_tallies_of_new_and_decrements_those_of_old(self):
+        self.setupRepo()
+        self.db.provenance.find.side_effect = lambda q, projection: (
+            [] if '_snapshot-data' in q else [{'modality':'MRI', 'size':4}])
+        img = Mock()
+        img.provenance = {'modality':'EEG', 'size':4}
+        img.replacedVersions = []
+        with patch('niprov.mongo.pymongo') as pymongo:
+            self.repo.update(img)
+        self.db.provenance.find.assert_any_call({'location':{'$in':
+            [img.location.toString()]}}, projection=ANY)
+        pymongo.UpdateOne.assert_any_call({'facet':'modality', 
+            'value':'EEG'}, {'$inc':{'count':1, 'totalsize':4}}, upsert=True)
+        pymongo.UpdateOne.assert_any_call({'facet':'modality', 
+            'value':'MRI'}, {'$inc':{'count':-1, 'totalsize':-4}}, upsert=True)
+        self.assertEqual(2, pymongo.UpdateOne.call_count)
+        self.db.statistics.delete_many.assert_called_with({'count':
+            {'$lte':0}, 'facet':{'$ne':''}})
 
     def test_byId(self):
         self.setupRepo()
@@ -136,6 +281,83 @@ class MongoRepoTests(DependencyInjectionTestBase):
         assert not self.fileFactory.fromProvenance.called
         self.assertEqual(None, out)
 
+    def test_addMany_and_updateMany(self):
+        self.setupRepo()
+        img1, img2 = Mock(), Mock()
+        img1.provenance = {'a':1}
+        img2.provenance = {'a':2}
+        img1.replacedVersions = img2.replacedVersions = []
+        self.repo.addMany([img1, img2])
+        self.db.provenance.insert_many.assert_called_with([{'a':1}, {'a':2}])
+        with patch('niprov.mongo.pymongo') as pymongo:
+            self.repo.updateMany([img1, img2])
+        pymongo.ReplaceOne.assert_any_call(
+            {'location':img2.location.toString()}, {'a':2})
+        self.db.provenance.bulk_write.assert_called_with(
+            [pymongo.ReplaceOne(), pymongo.ReplaceOne()])
+
+    def test_Versions_are_inserted_in_versions_collection(self):
+        self.config.versions_kept = 0
+        self.setupRepo()
+        img = Mock()
+        img.provenance = {'location':'1', 'v':2}
+        img.location.toString.return_value = '1'
+        img.replacedVersions = [{'location':'1', 'v':1}]
+        self.repo.update(img)
+        self.db.versions.insert_many.assert_called_with(
+            [{'location':'1', 'delta':{'set':{'v':1}}}])
+        assert not self.db.versions.delete_many.called
+
+    def test_Prunes_versions_beyond_versions_kept(self):
+        self.config.versions_kept = 2
+        self.setupRepo()
+        self.db.versions.distinct.return_value = ['1']
+        cursor = self.db.versions.find.return_value.sort.return_value
+        cursor.skip.return_value = [{'_id':'a'}, {'_id':'b'}]
+        self.assertEqual(2, self.repo.pruneVersions())
+        cursor.skip.assert_called_with(2)
+        self.db.versions.delete_many.assert_called_with(
+            {'_id':{'$in':['a', 'b']}})
+
+    def test_versionsOf_restores_from_latest_delta(self):
+        self.setupRepo()
+        img = Mock()
+        img.provenance = {'v':3}
+        cursor = self.db.versions.find.return_value
+        cursor.sort.return_value = [{'delta':{'set':{'v':2}}}, 
+            {'delta':{'set':{'v':1}}}]
+        self.assertEqual([{'v':1}, {'v':2}], self.repo.versionsOf(img))
+        self.db.versions.find.assert_called_with(
+            {'location':img.location.toString()}, projection={'delta':True})
+
+    def test_addMany_and_updateMany_skip_empty_lists(self):
+        self.setupRepo()
+        self.repo.addMany([])
+        self.repo.updateMany([])
+        assert not self.db.provenance.insert_many.called
+        assert not self.db.provenance.bulk_write.called
+
+    def test_extendSeries_pushes_new_files_and_sets_dimensions(self):
+        self.setupRepo()
+        series = Mock()
+        series.provenance = {'dimensions':[1, 2, 5]}
+        with patch('niprov.mongo.pymongo') as pymongo:
+            self.repo.extendSeries([(series, ['f4', 'f5'])])
+        pymongo.UpdateOne.assert_called_with(
+            {'location':series.location.toString()},
+            {'$push':{'filesInSeries':{'$each':['f4', 'f5']}},
+             '$set':{'dimensions':[1, 2, 5]}})
+        self.db.provenance.bulk_write.assert_called_with([pymongo.UpdateOne()])
+        assert not self.db.provenance.update.called
+
+    def test_byFieldValues(self):
+        self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p
+        self.db.provenance.find.return_value = ['p1', 'p2']
+        self.setupRepo()
+        out = self.repo.byFieldValues('hash', ['h1','h2'])
+        self.db.provenance.find.assert_called_with({'hash':{'$in':['h1','h2']}})
+        self.assertEqual(['img_p1', 'img_p2'], out)
+
     def test_byLocations(self):
         self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p
         self.db.provenance.find.return_value = ['p1', 'p2']
@@ -147,13 +369,14 @@ class MongoRepoTests(DependencyInjectionTestBase):
         self.assertEqual(['img_p1', 'img_p2'], out)
 
     def test_byParents(self):
-        self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p
+        self.fileFactory.recordFromProvenance.side_effect = lambda p: 'img_'+p
         self.db.provenance.find.return_value = ['p1', 'p2']
         self.setupRepo()
         out = self.repo.byParents(['x1','x2'])
-        self.db.provenance.find.assert_called_with({'parents':{'$in':['x1','x2']}})
-        self.fileFactory.fromProvenance.assert_any_call('p1')
-        self.fileFactory.fromProvenance.assert_any_call('p2')
+        self.db.provenance.find.assert_called_with({'parents':{'$in':['x1','x2']}},
+            projection={'_snapshot-data':False})
+        self.fileFactory.recordFromProvenance.assert_any_call('p1')
+        self.fileFactory.recordFromProvenance.assert_any_call('p2')
         self.assertEqual(['img_p1', 'img_p2'], out)
 
     def test_Obtains_optional_snapshot_data_from_cache_when_serializing(self):
@@ -163,18 +386,30 @@ class MongoRepoTests(DependencyInjectionTestBase):
             self.setupRepo()
             img = Mock()
             img.provenance = {'a':1}
+            img.replacedVersions = []
             self.repo.add(img)
             self.pictureCache.getBytes.assert_called_with(for_=img)
             bson.Binary.assert_called_with(sentinel.snapbytes)
             self.db.provenance.insert_one.assert_called_with({'a':1, 
                 '_snapshot-data':sentinel.snapbson})
 
+    def test_Document_is_shallow_copy_of_provenance(self):
+        self.pictureCache.getBytes.return_value = sentinel.snapbytes
+        with patch('niprov.mongo.bson') as bson:
+            self.setupRepo()
+            img = Mock()
+            img.provenance = {'a':1, '_versions':[{'a':0}]}
+            doc = self.repo.deflate(img)
+        self.assertNotIn('_snapshot-data', img.provenance)
+        self.assertIs(img.provenance['_versions'], doc['_versions'])
+
     def test_If_no_snapshot_doesnt_add_data_field(self):
         self.pictureCache.getBytes.return_value = None
         with patch('niprov.mongo.bson') as bson:
             self.setupRepo()
             img = Mock()
             img.provenance = {'a':1}
+            img.replacedVersions = []
             self.repo.add(img)
             assert not bson.Binary.called
             self.db.provenance.insert_one.assert_called_with({'a':1})
@@ -194,42 +429,100 @@ class MongoRepoTests(DependencyInjectionTestBase):
     def test_Query(self):
         self.db.provenance.find.return_value = ['record1']
         self.setupRepo()
-        q = Mock()
-        field1 = Mock()
-        field1.name = 'color'
-        field1.value = 'red'
-        field1.all = False
-        q.getFields.return_value = [field1]
+        q = Query(self.dependencies).where('color', 'red')
         out = self.repo.inquire(q)
-        self.db.provenance.find.assert_called_with({'color':'red'})
-        self.fileFactory.fromProvenance.assert_called_with('record1')
+        self.db.provenance.find.assert_called_with({'color':'red'},
+            projection={'_snapshot-data':False})
+        self.fileFactory.recordFromProvenance.assert_called_with('record1')
 
-    def test_Ensures_text_index_for_search(self):
+    def test_Search_does_not_create_index(self):
+        cursor = self.db.provenance.find.return_value = Mock()
+        cursor.sort.return_value.skip.return_value.limit.return_value = []
         self.setupRepo()
         self.repo.search('')
+        assert not self.db.provenance.create_index.called
+
+    def test_Ensures_indexes_once_per_database_on_connection(self):
+        import niprov.mongo
+        niprov.mongo._ENSURED.clear()
+        from niprov.mongo import MongoRepository
+        with patch('niprov.mongo.pymongo') as pymongo:
+            db = pymongo.MongoClient().get_default_database()
+            db.provenance.index_information.return_value = {'_id_':{}, 
+                'location':{}}
+            MongoRepository(dependencies=self.dependencies)
+            MongoRepository(dependencies=self.dependencies)
+        self.assertEqual(1, db.provenance.index_information.call_count)
+        names = [c[1]['name'] for c in db.provenance.create_index.call_args_list]
+        self.assertNotIn('location', names)
+        self.assertIn('textsearch', names)
+        db.provenance.create_index.assert_any_call([('id', 1)], name='id',
+            unique=True, partialFilterExpression={'id':{'$exists':True}})
         searchfields = ['location','user','subject','project','protocol',
                   'transformation','technique','modality']
         indexspec = [(field, 'text') for field in searchfields]
-        self.db.provenance.create_index.assert_called_with(indexspec, 
-                                                           name='textsearch')
+        db.provenance.create_index.assert_any_call(indexspec, 
+            name='textsearch')
+
+    def test_ensureIndexes_tells_listener_if_index_fails(self):
+        self.setupRepo()
+        self.db.provenance.index_information.return_value = {}
+        def create_index(keys, name, **options):
+            if name == 'location':
+                raise ValueError('duplicate key')
+        self.db.provenance.create_index.side_effect = create_index
+        with patch('niprov.mongo.pymongo.errors.PyMongoError', ValueError):
+            created = self.repo.ensureIndexes()
+        self.assertNotIn('location', created)
+        self.assertIn('id', created)
+        self.listener.indexFailed.assert_called_with('location', ANY)
+
+    def test_reindex_drops_and_recreates_declared_indexes(self):
+        self.setupRepo()
+        self.db.provenance.index_information.side_effect = [
+            {'_id_':{}, 'hash':{}, 'other':{}}, {'_id_':{}, 'other':{}}]
+        created = self.repo.reindex()
+        self.db.provenance.drop_index.assert_called_once_with('hash')
+        self.assertIn('hash', created)
 
     def test_Search(self):
-        self.db.provenance.find.return_value = ['r1','r2']
+        cursor = self.db.provenance.find.return_value = Mock()
+        cursor.sort.return_value.skip.return_value.limit.return_value = [
+            {'a':1, '_score':2.5}, {'a':2, '_score':1.5}]
+        self.setupRepo()
+        self.repo.search('xyz', 10, 30)
+        self.db.provenance.find.assert_called_with({'$text':{'$search': 'xyz'}},
+            projection={'_snapshot-data':False, '_score':{'$meta':'textScore'}})
+        cursor.sort.assert_called_with([('_score', {'$meta':'textScore'})])
+        cursor.sort().skip.assert_called_with(30)
+        cursor.sort().skip().limit.assert_called_with(10)
+        self.fileFactory.recordFromProvenance.assert_any_call({'a':1})
+        self.fileFactory.recordFromProvenance.assert_any_call({'a':2})
+
+    def test_Compound_query_is_done_by_server(self):
+        cursor = Mock()
+        cursor.sort.return_value.skip.return_value.limit.return_value = ['r']
+        self.db.provenance.find.return_value = cursor
+        self.db.provenance.count_documents.return_value = 12
         self.setupRepo()
-        self.repo.search('xyz')
-        self.db.provenance.find.assert_called_with({'$text':{'$search': 'xyz'}})
-        self.fileFactory.fromProvenance.assert_any_call('r1')
-        self.fileFactory.fromProvenance.assert_any_call('r2')
+        q = Query(self.dependencies).bySubject('a').sizeBetween(10)
+        q.sortBy('-size').offset(5).limit(2)
+        out = self.repo.inquire(q)
+        expected = {'$and':[{'subject':'a'}, {'size':{'$gte':10}}]}
+        self.db.provenance.find.assert_called_with(expected,
+            projection={'_snapshot-data':False})
+        cursor.sort.assert_called_with('size', -1)
+        cursor.sort().skip.assert_called_with(5)
+        cursor.sort().skip().limit.assert_called_with(2)
+        self.fileFactory.recordFromProvenance.assert_called_with('r')
+        self.assertEqual(12, self.repo.count(q))
+        self.db.provenance.count_documents.assert_called_with(expected)
 
     def test_Query_for_ALL_field(self):
         self.db.provenance.distinct.return_value = ['r1','r2']
         self.setupRepo()
-        q = Mock()
-        field1 = Mock()
-        field1.name = 'color'
-        field1.all = True
-        q.getFields.return_value = [field1]
+        q = Query(self.dependencies).allValues('color')
         out = self.repo.inquire(q)
-        self.db.provenance.distinct.assert_called_with('color')
+        self.db.provenance.distinct.assert_called_with('color', {})
         assert not self.fileFactory.fromProvenance.called
 
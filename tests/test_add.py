@@ -132,7 +132,8 @@ class AddTests(DependencyInjectionTestBase):
         self.repo.getSeries.return_value = series
         image = self.add('p/afile.f')
         series.mergeWith.assert_called_with(self.img)
-        self.repo.update.assert_any_call(series)
+        self.repo.extendSeries.assert_called_with([(series, [self.img.path])])
+        assert not self.repo.update.called
 
     def test_If_file_not_version_but_series_has_file(self):               # D2
         series = Mock()
@@ -189,3 +190,173 @@ class AddTests(DependencyInjectionTestBase):
 
         
 
+
+
+class FakeImage(object):
+
+    def __init__(self, location, provenance=None, series=None):
+        self.location = Mock()
+        self.location.toString.return_value = location
+        self.location.path = location
+        self.path = location
+        self.provenance = provenance or {}
+        self.status = 'new'
+        self.series = series
+        self.inspect = Mock()
+
+    def getSeriesId(self):
+        return self.series
+
+    def keepVersionsFromPrevious(self, previous):
+        self.status = 'new-version'
+
+
+class AddManyTests(DependencyInjectionTestBase):
+
+    def setUp(self):
+        super(AddManyTests, self).setUp()
+        self.config.dryrun = False
+        self.config.attach = False
+        self.repo.byLocations.return_value = []
+        self.repo.byFieldValues.return_value = []
+        self.images = {}
+        def locAt(loc, provenance):
+            self.images[loc] = FakeImage(loc, provenance,
+                series=provenance.pop('_series', None))
+            return self.images[loc]
+        self.fileFactory.locatedAt.side_effect = locAt
+
+    def addMany(self, paths, **kwargs):
+        from niprov.adding import addMany
+        with patch('niprov.adding.inheritFrom') as self.inheritFrom:
+            return addMany(paths, dependencies=self.dependencies, **kwargs)
+
+    def test_Unknown_files_are_added_with_one_call(self):
+        out = self.addMany(['a', 'b'])
+        self.assertEqual(['a', 'b'], [i.path for i in out])
+        self.repo.addMany.assert_called_with(out)
+        assert not self.repo.updateMany.called
+        self.repo.byLocations.assert_called_with(['a', 'b'])
+        assert not self.repo.add.called
+        self.assertEqual(2, self.listener.fileAdded.call_count)
+
+    def test_File_in_batch_twice_is_registered_once_as_last(self):
+        from niprov.adding import registerMany
+        first, other = FakeImage('a', {'v':1}), FakeImage('b')
+        last = FakeImage('a', {'v':2})
+        with patch('niprov.adding.inheritFrom'):
+            out = registerMany([first, other, last], 
+                dependencies=self.dependencies)
+        self.assertEqual([last, other, last], out)
+        self.repo.addMany.assert_called_with([last, other])
+        self.assertEqual('new', last.status)
+
+    def test_Each_file_gets_its_own_provenance(self):
+        out = self.addMany(['a', 'b'], provenance={'fob':'bez'})
+        self.assertEqual('bez', out[1].provenance['fob'])
+        self.assertIsNot(out[0].provenance, out[1].provenance)
+
+    def test_Known_files_are_updated_as_new_version(self):
+        self.repo.byLocations.return_value = [FakeImage('b')]
+        out = self.addMany(['a', 'b'])
+        self.repo.addMany.assert_called_with([out[0]])
+        self.repo.updateMany.assert_called_with([out[1]])
+        self.assertEqual('new-version', out[1].status)
+
+    def test_Failed_files_are_returned_but_not_saved(self):
+        self.filesys.fileExists.return_value = True
+        def inspect():
+            raise ValueError
+        def locAt(loc, provenance):
+            img = FakeImage(loc, provenance)
+            if loc == 'b':
+                img.inspect.side_effect = inspect
+            return img
+        self.fileFactory.locatedAt.side_effect = locAt
+        out = self.addMany(['a', 'b'])
+        self.assertEqual('failed', out[1].status)
+        self.repo.addMany.assert_called_with([out[0]])
+        self.listener.fileError.assert_called_with('b')
+
+    def test_If_dryrun_doesnt_talk_to_repo(self):
+        self.config.dryrun = True
+        out = self.addMany(['a', 'b'])
+        self.assertEqual(2, len(out))
+        assert not self.repo.addMany.called
+        assert not self.repo.byLocations.called
+
+    def seriesImage(self, location, provenance=None):
+        series = FakeImage(location, provenance, series='s1')
+        series.provenance['filesInSeries'] = [location]
+        series.hasFile = lambda i: i.path in series.provenance['filesInSeries']
+        def mergeWithMany(images):
+            series.provenance['filesInSeries'].extend([i.path for i in images])
+            series.status = 'series-new-file'
+            return series
+        series.mergeWithMany = Mock(side_effect=mergeWithMany)
+        return series
+
+    def test_Slices_of_new_series_are_merged_into_first_at_once(self):
+        self.fileFactory.locatedAt.side_effect = lambda loc, provenance: (
+            self.seriesImage(loc, provenance))
+        out = self.addMany(['a', 'b', 'c'])
+        series = out[0]
+        self.assertEqual([series, series, series], out)
+        self.assertEqual(1, series.mergeWithMany.call_count)
+        self.assertEqual(['a', 'b', 'c'], series.provenance['filesInSeries'])
+        self.repo.addMany.assert_called_with([series])
+        assert not self.repo.updateMany.called
+        assert not self.repo.extendSeries.called
+
+    def test_Known_series_is_looked_up_once_and_only_new_slices_saved(self):
+        series = self.seriesImage('x')
+        def byFieldValues(field, values):
+            if field == 'seriesuid':
+                self.assertEqual(['s1'], values)
+                return [series]
+            return []
+        self.repo.byFieldValues.side_effect = byFieldValues
+        self.fileFactory.locatedAt.side_effect = lambda loc, provenance: (
+            FakeImage(loc, provenance, series='s1'))
+        out = self.addMany(['a', 'b'])
+        self.assertEqual([series, series], out)
+        self.assertEqual('series-new-file', series.status)
+        assert not self.repo.addMany.called
+        assert not self.repo.updateMany.called
+        self.repo.extendSeries.assert_called_with([(series, ['a', 'b'])])
+
+    def test_Copies_found_by_hash_become_parent(self):
+        copy = FakeImage('c', {'hash':'h1', 'size':10})
+        def byFieldValues(field, values):
+            if field == 'hash':
+                self.assertEqual(['h1'], values)
+                return [copy]
+            return []
+        self.repo.byFieldValues.side_effect = byFieldValues
+        imgs = [FakeImage('a', {'hash':'h1', 'size':10})]
+        from niprov.adding import registerMany
+        with patch('niprov.adding.inheritFrom') as inheritFrom:
+            out = registerMany(imgs, dependencies=self.dependencies)
+        self.assertEqual(['c'], out[0].provenance['parents'])
+        self.assertEqual(True, out[0].provenance['copy-as-parent'])
+        inheritFrom.assert_called_with(imgs[0].provenance, copy.provenance)
+        self.listener.usingCopyAsParent.assert_called_with(copy)
+
+    def test_Copies_within_batch_are_found(self):
+        imgs = [FakeImage(l, {'hash':'h1', 'size':10}) for l in 'ab']
+        from niprov.adding import registerMany
+        with patch('niprov.adding.inheritFrom'):
+            out = registerMany(imgs, dependencies=self.dependencies)
+        self.assertNotIn('parents', out[0].provenance)
+        self.assertEqual(['a'], out[1].provenance['parents'])
+
+    def test_Copies_by_sample_digest_are_confirmed(self):
+        copy = FakeImage('c', {'hash-sample':'s', 'size':10})
+        self.repo.byFieldValues.side_effect = lambda f, v: (
+            [copy] if f == 'hash-sample' else [])
+        imgs = [FakeImage('a', {'hash-sample':'s', 'size':10})]
+        self.hasher.sameContent.return_value = False
+        from niprov.adding import registerMany
+        out = registerMany(imgs, dependencies=self.dependencies)
+        self.hasher.sameContent.assert_called_with(imgs[0], copy)
+        self.assertNotIn('parents', out[0].provenance)
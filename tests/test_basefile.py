@@ -28,6 +28,32 @@ class BaseFileTests(DependencyInjectionTestBase):
         out = self.file.inspect()
         self.assertEqual(out['hash'], self.hasher.digest(self.path))
 
+    def test_Records_hash_algorithm_and_only_full_digest(self):
+        out = self.file.inspect()
+        self.assertEqual(out['hash-algorithm'], self.hasher.algorithm)
+        assert not self.hasher.sample.called
+        self.assertNotIn('hash-sample', out)
+
+    def test_With_sampled_hash_strategy_makes_sample_digest_only(self):
+        self.hasher.strategy = 'sampled'
+        out = self.file.inspect()
+        assert not self.hasher.digest.called
+        self.assertNotIn('hash', out)
+        self.assertEqual(out['hash-sample'], self.hasher.sample(self.path))
+
+    def test_Copy_has_its_own_provenance_and_no_pending_versions(self):
+        self.file.provenance['parents'] = ['a']
+        self.file.provenance['kwargs'] = {'b':[1]}
+        self.file.replacedVersions = [{'v':1}]
+        other = self.file.copy()
+        other.provenance['parents'].append('c')
+        other.provenance['kwargs']['b'].append(2)
+        self.assertEqual(['a'], self.file.provenance['parents'])
+        self.assertEqual({'b':[1]}, self.file.provenance['kwargs'])
+        self.assertEqual([], other.replacedVersions)
+        self.assertEqual([{'v':1}], self.file.replacedVersions)
+        self.assertIs(self.constructor, type(other))
+
     def test_Provenance_property_equals_dictionary_returned_by_inspect(self):
         out = self.file.inspect()
         self.assertEqual(out, self.file.provenance)
@@ -114,16 +140,18 @@ class BaseFileTests(DependencyInjectionTestBase):
 
     def test_keepVersionsFromPrevious(self):
         img = self.constructor(self.path, dependencies=self.dependencies)
+        img.provenance['_versions'] = [{'y':1}]
         prev = Mock()
         prev.provenance = {'y':1501, '_versions':[{'y':1499},{'y':1500}]}
         img.keepVersionsFromPrevious(prev)
         self.assertEqual('new-version', img.status)
-        self.assertEqual(3, len(img.provenance['_versions']))
-        self.assertEqual({'y':1501}, img.provenance['_versions'][-1])
-        self.assertEqual({'y':1500}, img.provenance['_versions'][-2])
-        self.assertEqual({'y':1499}, img.provenance['_versions'][-3])
+        self.assertNotIn('_versions', img.provenance)
+        self.assertEqual([{'y':1499},{'y':1500},{'y':1501}], 
+            img.replacedVersions)
+        self.assertIn('_versions', prev.provenance)
 
-    def test_versions_property_access(self):
+    def test_versions_property_asks_repository(self):
         img = self.constructor(self.path, dependencies=self.dependencies)
-        img.provenance = {'_versions':sentinel.versions}
-        self.assertEqual(img.provenance['_versions'], img.versions)
+        self.repo.versionsOf.return_value = sentinel.versions
+        self.assertEqual(sentinel.versions, img.versions)
+        self.repo.versionsOf.assert_called_with(img)
@@ -66,5 +66,35 @@ class CameraTests(DependencyInjectionTestBase):
         camera.takeSnapshot(numpy.zeros([3,3,3]), Mock())
         assert not self.libs.pyplot.ion.called
 
+    def test_Plots_middle_slices_of_first_volume_read_through_proxy(self):
+        from niprov.camera import Camera
+        camera = Camera(self.dependencies)
+        data = numpy.arange(4*6*8*2).reshape([4,6,8,2])
+        indexes = []
+        class Proxy(object):
+            shape = data.shape
+            def __getitem__(self, index):
+                indexes.append(index)
+                return data[index]
+        proxy = Proxy()
+        axs = [Mock(), Mock(), Mock()]
+        self.libs.pyplot.subplots.return_value = [Mock(), axs]
+        self.assertTrue(camera.takeSnapshot(proxy, Mock()))
+        self.assertIn((slice(None), 3, slice(None), 0), indexes)
+        plotted = axs[0].matshow.call_args[0][0]
+        numpy.testing.assert_array_equal(data[:,3,:,0].T, plotted)
+        vmax = max([data[2,:,:,0].max(), data[:,3,:,0].max(), 
+            data[:,:,4,0].max()])
+        self.assertEqual(vmax, axs[2].matshow.call_args[1]['vmax'])
+        self.assertEqual((8, 6), axs[1].matshow.call_args[0][0].shape)
 
-
+    def test_Plots_2D_image_as_it_is(self):
+        from niprov.camera import Camera
+        camera = Camera(self.dependencies)
+        data = numpy.arange(4*6).reshape([4,6])
+        ax = Mock()
+        self.libs.pyplot.subplots.return_value = [Mock(), ax]
+        self.assertTrue(camera.takeSnapshot(data, Mock()))
+        self.assertEqual(1, self.libs.pyplot.subplots.call_args[1]['ncols'])
+        numpy.testing.assert_array_equal(data.T, ax.matshow.call_args[0][0])
+        self.assertEqual(23, ax.matshow.call_args[1]['vmax'])
@@ -34,6 +34,16 @@ class CommandlineTests(DependencyInjectionTestBase):
         cmd.addUnknownParent('backupfile.x')
         cmd.log.assert_called_with('warning', 'backupfile.x unknown. Adding to provenance')
 
+    def test_indexesEnsured(self):
+        from niprov.commandline import Commandline
+        self.dependencies.config.verbosity = 'info'
+        cmd = Commandline(self.dependencies)
+        cmd.log = Mock()
+        cmd.indexesEnsured(['hash', 'id'])
+        cmd.log.assert_called_with('info', 'Created indexes: hash, id')
+        cmd.indexesEnsured([])
+        cmd.log.assert_called_with('info', 'All indexes are in place.')
+
     def test_fileAdded(self):
         from niprov.commandline import Commandline
         self.dependencies.config.verbosity = 'info'
@@ -0,0 +1,86 @@
+import unittest
+from mock import Mock
+from tests.ditest import DependencyInjectionTestBase
+from pyramid.response import Response
+
+
+class ConditionalTests(DependencyInjectionTestBase):
+
+    def setUp(self):
+        super(ConditionalTests, self).setUp()
+        self.config.web_cache_memory = 1
+        self.repo.revision.return_value = 7
+        self.request = Mock()
+        self.request.dependencies = self.dependencies
+        self.request.if_none_match = []
+        self.request.url = 'http://localhost/stats'
+        self.request.matched_route.name = 'stats'
+        self.view = Mock()
+        self.view.return_value = Response(body='<p>page</p>', 
+            content_type='text/html')
+        import niprov.conditional
+        niprov.conditional.clear()
+
+    def etag(self, revision):
+        from niprov.conditional import _VERSION
+        return '{0}-stats-{1}'.format(_VERSION, revision)
+
+    def decorated(self, keep=False):
+        from niprov.conditional import conditional
+        return conditional(keep=keep)(self.view)
+
+    def test_Response_has_etag_from_repository_revision(self):
+        out = self.decorated()(None, self.request)
+        self.assertEqual(self.etag(7), out.etag)
+        self.assertEqual('<p>page</p>', out.body)
+        assert out.cache_control.no_cache
+
+    def test_Not_modified_if_client_has_current_revision(self):
+        self.request.if_none_match = [self.etag(7)]
+        out = self.decorated()(None, self.request)
+        self.assertEqual(304, out.status_int)
+        self.assertEqual(self.etag(7), out.etag)
+        assert not self.view.called
+
+    def test_Renders_again_if_client_has_older_revision(self):
+        self.request.if_none_match = [self.etag(6)]
+        out = self.decorated()(None, self.request)
+        self.assertEqual(200, out.status_int)
+        self.view.assert_called_with(None, self.request)
+
+    def test_Keeps_page_until_revision_changes(self):
+        view = self.decorated(keep=True)
+        view(None, self.request)
+        out = view(None, self.request)
+        self.assertEqual(1, self.view.call_count)
+        self.assertEqual('<p>page</p>', out.body)
+        self.assertEqual('text/html; charset=UTF-8', 
+            out.headers['Content-Type'])
+        self.assertEqual(self.etag(7), out.etag)
+        self.repo.revision.return_value = 8
+        view(None, self.request)
+        self.assertEqual(2, self.view.call_count)
+
+    def test_Pages_are_kept_per_url(self):
+        view = self.decorated(keep=True)
+        view(None, self.request)
+        self.request.url = 'http://localhost/users'
+        view(None, self.request)
+        self.assertEqual(2, self.view.call_count)
+
+    def test_Does_not_keep_pages_unless_asked(self):
+        view = self.decorated()
+        view(None, self.request)
+        view(None, self.request)
+        self.assertEqual(2, self.view.call_count)
+
+    def test_Etag_changes_with_niprov_version_and_route(self):
+        from mock import patch
+        self.request.if_none_match = [self.etag(7)]
+        with patch('niprov.conditional._VERSION', '99.0'):
+            out = self.decorated()(None, self.request)
+        self.assertEqual(200, out.status_int)
+        self.assertEqual('99.0-stats-7', out.etag)
+        self.request.matched_route.name = 'users'
+        out = self.decorated()(None, self.request)
+        self.assertEqual(200, out.status_int)
@@ -22,6 +22,11 @@ class ContextTests(DependencyInjectionTestBase):
         self.niprov.adding.add.assert_called_with('file.p', True, {'c':3},
             self.dependencies)
 
+    def test_addMany(self):
+        self.context.addMany(['f1.p', 'f2.p'], True, {'c':3})
+        self.niprov.adding.addMany.assert_called_with(['f1.p', 'f2.p'], True,
+            {'c':3}, self.dependencies)
+
     def test_log(self):
         self.context.log('new', 'trf', 'parents', 'code', 'logtext', False,
             'script', 'user', {'prov':1}, 'opts')
@@ -33,6 +38,17 @@ class ContextTests(DependencyInjectionTestBase):
         self.context.backup()
         self.niprov.exporting.backup.assert_called_with(self.dependencies)
 
+    def test_ensureIndexes_and_reindex(self):
+        self.context.ensureIndexes()
+        self.niprov.indexing.ensureIndexes.assert_called_with(self.dependencies)
+        self.context.reindex()
+        self.niprov.indexing.reindex.assert_called_with(self.dependencies)
+
+    def test_pruneVersions(self):
+        self.context.pruneVersions()
+        self.niprov.versioning.pruneVersions.assert_called_with(
+            self.dependencies)
+
     def test_export(self):
         self.context.export('prov', 'medium', 'form')
         self.niprov.exporting.export.assert_called_with('prov', 'medium',
@@ -15,16 +15,56 @@ class DependenciesTests(unittest.TestCase):
         dependencies.config.verbosity = 'warning'
         self.assertEqual(dependencies.getListener().verbosity, 'warning')
 
+    def test_Components_are_reused_until_settings_change(self):
+        from niprov.dependencies import Dependencies
+        dependencies = Dependencies()
+        listener = dependencies.getListener()
+        self.assertIs(listener, dependencies.getListener())
+        self.assertIs(dependencies.getHasher(), dependencies.getHasher())
+        dependencies.config.hash_algorithm = 'sha1'
+        self.assertIsNot(listener, dependencies.getListener())
+        self.assertEqual('sha1', dependencies.getHasher().algorithm)
+
+    def test_Components_are_new_for_new_configuration(self):
+        from niprov.dependencies import Dependencies, Configuration
+        dependencies = Dependencies()
+        fileFactory = dependencies.getFileFactory()
+        dependencies.reconfigureOrGetConfiguration(Configuration())
+        self.assertIsNot(fileFactory, dependencies.getFileFactory())
+
+    def test_Process_singletons_are_shared_between_instances(self):
+        from niprov.dependencies import Dependencies
+        one, other = Dependencies(), Dependencies()
+        self.assertIs(one.getLibraries(), other.getLibraries())
+        self.assertIs(one.getFilesystem(), other.getFilesystem())
+        self.assertIsNot(one.getListener(), other.getListener())
+
+    def test_Stateful_components_are_new_every_time(self):
+        from niprov.dependencies import Dependencies
+        dependencies = Dependencies()
+        self.assertIsNot(dependencies.getQuery(), dependencies.getQuery())
+        self.assertIsNot(dependencies.getFingerprintCache(), 
+            dependencies.getFingerprintCache())
+
     def test_Changing_storage_setting_changes_repository_provided(self):
         from niprov.dependencies import Dependencies
         from niprov.jsonfile import JsonFile
+        from niprov.journalfile import JournalFile
         from niprov.mongo import MongoRepository
+        from niprov.sqlitedb import SqliteRepository
+        import niprov.sqlitedb
         dependencies = Dependencies()
-        with patch('niprov.mongo.pymongo'):
+        self.addCleanup(niprov.sqlitedb._PREPARED.clear)
+        self.addCleanup(niprov.sqlitedb._DATABASES.clear)
+        with patch('niprov.mongo.pymongo'), patch('niprov.sqlitedb.sqlite3'):
             dependencies.config.database_type = 'file'
             self.assertIsInstance(dependencies.getRepository(), JsonFile)
+            dependencies.config.database_type = 'journal'
+            self.assertIsInstance(dependencies.getRepository(), JournalFile)
             dependencies.config.database_type = 'MongoDB'
             self.assertIsInstance(dependencies.getRepository(), MongoRepository)
+            dependencies.config.database_type = 'sqlite'
+            self.assertIsInstance(dependencies.getRepository(), SqliteRepository)
 
     def test_reconfigureOrGetConfiguration_with_None_doesnt_affect_config(self):
         from niprov.dependencies import Dependencies
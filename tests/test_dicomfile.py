@@ -21,6 +21,11 @@ class DicomTests(BaseFileTests):
         self.assertEqual(out['protocol'], 'T1 SENSE')
         self.assertEqual(out['acquired'], datetime(2014, 8, 5, 12, 19, 14))
 
+    def test_Reads_header_only(self):
+        self.file.inspect()
+        self.libs.dicom.read_file.assert_called_with(self.path,
+            stop_before_pixels=True, defer_size=1024)
+
     def test_if_doesnt_have_acqDateTime_get_seriesDatetime(self):
         del(self.img.AcquisitionDateTime)
         self.img.SeriesDate = '20120416'
@@ -42,6 +47,28 @@ class DicomTests(BaseFileTests):
         self.assertTrue(self.file.hasFile(newFile))
         self.assertFalse(self.file.hasFile(otherFile))
 
+    def test_mergeWithMany_skips_known_files_and_updates_dimensions_once(self):
+        del(self.img.NumberOfFrames)
+        self.file.inspect()
+        newFiles = [Mock(), Mock()]
+        out = self.file.mergeWithMany(newFiles + [Mock(path=self.file.path)])
+        self.assertEqual(self.file, out)
+        self.assertEqual([self.file.path] + [f.path for f in newFiles],
+            self.file.provenance['filesInSeries'])
+        self.assertEqual([11, 12, 3], self.file.provenance['dimensions'])
+        self.assertEqual('series-new-file', self.file.status)
+        self.assertTrue(self.file.hasFile(newFiles[1]))
+
+    def test_Merging_into_copy_leaves_series_unchanged(self):
+        self.file.inspect()
+        self.assertFalse(self.file.hasFile(Mock(path='new')))
+        other = self.file.copy()
+        other.mergeWith(Mock(path='new'))
+        self.assertTrue(other.hasFile(Mock(path='new')))
+        self.assertFalse(self.file.hasFile(Mock(path='new')))
+        self.assertEqual([self.file.path], 
+            self.file.provenance['filesInSeries'])
+
     def test_Gets_dimensions(self):
         out = self.file.inspect()
         self.assertEqual(out['dimensions'], [11, 12, 13])
@@ -14,16 +14,27 @@ class DiscoveryTests(unittest.TestCase):
         img = Mock()
         img.status = 'new'
         self.add.return_value = img
+        self.batches = []
         self.dependencies = Mock()
         self.dependencies.getFilesystem.return_value = self.filesys
         self.dependencies.getListener.return_value = self.listener
         self.dependencies.getFileFilter.return_value = self.filt
+        self.fingerprints = Mock()
+        self.fingerprints.unchanged.return_value = False
+        self.dependencies.getFingerprintCache.return_value = self.fingerprints
+        self.config = self.dependencies.getConfiguration()
+        self.config.dryrun = False
+        self.config.discover_incremental = False
 
     def discover(self, path):
         import niprov.discovery
-        niprov.discovery.add = self.add
+        niprov.discovery.addMany = self.addMany
         niprov.discovery.discover(path, dependencies=self.dependencies)
 
+    def addMany(self, paths, **kwargs):
+        self.batches.append(paths)
+        return [self.add(p, **kwargs) for p in paths]
+
     def test_Calls_add_on_files_encountered(self):
         self.setupFilter('.x')
         self.filesys.walk.return_value = [('root',[],['p/f1.x','p/f2.x']),
@@ -34,6 +45,35 @@ class DiscoveryTests(unittest.TestCase):
         self.add.assert_any_call('root/p/f2.x', transient=False, dependencies=self.dependencies)
         self.add.assert_any_call('root/p/p2/f3.x', transient=False, dependencies=self.dependencies)
 
+    def test_Adds_files_in_batches(self):
+        self.filesys.walk.return_value = [('root',[],['a','b','c','d','e'])]
+        with mock.patch('niprov.discovery.BATCHSIZE', 2):
+            self.discover('root')
+        self.assertEqual([['root/a','root/b'], ['root/c','root/d'], 
+            ['root/e']], self.batches)
+        self.listener.discoveryFinished.assert_called_with(nnew=5, nadded=0, 
+            nfailed=0, ntotal=5, nunchanged=0)
+
+    def test_Registers_batch_before_walking_on(self):
+        walked = []
+        def walk(root):
+            for dirpath in ['root/1', 'root/2']:
+                walked.append(dirpath)
+                yield (dirpath, [], ['a', 'b'])
+        self.filesys.walk.side_effect = walk
+        seen = {}
+        def add(path, **kwargs):
+            seen[path] = list(walked)
+            return Mock(status='new')
+        self.add.side_effect = add
+        with mock.patch('niprov.discovery.BATCHSIZE', 2):
+            self.discover('root')
+        self.assertEqual([['root/1/a','root/1/b'], ['root/2/a','root/2/b']], 
+            self.batches)
+        self.assertEqual(['root/1'], seen['root/1/b'])
+        self.listener.discoveryFinished.assert_called_with(nnew=4, nadded=0, 
+            nfailed=0, ntotal=4, nunchanged=0)
+
     def test_file_filters(self):
         self.setupFilter('valid.file')
         self.filesys.walk.return_value = [('root',[],['valid.file','other.file'])]
@@ -52,7 +92,123 @@ class DiscoveryTests(unittest.TestCase):
             images.append(img)
         self.add.side_effect = images
         self.discover('root')
-        self.listener.discoveryFinished.assert_called_with(nnew=2, nadded=3, nfailed=1, ntotal=8)
+        self.listener.discoveryFinished.assert_called_with(nnew=2, nadded=3, 
+            nfailed=1, ntotal=8, nunchanged=0)
+
+    def test_With_workers_inspects_in_pool_and_registers_results(self):
+        self.setupFilter('.x')
+        self.filesys.walk.return_value = [('root',[],['f1.x','f2.x','f3.x'])]
+        config = self.config
+        results = {'root/f1.x':({'p':1}, 'new', None), 
+            'root/f2.x':({'p':2}, 'failed', None),
+            'root/f3.x':({'p':3}, 'new', 'snapshot')}
+        tasks = []
+        def imap_unordered(func, batch, chunksize):
+            tasks.extend(batch)
+            return [results[path] for path, _ in batch]
+        factory = self.dependencies.getFileFactory()
+        factory.fromProvenance.side_effect = lambda p: Mock(provenance=p)
+        pictures = self.dependencies.getPictureCache()
+        registered = []
+        def registerMany(images, dependencies):
+            registered.append([img.provenance['p'] for img in images])
+            return images
+        import niprov.discovery
+        with mock.patch('niprov.discovery.multiprocessing') as mp, \
+             mock.patch('niprov.discovery.BATCHSIZE', 1), \
+             mock.patch('niprov.discovery.registerMany', 
+                side_effect=registerMany):
+            mp.Pool.return_value.imap_unordered.side_effect = imap_unordered
+            niprov.discovery.discover('root', workers=3, 
+                dependencies=self.dependencies)
+        mp.Pool.assert_called_with(3)
+        self.assertEqual([('root/f1.x', config), ('root/f2.x', config), 
+            ('root/f3.x', config)], tasks)
+        assert not self.add.called
+        self.assertEqual([[1], [3]], registered)
+        self.assertEqual('snapshot', pictures.keep.call_args[0][0])
+        self.listener.discoveryFinished.assert_called_with(nnew=2, nadded=0,
+            nfailed=1, ntotal=3, nunchanged=0)
+
+    def test_Incremental_skips_unchanged_files_and_remembers_added(self):
+        self.config.discover_incremental = True
+        self.filesys.walk.return_value = [('root',[],['a','b','c','d'])]
+        self.fingerprints.unchanged.side_effect = lambda p: p in ['root/b']
+        self.fingerprints.stored.side_effect = lambda p: ('h:'+p, 'x')
+        self.storedFiles({'h:root/b':'x'})
+        images = {}
+        for name, status in zip('acd', ['new', 'failed', 'series-new-file']):
+            img = Mock()
+            img.status = status
+            img.path = '/abs/root/'+name
+            images['root/'+name] = img
+        images['root/d'].path = '/abs/root/a'
+        self.add.side_effect = lambda p, **kw: images[p]
+        with mock.patch('niprov.discovery.os.path.abspath') as abspath:
+            abspath.side_effect = lambda p: '/abs/'+p
+            self.discover('root')
+        self.assertNotCalledWith(self.add, 'root/b', transient=False, 
+            dependencies=self.dependencies)
+        self.fingerprints.remember.assert_any_call('root/a', 
+            images['root/a'].provenance.get('hash'), None)
+        self.fingerprints.remember.assert_any_call('root/d', None, 
+            images['root/d'].location.toString())
+        self.assertEqual(2, self.fingerprints.remember.call_count)
+        self.fingerprints.save.assert_called_with()
+        self.listener.discoveryFinished.assert_called_with(nnew=1, nadded=1, 
+            nfailed=1, ntotal=4, nunchanged=1)
+
+    def test_Incremental_adds_unchanged_files_the_repository_lacks(self):
+        self.config.discover_incremental = True
+        self.filesys.walk.return_value = [('root',[],['a','b','c','d'])]
+        self.fingerprints.unchanged.return_value = True
+        stored = {'root/a':('h:a','x'), 'root/b':('h:b','x'), 
+            'root/c':('h:s',None), 'root/d':('h:d','y')}
+        self.fingerprints.stored.side_effect = lambda p: stored[p]
+        repo = self.storedFiles({'h:a':'x', 'h:s':'z', 'h:d':'x'})
+        self.discover('root')
+        self.assertEqual(['h:a','h:b','h:d','h:s'], 
+            sorted(repo.byLocations.call_args[0][0]))
+        self.assertEqual([['root/b','root/d']], self.batches)
+        self.listener.discoveryFinished.assert_called_with(nnew=2, nadded=0, 
+            nfailed=0, ntotal=4, nunchanged=2)
+
+    def storedFiles(self, hashes):
+        repo = self.dependencies.getRepository()
+        images = []
+        for location, hash in hashes.items():
+            img = Mock()
+            img.location.toString.return_value = location
+            img.provenance = {'hash':hash}
+            images.append(img)
+        repo.byLocations.return_value = images
+        return repo
+
+    def test_Incremental_not_used_on_dryrun(self):
+        self.config.discover_incremental = True
+        self.config.dryrun = True
+        self.discover('root')
+        assert not self.fingerprints.unchanged.called
+        assert not self.fingerprints.remember.called
+        assert not self.fingerprints.save.called
+
+    def test_Worker_inspects_file_and_returns_provenance_and_snapshot(self):
+        import niprov.discovery
+        img = Mock()
+        img.provenance = {'a':1}
+        img.status = 'new'
+        config = Mock()
+        config.dryrun = False
+        with mock.patch('niprov.discovery.locateNew') as locateNew, \
+             mock.patch('niprov.discovery.inspectNew') as inspectNew, \
+             mock.patch('niprov.discovery.Dependencies') as Dependencies:
+            locateNew.return_value = img
+            out = niprov.discovery._inspectInWorker(('root/f1.x', config))
+        Dependencies.assert_called_with(config)
+        inspectNew.assert_called_with(img, transient=False, 
+            dependencies=Dependencies())
+        pictures = Dependencies().getPictureCache()
+        self.assertEqual(({'a':1}, 'new', pictures.getBytes()), out)
 
     def assertNotCalledWith(self, m, *args, **kwargs):
         c = mock.call(*args, **kwargs)
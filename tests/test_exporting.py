@@ -44,9 +44,19 @@ class ExportingTests(DependencyInjectionTestBase):
     def test_Backup_passes_all_images_to_export(self):
         import niprov.exporting
         niprov.exporting.export = Mock()
+        old, new = Mock(), Mock()
+        old.provenance = {'y':2}
+        new.copy.return_value.provenance = {'y':2}
+        self.repo.iterAll.return_value = iter([new, old])
+        self.repo.versionsOf.side_effect = lambda i: [{'y':1}] if i is new else []
         niprov.exporting.backup(self.dependencies)
-        niprov.exporting.export.assert_called_with(self.query.all(), 
-            medium='file', form='json', dependencies=self.dependencies)
+        args, kwargs = niprov.exporting.export.call_args
+        self.assertEqual({'medium':'file', 'form':'json', 
+            'dependencies':self.dependencies}, kwargs)
+        self.assertEqual([new.copy(), old], list(args[0]))
+        self.assertEqual({'y':2, '_versions':[{'y':1}]}, 
+            new.copy().provenance)
+        self.assertEqual({'y':2}, old.provenance)
 
 
 
@@ -129,3 +129,14 @@ class FileFactoryTests(unittest.TestCase):
 
 
 
+
+    def test_recordFromProvenance_creates_file_only_when_needed(self):
+        from niprov.files import FileFactory
+        from niprov.record import Record
+        from niprov.nifti import NiftiFile
+        factory = FileFactory(dependencies=self.dependencies)
+        record = factory.recordFromProvenance({'location':'h:/p/example.nii'})
+        self.assertIsInstance(record, Record)
+        self.assertEqual(self.location, record.location)
+        assert not self.libs.hasDependency.called
+        self.assertIsInstance(record.file, NiftiFile)
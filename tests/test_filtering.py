@@ -0,0 +1,75 @@
+from mock import Mock
+from tests.ditest import DependencyInjectionTestBase
+from datetime import datetime
+
+
+class FilteringTests(DependencyInjectionTestBase):
+
+    def test_matches_all_conditions(self):
+        from niprov.filtering import matches, Condition as C
+        prov = {'subject':'x', 'modality':'MRI', 'size':10, 
+            'parents':['a','b']}
+        self.assertTrue(matches(prov, [C('subject','eq','x'), 
+            C('modality','in',['MEG','MRI'])]))
+        self.assertFalse(matches(prov, [C('subject','eq','x'), 
+            C('modality','eq','MEG')]))
+        self.assertTrue(matches(prov, [C('parents','eq','b')]))
+        self.assertFalse(matches(prov, [C('project','eq','x')]))
+        self.assertTrue(matches(prov, []))
+
+    def test_matches_ranges_and_existence(self):
+        from niprov.filtering import matches, Condition as C
+        prov = {'size':10, 'acquired':datetime(2016, 3, 1), 'user':None}
+        self.assertTrue(matches(prov, [C('size','gte',10), C('size','lt',11)]))
+        self.assertFalse(matches(prov, [C('size','gt',10)]))
+        self.assertTrue(matches(prov, 
+            [C('acquired','lte',datetime(2016, 3, 2))]))
+        self.assertFalse(matches(prov, [C('acquired','gt','2016')]))
+        self.assertFalse(matches(prov, [C('user','gt','a')]))
+        self.assertFalse(matches(prov, [C('added','lt',datetime.now())]))
+        self.assertTrue(matches(prov, [C('user','exists',True), 
+            C('added','exists',False)]))
+
+    def test_matches_either(self):
+        from niprov.filtering import matches, Condition as C, Either
+        either = Either([[C('subject','eq','a')], 
+            [C('subject','eq','b'), C('size','gt',5)]])
+        self.assertTrue(matches({'subject':'a'}, [either]))
+        self.assertTrue(matches({'subject':'b', 'size':6}, [either]))
+        self.assertFalse(matches({'subject':'b', 'size':4}, [either]))
+
+    def test_toMongo(self):
+        from niprov.filtering import toMongo, Condition as C, Either
+        self.assertEqual({}, toMongo([]))
+        self.assertEqual({'subject':'a'}, toMongo([C('subject','eq','a')]))
+        self.assertEqual({'$and':[{'size':{'$gte':1}}, {'size':{'$lt':5}}, 
+            {'user':{'$exists':False}}, {'modality':{'$in':['MRI']}},
+            {'$or':[{'subject':'a'}, {'subject':'b'}]}]}, 
+            toMongo([C('size','gte',1), C('size','lt',5), 
+            C('user','exists',False), C('modality','in',('MRI',)),
+            Either([[C('subject','eq','a')], [C('subject','eq','b')]])]))
+
+    def test_pushdown_picks_first_lookup_on_indexed_field(self):
+        from niprov.filtering import pushdown, Condition as C, Either
+        conditions = [Either([]), C('size','gt',1), C('subject','eq','x'), 
+            C('hash','in',('a','b'))]
+        self.assertEqual(('subject', ['x']), pushdown(conditions))
+        self.assertEqual(('hash', ['a','b']), pushdown(conditions, ['hash']))
+        self.assertIsNone(pushdown(conditions, ['id']))
+
+    def test_select_filters_sorts_and_windows(self):
+        from niprov.querying import Query
+        from niprov.filtering import select, countMatching
+        images = []
+        for size in [3, 1, 4, 1, 5]:
+            img = Mock()
+            img.provenance = {'size':size, 'subject':'s{0}'.format(size)}
+            images.append(img)
+        q = Query(self.dependencies).sizeBetween(2).sortBy('-size')
+        self.assertEqual([5, 4, 3], 
+            [i.provenance['size'] for i in select(images, q)])
+        q.offset(1).limit(1)
+        self.assertEqual([4], [i.provenance['size'] for i in select(images, q)])
+        self.assertEqual(3, countMatching(images, q.getFilter()))
+        q = Query(self.dependencies).sizeBetween(None, 3).allValues('subject')
+        self.assertEqual(['s3', 's1'], select(images, q))
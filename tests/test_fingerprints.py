@@ -0,0 +1,74 @@
+import unittest
+from mock import Mock
+from tests.ditest import DependencyInjectionTestBase
+import json
+
+
+class FingerprintCacheTests(DependencyInjectionTestBase):
+
+    def setUp(self):
+        super(FingerprintCacheTests, self).setUp()
+        self.config.database_type = 'file'
+        self.config.database_url = '/db.json'
+        self.locationFactory.completeString.side_effect = lambda p: 'h:'+p
+        self.filesys.read.side_effect = IOError
+        self.stats = {}
+        def stat(path):
+            s = Mock()
+            s.st_size, s.st_mtime, s.st_ino = self.stats[path]
+            return s
+        self.filesys.stat.side_effect = stat
+
+    def createCache(self):
+        from niprov.fingerprints import FingerprintCache
+        return FingerprintCache(self.dependencies)
+
+    def test_Unknown_file_is_not_unchanged(self):
+        cache = self.createCache()
+        self.stats['/f'] = (10, 1.5, 7)
+        self.assertFalse(cache.unchanged('/f'))
+
+    def test_Remembered_file_is_unchanged_until_stat_differs(self):
+        cache = self.createCache()
+        self.stats['/f'] = (10, 1.5, 7)
+        cache.remember('/f', 'abc')
+        self.assertTrue(cache.unchanged('/f'))
+        self.stats['/f'] = (10, 2.5, 7)
+        self.assertFalse(cache.unchanged('/f'))
+        self.stats['/f'] = (11, 1.5, 7)
+        self.assertFalse(cache.unchanged('/f'))
+        self.stats['/f'] = (10, 1.5, 8)
+        self.assertFalse(cache.unchanged('/f'))
+
+    def test_Saves_per_database_and_reads_back(self):
+        cache = self.createCache()
+        self.stats['/f'] = (10, 1.5, 7)
+        cache.remember('/f', 'abc')
+        cache.save()
+        path, content = self.filesys.write.call_args[0]
+        self.assertNotEqual(cache.cachefile, path)
+        self.filesys.rename.assert_called_with(path, cache.cachefile)
+        self.assertEqual({'file:/db.json':{'h:/f':[10, 1.5, 7, 'abc', None]}}, 
+            json.loads(content))
+        self.filesys.read.side_effect = None
+        self.filesys.read.return_value = content
+        self.assertTrue(self.createCache().unchanged('/f'))
+        self.config.database_url = '/other.json'
+        self.assertFalse(self.createCache().unchanged('/f'))
+
+    def test_stored_gives_location_and_hash_file_was_registered_as(self):
+        cache = self.createCache()
+        self.stats['/f'] = (10, 1.5, 7)
+        self.stats['/g'] = (10, 1.5, 8)
+        cache.remember('/f', 'abc')
+        cache.remember('/g', None, 'h:/f')
+        self.assertEqual(('h:/f', 'abc'), cache.stored('/f'))
+        self.assertEqual(('h:/f', None), cache.stored('/g'))
+        cache.databases['file:/db.json']['h:/g'] = [10, 1.5, 8, 'def']
+        self.assertEqual(('h:/g', 'def'), cache.stored('/g'))
+
+    def test_Save_does_nothing_if_nothing_remembered(self):
+        cache = self.createCache()
+        cache.save()
+        assert not self.filesys.write.called
+
@@ -11,7 +11,10 @@ class SerializerTests(DependencyInjectionTestBase):
 
     def setUp(self):
         super(SerializerTests, self).setUp()
+        self.config.json_codec = 2
         self.fileFactory.fromProvenance.side_effect = lambda p: self.imageWithProvenance(p)
+        self.fileFactory.recordFromProvenance.side_effect = (
+            self.fileFactory.fromProvenance.side_effect)
 
     def imageWithProvenance(self, prov):
         img = Mock()
@@ -72,3 +75,145 @@ class SerializerTests(DependencyInjectionTestBase):
         self.assertEqual(out.provenance['_versions'][-2]['acquired'], dtnow)
 
 
+    def test_serializeIter_yields_same_json_as_serializeList(self):
+        from niprov.formatjson import JsonFormat  
+        serializer = JsonFormat(self.dependencies)
+        images = [self.imageWithProvenance({'location':'a','size':1}),
+                  self.imageWithProvenance({'location':'b','size':2})]
+        out = ''.join(serializer.serializeIter(iter(images)))
+        self.assertEqual(serializer.serializeList(images), out)
+        self.assertEqual('[]', ''.join(serializer.serializeIter([])))
+
+    def test_serialize_uses_serializeIter_for_iterators(self):
+        from niprov.formatjson import JsonFormat  
+        serializer = JsonFormat(self.dependencies)
+        images = [self.imageWithProvenance({'location':'a'})]
+        out = serializer.serialize(iter(images))
+        self.assertNotIsInstance(out, str)
+        self.assertEqual('[{"location": "a"}]', ''.join(out))
+
+    def test_deserializeIter_parses_records_from_any_pieces(self):
+        from niprov.formatjson import JsonFormat  
+        serializer = JsonFormat(self.dependencies)
+        dtnow = datetime.now()
+        records = [{'location':'a','added':dtnow,'note':'} ], {'},
+                   {'location':'b','parents':['x','y']}, {'location':'c'}]
+        jsonStr = serializer.serializeList(
+            [self.imageWithProvenance(r) for r in records])
+        for size in [1, 3, 7, len(jsonStr)]:
+            chunks = [jsonStr[i:i+size] for i in range(0, len(jsonStr), size)]
+            out = [i.provenance for i in serializer.deserializeIter(chunks)]
+            self.assertEqual(records, out)
+
+    def test_deserializeIter_parses_large_record_a_few_times_only(self):
+        from niprov.formatjson import JsonFormat  
+        serializer = JsonFormat(self.dependencies)
+        records = [{'location':'a', 'logtext':'x'*100000}, {'location':'b'}]
+        jsonStr = serializer.serializeList(
+            [self.imageWithProvenance(r) for r in records])
+        chunks = [jsonStr[i:i+100] for i in range(0, len(jsonStr), 100)]
+        serializer.decoder = Mock(wraps=serializer.decoder)
+        out = [i.provenance for i in serializer.deserializeIter(chunks)]
+        self.assertEqual(records, out)
+        self.assertLess(serializer.decoder.raw_decode.call_count, 20)
+
+    def test_deserializeIter_yields_records_before_reading_the_rest(self):
+        from niprov.formatjson import JsonFormat  
+        serializer = JsonFormat(self.dependencies)
+        def chunks():
+            yield '[{"location": "a"}, '
+            raise AssertionError('Read too far')
+        out = serializer.deserializeIter(chunks())
+        self.assertEqual({'location':'a'}, next(out).provenance)
+
+    def test_deserializeIter_on_empty_or_invalid_json(self):
+        from niprov.formatjson import JsonFormat  
+        serializer = JsonFormat(self.dependencies)
+        self.assertEqual([], list(serializer.deserializeIter([''])))
+        self.assertEqual([], list(serializer.deserializeIter(['[ ', ']'])))
+        with self.assertRaises(ValueError):
+            list(serializer.deserializeIter(['[{"location": "a"}, {"loc']))
+        with self.assertRaises(ValueError):
+            list(serializer.deserializeIter(['{"location": "a"}']))
+
+    def test_deserializeRecord_makes_record_for_listing(self):
+        from niprov.formatjson import JsonFormat  
+        serializer = JsonFormat(self.dependencies)
+        dtnow = datetime.now()
+        jsonStr = serializer.serializeSingle(
+            self.imageWithProvenance({'location':'a','added':dtnow}))
+        out = serializer.deserializeRecord(jsonStr)
+        self.fileFactory.recordFromProvenance.assert_called_with(
+            {'location':'a','added':dtnow})
+
+    def test_Writes_datetimes_as_microseconds(self):
+        from niprov.formatjson import JsonFormat  
+        serializer = JsonFormat(self.dependencies)
+        dt = datetime(2016, 1, 31, 17, 4, 32, 512)
+        out = serializer.serializeSingle(self.imageWithProvenance(
+            {'added':dt, 'created':datetime(2016, 1, 31)}))
+        self.assertEqual({'$dt':1454259872000512}, json.loads(out)['added'])
+        self.assertEqual({'$dt':1454198400000000}, json.loads(out)['created'])
+        back = serializer.deserialize(out).provenance
+        self.assertEqual(dt, back['added'])
+        self.assertEqual(datetime(2016, 1, 31), back['created'])
+
+    def test_Writes_version_1_encoding_if_configured(self):
+        from niprov.formatjson import JsonFormat  
+        self.config.json_codec = 1
+        serializer = JsonFormat(self.dependencies)
+        dt = datetime(2016, 1, 31, 17, 4, 32, 512)
+        out = serializer.serializeSingle(self.imageWithProvenance({'added':dt}))
+        self.assertEqual('datetime', json.loads(out)['added']['__type__'])
+        self.assertEqual(dt, serializer.deserialize(out).provenance['added'])
+
+    def test_Reads_version_1_encoding(self):
+        from niprov.formatjson import JsonFormat  
+        serializer = JsonFormat(self.dependencies)
+        old = ('[{"location": "a", "added": {"__type__": "datetime", '
+            '"year": 2016, "month": 1, "day": 31, "hour": 17, "minute": 4, '
+            '"second": 32, "microsecond": 512}, "x": {"$dt": 1, "y": 2}, '
+            '"z": {"$dt": "1"}}]')
+        out = serializer.deserializeList(old)[0].provenance
+        self.assertEqual(datetime(2016, 1, 31, 17, 4, 32, 512), out['added'])
+        self.assertEqual({'$dt':1, 'y':2}, out['x'])
+        self.assertEqual({'$dt':'1'}, out['z'])
+
+    def test_Version_2_converts_datetimes_with_timezone_to_utc(self):
+        from niprov.formatjson import JsonFormat  
+        from datetime import tzinfo, timedelta
+        class Plus2(tzinfo):
+            def utcoffset(self, dt):
+                return timedelta(hours=2)
+        serializer = JsonFormat(self.dependencies)
+        dt = datetime(2016, 1, 31, 17, 4, 32, 512, tzinfo=Plus2())
+        out = serializer.serializeSingle(self.imageWithProvenance({'added':dt}))
+        self.assertEqual(datetime(2016, 1, 31, 15, 4, 32, 512), 
+            serializer.deserialize(out).provenance['added'])
+
+    def test_Version_1_is_default(self):
+        from niprov.config import Configuration
+        self.assertEqual(1, Configuration().json_codec)
+
+    def test_Unknown_codec(self):
+        from niprov.formatjson import JsonFormat  
+        self.config.json_codec = 3
+        with self.assertRaises(ValueError):
+            JsonFormat(self.dependencies)
+
+    def test_serialize_does_not_copy_or_change_provenance(self):
+        from niprov.formatjson import JsonFormat  
+        serializer = JsonFormat(self.dependencies)
+        logtext = 'x' * 1000
+        record = {'logtext':logtext, '_versions':[{'a':1}, {'a':2}]}
+        self.assertIs(record, serializer._deflate(record))
+        record = {'logtext':logtext, '_id':1, 'args':[object()],
+            '_versions':[{'a':1}, {'a':2, '_id':2}]}
+        flat = serializer._deflate(record)
+        self.assertIs(logtext, flat['logtext'])
+        self.assertNotIn('_id', flat)
+        self.assertIs(record['_versions'][0], flat['_versions'][0])
+        self.assertEqual({'a':2}, flat['_versions'][1])
+        self.assertEqual(1, record['_id'])
+        self.assertEqual(2, record['_versions'][1]['_id'])
+        self.assertNotIsInstance(record['args'][0], str)
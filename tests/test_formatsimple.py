@@ -11,6 +11,15 @@ class SimpleFormatTests(TestCase):
         self.assertIn(' Number of files: 123', out)
         self.assertIn(' Total file size: 678', out)
 
+    def test_Summary_for_file_with_missing_fields(self):
+        from niprov.formatsimple import SimpleFormat
+        image = Mock()
+        image.provenance = {'subject':'JD', 'path':'/p/f.nii'}
+        out = SimpleFormat().serializeSummary(image)
+        self.assertTrue(out.startswith('None  JD           None'))
+        self.assertIn('/p/f.nii', out)
+        self.assertEqual({'subject':'JD', 'path':'/p/f.nii'}, image.provenance)
+
     def test_Pipeline(self):
         from niprov.formatsimple import SimpleFormat
         pipeline = Mock()
@@ -0,0 +1,118 @@
+import unittest
+from mock import Mock
+import os, shutil, tempfile, hashlib
+
+
+class HasherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.dependencies = Mock()
+        self.config = self.dependencies.getConfiguration()
+        self.config.hash_algorithm = 'md5'
+        self.config.hash_strategy = 'full'
+
+    def createHasher(self):
+        from niprov.hashing import Hasher
+        return Hasher(self.dependencies)
+
+    def createFile(self, name, content):
+        fpath = os.path.join(self.tempdir, name)
+        with open(fpath, 'wb') as fhandle:
+            fhandle.write(content)
+        return fpath
+
+    def imageWithProvenance(self, prov, path='/nonexistent'):
+        img = Mock()
+        img.provenance = prov
+        img.path = path
+        return img
+
+    def test_digest_of_small_file(self):
+        fpath = self.createFile('small', b'abc'*100)
+        self.assertEqual(hashlib.md5(b'abc'*100).hexdigest(), 
+            self.createHasher().digest(fpath))
+
+    def test_digest_of_large_file_read_through_memory_map(self):
+        content = os.urandom(1024*1024*5+3)
+        fpath = self.createFile('large', content)
+        self.assertEqual(hashlib.md5(content).hexdigest(), 
+            self.createHasher().digest(fpath))
+
+    def test_memory_map_is_read_without_copying_blocks(self):
+        content = os.urandom(1024*1024*5+3)
+        fpath = self.createFile('large', content)
+        hasher = self.createHasher()
+        blocks = []
+        md5 = hashlib.md5()
+        def update(block):
+            blocks.append(block)
+            md5.update(block)
+        hasher._new = lambda: Mock(update=update, hexdigest=md5.hexdigest)
+        self.assertEqual(hashlib.md5(content).hexdigest(), hasher.digest(fpath))
+        self.assertTrue(all([isinstance(b, buffer) for b in blocks]))
+
+    def test_digest_with_other_algorithm(self):
+        self.config.hash_algorithm = 'sha1'
+        fpath = self.createFile('small', b'abc')
+        self.assertEqual(hashlib.sha1(b'abc').hexdigest(), 
+            self.createHasher().digest(fpath))
+
+    def test_sample_same_for_same_content_and_differs_with_content(self):
+        hasher = self.createHasher()
+        content = os.urandom(1024*1024)
+        f1 = self.createFile('f1', content)
+        f2 = self.createFile('f2', content)
+        f3 = self.createFile('f3', content[:-1]+b'x')
+        f4 = self.createFile('f4', content+b'x')
+        self.assertEqual(hasher.sample(f1), hasher.sample(f2))
+        self.assertNotEqual(hasher.sample(f1), hasher.sample(f3))
+        self.assertNotEqual(hasher.sample(f1), hasher.sample(f4))
+
+    def test_sample_of_empty_and_small_files(self):
+        hasher = self.createHasher()
+        f1 = self.createFile('f1', b'')
+        f2 = self.createFile('f2', b'a')
+        self.assertNotEqual(hasher.sample(f1), hasher.sample(f2))
+
+    def test_completeDigest_uses_stored_hash_with_same_algorithm(self):
+        hasher = self.createHasher()
+        img = self.imageWithProvenance({'hash':'abc'})
+        self.assertEqual('abc', hasher.completeDigest(img))
+        img = self.imageWithProvenance({'hash':'abc', 
+            'hash-algorithm':'sha1'})
+        self.assertIsNone(hasher.completeDigest(img))
+
+    def test_completeDigest_of_hash_with_other_algorithm_made_anew(self):
+        hasher = self.createHasher()
+        fpath = self.createFile('f1', b'abc')
+        img = self.imageWithProvenance({'hash':'abc', 
+            'hash-algorithm':'sha1'}, fpath)
+        self.assertEqual(hashlib.md5(b'abc').hexdigest(), 
+            hasher.completeDigest(img))
+
+    def test_completeDigest_makes_and_keeps_digest_if_file_available(self):
+        hasher = self.createHasher()
+        fpath = self.createFile('f1', b'abc')
+        img = self.imageWithProvenance({'hash-algorithm':'md5'}, fpath)
+        self.assertEqual(hashlib.md5(b'abc').hexdigest(), 
+            hasher.completeDigest(img))
+        self.assertEqual({'hash-algorithm':'md5'}, img.provenance)
+        hasher.digest = Mock()
+        self.assertEqual(hashlib.md5(b'abc').hexdigest(), 
+            hasher.completeDigest(img))
+        assert not hasher.digest.called
+        img = self.imageWithProvenance({'hash-algorithm':'md5'})
+        self.assertIsNone(hasher.completeDigest(img))
+
+    def test_sameContent(self):
+        hasher = self.createHasher()
+        a = self.imageWithProvenance({'hash':'abc'})
+        b = self.imageWithProvenance({'hash':'abc'})
+        c = self.imageWithProvenance({'hash':'def'})
+        d = self.imageWithProvenance({})
+        self.assertTrue(hasher.sameContent(a, b))
+        self.assertFalse(hasher.sameContent(a, c))
+        self.assertFalse(hasher.sameContent(d, d))
+
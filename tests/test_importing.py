@@ -1,4 +1,4 @@
-from mock import Mock, patch, sentinel
+from mock import Mock, patch
 from tests.ditest import DependencyInjectionTestBase
 from datetime import datetime
 
@@ -8,17 +8,53 @@ class ExportingTest(DependencyInjectionTestBase):
     def setUp(self):
         super(ExportingTest, self).setUp()
         self.tempRepo = Mock()
+        self.p1, self.p2 = Mock(provenance={}), Mock(provenance={})
+        self.repo.byLocations.return_value = []
 
     def test_import(self):
         import niprov.importing 
-        self.tempRepo.all.return_value = [sentinel.p1, sentinel.p2]
+        self.tempRepo.iterAll.return_value = iter([self.p1, self.p2])
         niprov.importing.JsonFile = self.patchJsonFileConstructor()
         niprov.importing.importp('target_file', dependencies=self.dependencies)
         assert self.JsonFileCtr.called, "Did not create a JsonFile repo."
         urlUsed = self.tempRepo.dependencies.getConfiguration().database_url
         self.assertEqual(urlUsed, 'target_file')
-        self.repo.add.assert_any_call(sentinel.p1)
-        self.repo.add.assert_any_call(sentinel.p2)
+        self.repo.addMany.assert_called_once_with([self.p1, self.p2])
+
+    def test_import_adds_in_batches(self):
+        import niprov.importing 
+        niprov.importing.BATCHSIZE = 2
+        self.addCleanup(setattr, niprov.importing, 'BATCHSIZE', 500)
+        images = [Mock(provenance={}) for i in range(5)]
+        self.tempRepo.iterAll.return_value = iter(images)
+        niprov.importing.JsonFile = self.patchJsonFileConstructor()
+        niprov.importing.importp('target_file', dependencies=self.dependencies)
+        self.assertEqual([images[:2], images[2:4], images[4:]], 
+            [c[0][0] for c in self.repo.addMany.call_args_list])
+
+    def test_import_keeps_versions_from_backup(self):
+        import niprov.importing 
+        img = Mock()
+        img.provenance = {'y':2, '_versions':[{'y':0}, {'y':1}]}
+        self.tempRepo.iterAll.return_value = iter([img])
+        niprov.importing.JsonFile = self.patchJsonFileConstructor()
+        niprov.importing.importp('target_file', dependencies=self.dependencies)
+        self.assertEqual({'y':2}, img.provenance)
+        self.assertEqual([{'y':0}, {'y':1}], img.replacedVersions)
+
+    def test_import_updates_files_repository_already_has(self):
+        import niprov.importing 
+        known = Mock()
+        known.location.toString.return_value = 'h:/p2'
+        self.p1.location.toString.return_value = 'h:/p1'
+        self.p2.location.toString.return_value = 'h:/p2'
+        self.repo.byLocations.return_value = [known]
+        self.tempRepo.iterAll.return_value = iter([self.p1, self.p2])
+        niprov.importing.JsonFile = self.patchJsonFileConstructor()
+        niprov.importing.importp('target_file', dependencies=self.dependencies)
+        self.repo.byLocations.assert_called_once_with(['h:/p1', 'h:/p2'])
+        self.repo.addMany.assert_called_once_with([self.p1])
+        self.repo.updateMany.assert_called_once_with([self.p2])
 
     def patchJsonFileConstructor(self):
         self.JsonFileCtr = Mock()
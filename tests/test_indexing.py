@@ -0,0 +1,19 @@
+from mock import Mock
+from tests.ditest import DependencyInjectionTestBase
+
+
+class IndexingTests(DependencyInjectionTestBase):
+
+    def test_ensureIndexes_asks_repository_and_informs_listener(self):
+        from niprov.indexing import ensureIndexes
+        self.repo.ensureIndexes.return_value = ['hash']
+        out = ensureIndexes(dependencies=self.dependencies)
+        self.listener.indexesEnsured.assert_called_with(['hash'])
+        self.assertEqual(['hash'], out)
+
+    def test_reindex_asks_repository_and_informs_listener(self):
+        from niprov.indexing import reindex
+        self.repo.reindex.return_value = ['hash', 'id']
+        out = reindex(dependencies=self.dependencies)
+        self.listener.indexesRebuilt.assert_called_with(['hash', 'id'])
+        self.assertEqual(['hash', 'id'], out)
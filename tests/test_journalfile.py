@@ -0,0 +1,251 @@
+from mock import Mock
+from tests.ditest import DependencyInjectionTestBase
+from niprov.querying import Query
+import os, json, shutil, tempfile
+
+
+class JournalFileTest(DependencyInjectionTestBase):
+
+    def setUp(self):
+        super(JournalFileTest, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.datafile = os.path.join(self.tempdir, 'provenance.journal')
+        self.config.database_url = self.datafile
+        self.config.versions_kept = 0
+        self.serializer.encode.side_effect = json.dumps
+        self.serializer.decode.side_effect = json.loads
+        self.serializer.serializeSingle.side_effect = lambda i: json.dumps(
+            i.provenance)
+        self.serializer.deserialize.side_effect = lambda l: (
+            self.imageWithProvenance(json.loads(l)))
+        self.serializer.deserializeRecord.side_effect = (
+            self.serializer.deserialize.side_effect)
+
+    def imageWithProvenance(self, prov):
+        img = Mock()
+        img.provenance = prov
+        img.replacedVersions = []
+        img.copy.return_value = img
+        if 'location' in prov:
+            img.location.toString.return_value = prov['location']
+        return img
+
+    def createRepo(self):
+        from niprov.journalfile import JournalFile
+        return JournalFile(self.dependencies)
+
+    def readLines(self):
+        with open(self.datafile) as fhandle:
+            return fhandle.read().splitlines()
+
+    def test_Add_appends_one_line(self):
+        repo = self.createRepo()
+        repo.add(self.imageWithProvenance({'location':'1','foo':'baz'}))
+        repo.add(self.imageWithProvenance({'location':'2','foo':'bar'}))
+        lines = self.readLines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual({'location':'2','foo':'bar'}, json.loads(lines[1]))
+
+    def test_Will_tell_PictureCache_to_persist_known_Snapshot(self):
+        repo = self.createRepo()
+        img = self.imageWithProvenance({'location':'1','foo':'baz'})
+        repo.add(img)
+        self.pictureCache.saveToDisk.assert_called_with(for_=img)
+
+    def test_Update_appends_line_which_replaces_previous(self):
+        repo = self.createRepo()
+        repo.add(self.imageWithProvenance({'location':'1','foo':'baz'}))
+        repo.add(self.imageWithProvenance({'location':'2','foo':'bar'}))
+        repo.update(self.imageWithProvenance({'location':'1','foo':'fob'}))
+        self.assertEqual(3, len(self.readLines()))
+        self.assertEqual('fob', repo.byLocation('1').provenance['foo'])
+        self.assertEqual(['bar','fob'],
+            sorted([i.provenance['foo'] for i in repo.all()]))
+
+    def test_addMany_and_updateMany_append_lines(self):
+        repo = self.createRepo()
+        repo.addMany([self.imageWithProvenance({'location':'1','hash':'x'}),
+            self.imageWithProvenance({'location':'2','hash':'y'})])
+        repo.updateMany([self.imageWithProvenance({'location':'1','hash':'z'})])
+        self.assertEqual(3, len(self.readLines()))
+        self.assertEqual(['2'], [i.provenance['location'] for i in 
+            repo.byFieldValues('hash', ['x','y'])])
+        self.assertEqual('z', repo.byLocation('1').provenance['hash'])
+
+    def test_iterAll_yields_current_provenance_in_file_order(self):
+        repo = self.createRepo()
+        repo.addMany([self.imageWithProvenance({'location':'1','size':1}),
+            self.imageWithProvenance({'location':'2','size':2})])
+        repo.update(self.imageWithProvenance({'location':'1','size':3}))
+        out = repo.iterAll()
+        self.assertEqual({'location':'2','size':2}, next(out).provenance)
+        repo.add(self.imageWithProvenance({'location':'3','size':4}))
+        self.assertEqual([{'location':'1','size':3}], 
+            [i.provenance for i in out])
+        self.assertEqual(['2','1','3'], [i.provenance['location'] 
+            for i in repo.iterAll(sort='size')])
+        self.assertEqual({'count':3, 'totalsize':9}, repo.statistics())
+
+    def test_Tallies_include_lines_appended_by_other_processes(self):
+        repo = self.createRepo()
+        repo.add(self.imageWithProvenance({'location':'1','subject':'a',
+            'size':1,'acquired':{'$dt':1451649600000000}}))
+        with open(self.datafile, 'ab') as fhandle:
+            fhandle.write(json.dumps({'location':'1','subject':'b',
+                'size':2}) + '\n')
+            fhandle.write(json.dumps({'location':'2','subject':'b',
+                'size':3}) + '\n')
+        self.assertEqual({'count':2, 'totalsize':5}, repo.statistics())
+        self.assertEqual({'b':{'count':2, 'totalsize':5}}, 
+            repo.facet('subject'))
+        repo.compact()
+        self.assertEqual({'count':2, 'totalsize':5}, repo.statistics())
+
+    def test_Tallies_count_acquisitions_per_day(self):
+        repo = self.createRepo()
+        repo.addMany([self.imageWithProvenance({'location':'1','size':1,
+            'acquired':{'$dt':1451649600000000}}), 
+            self.imageWithProvenance({'location':'2','size':2,
+            'acquired':{'$dt':1451653200000000}})])
+        self.assertEqual({'2016-01-01':{'count':2, 'totalsize':3}}, 
+            repo.facet('acquired'))
+
+    def test_byParents_and_byLocations_use_index(self):
+        repo = self.createRepo()
+        repo.addMany([self.imageWithProvenance({'location':'1'}),
+            self.imageWithProvenance({'location':'2','parents':['1']}),
+            self.imageWithProvenance({'location':'3','parents':['1','2']})])
+        self.assertEqual(['2','3'], [i.provenance['location'] 
+            for i in repo.byParents(['1'])])
+        repo.update(self.imageWithProvenance({'location':'3',
+            'parents':['2']}))
+        self.assertEqual(['2'], [i.provenance['location'] 
+            for i in repo.byParents(['1'])])
+        self.assertEqual(['3','1'], [i.provenance['location'] 
+            for i in repo.byLocations(['3','x','1'])])
+
+    def test_iterAll_on_missing_file_is_empty(self):
+        repo = self.createRepo()
+        self.assertEqual([], list(repo.iterAll()))
+
+    def test_byLocation_returns_None_if_unknown(self):
+        repo = self.createRepo()
+        repo.add(self.imageWithProvenance({'location':'1'}))
+        self.assertIsNone(repo.byLocation('2'))
+
+    def test_byLocations(self):
+        repo = self.createRepo()
+        for loc in ['i','j','m','f']:
+            repo.add(self.imageWithProvenance({'location':loc}))
+        out = repo.byLocations(['j','f','k'])
+        self.assertEqual(['j','f'], [i.provenance['location'] for i in out])
+
+    def test_byId_and_getSeries_use_index(self):
+        repo = self.createRepo()
+        repo.add(self.imageWithProvenance({'location':'1','id':'a',
+            'seriesuid':'s1'}))
+        repo.add(self.imageWithProvenance({'location':'2','id':'b',
+            'seriesuid':'s2'}))
+        repo.update(self.imageWithProvenance({'location':'1','id':'a',
+            'seriesuid':'s3'}))
+        self.assertEqual('2', repo.byId('b').provenance['location'])
+        img = Mock()
+        img.getSeriesId.return_value = 's3'
+        self.assertEqual('1', repo.getSeries(img).provenance['location'])
+        img.getSeriesId.return_value = 's1'
+        self.assertIsNone(repo.getSeries(img))
+
+    def test_Query_on_hash_uses_index(self):
+        repo = self.createRepo()
+        repo.add(self.imageWithProvenance({'location':'1','hash':'x'}))
+        repo.add(self.imageWithProvenance({'location':'2','hash':'y'}))
+        repo.add(self.imageWithProvenance({'location':'3','hash':'x'}))
+        q = Query(self.dependencies).where('hash', 'x')
+        out = repo.inquire(q)
+        self.assertEqual(['1','3'], [i.provenance['location'] for i in out])
+
+    def test_Picks_up_lines_appended_by_other_process(self):
+        repo = self.createRepo()
+        repo.add(self.imageWithProvenance({'location':'1'}))
+        with open(self.datafile, 'a') as fhandle:
+            fhandle.write(json.dumps({'location':'2','id':'b'})+'\n')
+        self.assertEqual('2', repo.byId('b').provenance['location'])
+
+    def test_Compact_keeps_only_current_lines(self):
+        repo = self.createRepo()
+        repo.add(self.imageWithProvenance({'location':'1','v':1}))
+        repo.add(self.imageWithProvenance({'location':'2','v':1}))
+        repo.update(self.imageWithProvenance({'location':'1','v':2}))
+        repo.compact()
+        self.assertEqual(2, len(self.readLines()))
+        self.assertEqual(2, repo.byLocation('1').provenance['v'])
+        self.assertEqual(1, repo.byLocation('2').provenance['v'])
+
+    def test_Reader_indexes_file_again_after_other_process_compacts(self):
+        from niprov.journalfile import Journal
+        writer, reader = Journal(self.datafile), Journal(self.datafile)
+        line = lambda l, v: json.dumps({'location':l, 'v':v})
+        writer.appendMany([(str(l), line(str(l), 0)) for l in range(3)])
+        self.assertEqual(line('1', 0), reader.lineFor('1'))
+        for v in range(1, 4):
+            writer.append('0', line('0', v))
+        writer.compact()
+        writer.appendMany([(str(l), line(str(l), 'x'*30)) 
+            for l in range(3, 6)])
+        assert os.path.getsize(self.datafile) > reader.end
+        self.assertEqual(line('0', 3), reader.lineFor('0'))
+        self.assertEqual(line('4', 'x'*30), reader.lineFor('4'))
+        self.assertEqual(6, len(reader.currentLines()))
+
+    def test_Compacts_in_background_when_mostly_stale(self):
+        repo = self.createRepo()
+        repo.journal.compactionMinimum = 3
+        for v in range(4):
+            repo.update(self.imageWithProvenance({'location':'1','v':v}))
+        repo.journal.compacting.join()
+        self.assertEqual(1, len(self.readLines()))
+        self.assertEqual(3, repo.byLocation('1').provenance['v'])
+
+    def test_all_on_missing_file_is_empty(self):
+        repo = self.createRepo()
+        self.assertEqual([], repo.all())
+
+
+    def test_Versions_kept_in_separate_file_and_pruned_on_compact(self):
+        repo = self.createRepo()
+        for v in range(3):
+            img = self.imageWithProvenance({'location':'1','v':v})
+            img.replacedVersions = [{'location':'1','v':v-1}] if v else []
+            repo.update(img)
+        self.assertTrue(os.path.isfile(self.datafile + '.versions'))
+        current = repo.byLocation('1')
+        self.assertEqual([0, 1], [p['v'] for p in repo.versionsOf(current)])
+        repo.kept = 1
+        repo.compact()
+        self.assertEqual([1], [p['v'] for p in repo.versionsOf(current)])
+
+    def test_Lookups_outside_index_parse_journal_only_when_it_changed(self):
+        repo = self.createRepo()
+        repo.add(self.imageWithProvenance({'location':'1','subject':'a'}))
+        self.serializer.deserializeRecord.reset_mock()
+        locations = lambda: [i.provenance['location'] 
+            for i in repo.byFieldValues('subject', ['a'])]
+        self.assertEqual(['1'], locations())
+        self.assertEqual(['1'], locations())
+        self.assertEqual(1, self.serializer.deserializeRecord.call_count)
+        with open(self.datafile, 'a') as fhandle:
+            fhandle.write(json.dumps({'location':'2','subject':'a'})+'\n')
+        self.assertEqual(['1', '2'], locations())
+        self.assertEqual(3, self.serializer.deserializeRecord.call_count)
+
+    def test_Compound_query_and_count(self):
+        repo = self.createRepo()
+        repo.add(self.imageWithProvenance({'location':'1','hash':'x','v':1}))
+        repo.add(self.imageWithProvenance({'location':'2','hash':'y','v':2}))
+        repo.add(self.imageWithProvenance({'location':'3','hash':'x','v':3}))
+        q = Query(self.dependencies).whereIn('hash', ['x','y']).between('v', 2)
+        self.assertEqual(['2','3'], 
+            sorted([i.provenance['location'] for i in repo.inquire(q)]))
+        self.assertEqual(2, repo.count(q))
+        self.assertEqual(3, repo.count(Query(self.dependencies).having('v')))
@@ -1,27 +1,54 @@
 from mock import Mock
 from tests.ditest import DependencyInjectionTestBase
-import datetime, random
+from niprov.querying import Query
+import datetime, random, os, shutil, tempfile
 
 
 class JsonFileTest(DependencyInjectionTestBase):
 
     def setUp(self):
         super(JsonFileTest, self).setUp()
-        self.dependencies.getConfiguration().database_url = ''
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.config.database_url = os.path.join(self.tempdir, 'prov.json')
+        self.config.versions_kept = 0
+        self.serializer.deserializeList.return_value = []
+        import niprov.jsonfile
+        niprov.jsonfile._CACHE.clear()
+        niprov.jsonfile._TALLIES.clear()
 
     def imageWithProvenance(self, prov):
         img = Mock()
         img.provenance = prov
+        img.replacedVersions = []
+        img.copy.return_value = img
         if 'location' in prov:
             img.location.toString.return_value = prov['location']
         return img
 
+    def copyableImage(self, prov):
+        """Image of which copy() returns a new image with a copy of the
+        provenance."""
+        img = self.imageWithProvenance(prov)
+        from niprov.basefile import copyProvenance
+        img.copy.side_effect = lambda: self.copyableImage(
+            copyProvenance(prov))
+        return img
+
+    def searchableRepo(self, provs):
+        """Repository with files at locations '0', '1', ..."""
+        from niprov.jsonfile import JsonFile
+        images = [self.imageWithProvenance(dict(p, location=str(l))) 
+            for l, p in enumerate(provs)]
+        self.serializer.deserializeList.return_value = images
+        self.serializer.deserializeIter.side_effect = lambda c: iter(images)
+        return JsonFile(self.dependencies), images
+
     def test_Add(self):
         from niprov.jsonfile import JsonFile
         repo = JsonFile(self.dependencies)
         img1 = self.imageWithProvenance({'location':'1','foo':'baz'})
-        repo.all = Mock()
-        repo.all.return_value = [img1]
+        self.serializer.deserializeList.return_value = [img1]
         image = self.imageWithProvenance({'location': '2','foo':'bar'})
         repo.add(image)
         self.serializer.serializeList.assert_called_with(
@@ -34,8 +61,7 @@ class JsonFileTest(DependencyInjectionTestBase):
         repo = JsonFile(self.dependencies)
         img1 = self.imageWithProvenance({'location':'1','path':'a'})
         img2 = self.imageWithProvenance({'location':'2','path':'b'})
-        repo.all = Mock()
-        repo.all.return_value = [img1, img2]
+        self.serializer.deserializeList.return_value = [img1, img2]
         image = self.imageWithProvenance({'location': '2','foo':'bar'})
         repo.update(image)
         self.serializer.serializeList.assert_called_with(
@@ -43,13 +69,66 @@ class JsonFileTest(DependencyInjectionTestBase):
         self.filesys.write.assert_called_with(repo.datafile, 
             self.serializer.serializeList())
 
+    def test_addMany_and_updateMany_write_once(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        img1 = self.imageWithProvenance({'location':'1'})
+        img2 = self.imageWithProvenance({'location':'2'})
+        self.serializer.deserializeList.return_value = [img1, img2]
+        new1 = self.imageWithProvenance({'location':'3'})
+        new2 = self.imageWithProvenance({'location':'4'})
+        repo.addMany([new1, new2])
+        self.serializer.serializeList.assert_called_with(
+            [img1, img2, new1, new2])
+        self.pictureCache.saveToDisk.assert_called_with(for_=new2)
+        changed = self.imageWithProvenance({'location':'2'})
+        repo.updateMany([changed])
+        self.serializer.serializeList.assert_called_with(
+            [img1, changed, new1, new2])
+        self.assertEqual(2, self.filesys.write.call_count)
+
+    def test_Empty_batches_are_not_written(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        repo.addMany([])
+        repo.updateMany([])
+        repo.extendSeries([])
+        assert not self.serializer.deserializeList.called
+        assert not self.filesys.write.called
+
+    def test_addMany_saves_file_that_is_in_batch_twice_once(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        self.serializer.deserializeList.return_value = []
+        first = self.imageWithProvenance({'location':'1', 'v':1})
+        other = self.imageWithProvenance({'location':'2'})
+        last = self.imageWithProvenance({'location':'1', 'v':2})
+        repo.addMany([first, other, last])
+        self.serializer.serializeList.assert_called_with([other, last])
+
+    def test_extendSeries_updates_series_with_one_write(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        repo.updateMany = Mock()
+        s1, s2 = Mock(), Mock()
+        repo.extendSeries([(s1, ['a']), (s2, ['b', 'c'])])
+        repo.updateMany.assert_called_with([s1, s2])
+
+    def test_byFieldValues(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        img1 = self.imageWithProvenance({'location':'1','hash':'a'})
+        img2 = self.imageWithProvenance({'location':'2','hash':'b'})
+        img3 = self.imageWithProvenance({'location':'3'})
+        self.serializer.deserializeList.return_value = [img1, img2, img3]
+        self.assertEqual([img2], repo.byFieldValues('hash', ['b','c']))
+
     def test_byLocation(self):
         from niprov.jsonfile import JsonFile
         repo = JsonFile(self.dependencies)
         img1 = self.imageWithProvenance({'location':'1','path':'a'})
         img2 = self.imageWithProvenance({'location':'2','path':'b'})
-        repo.all = Mock()
-        repo.all.return_value = [img1, img2]
+        self.serializer.deserializeList.return_value = [img1, img2]
         out = repo.byLocation('2')
         self.assertEqual(img2, out)
 
@@ -74,21 +153,20 @@ class JsonFileTest(DependencyInjectionTestBase):
         img3 = self.imageWithProvenance({'added':datetime.datetime(1982, 3, 5)})
         img4 = self.imageWithProvenance({'added':datetime.datetime(1982, 4, 5)})
         img5 = self.imageWithProvenance({'added':datetime.datetime(1982, 5, 5)})
-        repo.all = Mock()
-        repo.all.return_value = [img1,img2,img3,img4,img5]
+        self.serializer.deserializeList.return_value = [img1,img2,img3,img4,img5]
         out = repo.latest(3)
         self.assertEqual([img5, img4, img3], out)
 
     def test_stats(self):
         from niprov.jsonfile import JsonFile
         repo = JsonFile(self.dependencies)
-        repo.all = Mock()
         records = [{},{},{},{},{},{},{},{},{},{},{}]
         totalsize = 0
         for r in records:
             r['size'] = random.randint(1,1000)
             totalsize += r['size']
-        repo.all.return_value = [self.imageWithProvenance(r) for r in records]
+        self.serializer.deserializeIter.return_value = iter(
+            [self.imageWithProvenance(r) for r in records])
         out = repo.statistics()
         self.assertEqual(11, out['count'])
         self.assertEqual(totalsize, out['totalsize'])
@@ -96,7 +174,6 @@ class JsonFileTest(DependencyInjectionTestBase):
     def test_stats_transient_file(self):
         from niprov.jsonfile import JsonFile
         repo = JsonFile(self.dependencies)
-        repo.all = Mock()
         records = [{},{},{},{},{},{},{},{},{},{},{}]
         totalsize = 0
         for r in records:
@@ -104,7 +181,8 @@ class JsonFileTest(DependencyInjectionTestBase):
             totalsize += r['size']
         totalsize -= records[3]['size']
         del records[3]['size']
-        repo.all.return_value = [self.imageWithProvenance(r) for r in records]
+        self.serializer.deserializeIter.return_value = iter(
+            [self.imageWithProvenance(r) for r in records])
         out = repo.statistics()
         self.assertEqual(totalsize, out['totalsize'])
         
@@ -114,8 +192,7 @@ class JsonFileTest(DependencyInjectionTestBase):
         img1 = self.imageWithProvenance({'id':'1'})
         img2 = self.imageWithProvenance({'id':'2'})
         img3 = self.imageWithProvenance({'id':'3'})
-        repo.all = Mock()
-        repo.all.return_value = [img1, img2, img3]
+        self.serializer.deserializeList.return_value = [img1, img2, img3]
         out = repo.byId('2')
         self.assertEqual(img2, out)
 
@@ -128,8 +205,7 @@ class JsonFileTest(DependencyInjectionTestBase):
         img3 = self.imageWithProvenance({'location':'m'})
         img4 = self.imageWithProvenance({'location':'f'})
         img5 = self.imageWithProvenance({'location':'x'})
-        repo.all = Mock()
-        repo.all.return_value = [img1,img2,img3,img4,img5]
+        self.serializer.deserializeList.return_value = [img1,img2,img3,img4,img5]
         out = repo.byLocations(['j','f','k'])
         self.assertEqual([img2, img4], out)
 
@@ -142,8 +218,7 @@ class JsonFileTest(DependencyInjectionTestBase):
         img3 = self.imageWithProvenance({'parents':['b'],'l':'b'})
         img4 = self.imageWithProvenance({'parents':['c','y'],'l':'d'})
         img5 = self.imageWithProvenance({'parents':['d'],'l':'e'})
-        repo.all = Mock()
-        repo.all.return_value = [img1, img2, img3, img4, img5]
+        self.serializer.deserializeList.return_value = [img1, img2, img3, img4, img5]
         out = repo.byParents(['x','y'])
         self.assertEqual([img2, img4], out)
 
@@ -154,6 +229,19 @@ class JsonFileTest(DependencyInjectionTestBase):
         repo.add(img)
         self.pictureCache.saveToDisk.assert_called_with(for_=img)
 
+    def test_Query_combines_fields_and_counts(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        img1 = self.imageWithProvenance({'subject':'a','modality':'MRI'})
+        img2 = self.imageWithProvenance({'subject':'a','modality':'MEG'})
+        img3 = self.imageWithProvenance({'subject':'b','modality':'MRI'})
+        self.serializer.deserializeList.return_value = [img1, img2, img3]
+        q = Query(self.dependencies).bySubject('a').byModality('MRI')
+        self.assertEqual([img1], repo.inquire(q))
+        self.assertEqual(1, repo.count(q))
+        q = Query(self.dependencies).byModality('MRI').sortBy('-subject')
+        self.assertEqual([img3, img1], repo.inquire(q))
+
     def test_Query_with_value_field(self):
         self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p['l']
         from niprov.jsonfile import JsonFile
@@ -162,88 +250,59 @@ class JsonFileTest(DependencyInjectionTestBase):
         img2 = self.imageWithProvenance({'color':'red','a':'d'})
         img3 = self.imageWithProvenance({'color':'blue','a':'f'})
         img4 = self.imageWithProvenance({'color':'red','a':'d'})
-        repo.all = Mock()
-        repo.all.return_value = [img1, img2, img3, img4]
-        q = Mock()
-        field1 = Mock()
-        field1.name = 'color'
-        field1.value = 'red'
-        field1.all = False
-        q.getFields.return_value = [field1]
+        self.serializer.deserializeList.return_value = [img1, img2, img3, img4]
+        q = Query(self.dependencies).where('color', 'red')
         out = repo.inquire(q)
         self.assertEqual([img2, img4], out)
 
     def test_Search_only_returns_objects_which_have_needle(self):
-        self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p['l']
-        from niprov.jsonfile import JsonFile
-        repo = JsonFile(self.dependencies)
-        img1 = self.imageWithProvenance({'transformation':'green blue'})
-        img2 = self.imageWithProvenance({'transformation':'yellow red'})
-        repo.all = Mock()
-        repo.all.return_value = [img1, img2]
+        repo, (img1, img2) = self.searchableRepo([
+            {'transformation':'green blue'}, {'transformation':'yellow red'}])
         out = repo.search('red')
         self.assertEqual([img2], out)
 
     def test_Search_sorts_results_by_number_of_matches(self):
-        self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p['l']
-        from niprov.jsonfile import JsonFile
-        repo = JsonFile(self.dependencies)
-        img1 = self.imageWithProvenance({'transformation':'red bluered'})
-        img2 = self.imageWithProvenance({'transformation':'red and green'})
-        img3 = self.imageWithProvenance({'transformation':'red pruple red red'})
-        img4 = self.imageWithProvenance({'transformation':'nuthin'})
-        repo.all = Mock()
-        repo.all.return_value = [img1, img2, img3, img4]
+        repo, (img1, img2, img3, img4) = self.searchableRepo([
+            {'transformation':'red bluered'}, 
+            {'transformation':'red and green'},
+            {'transformation':'red pruple red red'},
+            {'transformation':'nuthin'}])
         out = repo.search('red')
         self.assertEqual([img3, img1, img2], out)
 
-    def test_Search_looks_through_multiple_fields(self):
-        self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p['l']
-        from niprov.jsonfile import JsonFile
-        repo = JsonFile(self.dependencies)
-        i1 = self.imageWithProvenance({'color':'red'})
-        i2 = self.imageWithProvenance({'location':'redis'})
-        i3 = self.imageWithProvenance({'user':'reddit'})
-        i4 = self.imageWithProvenance({'subject':'red bastard'})
-        i5 = self.imageWithProvenance({'protocol':'reddish'})
-        i6 = self.imageWithProvenance({'transformation':'zoomed red'})
-        i7 = self.imageWithProvenance({'technique':'redshift'})
-        i8 = self.imageWithProvenance({'modality':'red'})
-        repo.all = Mock()
-        repo.all.return_value = [i1,i2,i3,i4,i5,i6,i7,i8]
+    def test_Search_looks_through_multiple_fields_and_matches_prefixes(self):
+        repo, images = self.searchableRepo([{'color':'red'}, 
+            {'location':'redis'}, {'user':'reddit'}, {'subject':'red bastard'},
+            {'protocol':'reddish'}, {'transformation':'zoomed red'},
+            {'technique':'redshift'}, {'modality':'Red'}])
+        images[1].provenance['location'] = 'redis'
+        images[1].location.toString.return_value = 'redis'
+        repo.reindex()
         out = repo.search('red')
-        self.assertNotIn(i1, out)
-        self.assertIn(i2, out)
-        self.assertIn(i3, out)
-        self.assertIn(i4, out)
-        self.assertIn(i5, out)
-        self.assertIn(i6, out)
-        self.assertIn(i7, out)
-        self.assertIn(i8, out)
+        self.assertEqual(images[1:], sorted(out, key=images.index))
 
     def test_Search_distinguishes_words_as_OR_search(self):
-        self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p['l']
-        from niprov.jsonfile import JsonFile
-        repo = JsonFile(self.dependencies)
-        i1 = self.imageWithProvenance({'transformation':'blue red red'})       #2
-        i2 = self.imageWithProvenance({'transformation':'red blue green red'}) #3
-        i3 = self.imageWithProvenance({'transformation':'green blue'})         #1
-        repo.all = Mock()
-        repo.all.return_value = [i1,i2,i3]
+        repo, (i1, i2, i3) = self.searchableRepo([
+            {'transformation':'blue red red'},
+            {'transformation':'red blue green red'},
+            {'transformation':'green blue'}])
         out = repo.search('red green')
         self.assertEqual([i2, i1, i3], out)
 
-    def test_Search_returns_max_20_results(self):
-        self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p['l']
-        from niprov.jsonfile import JsonFile
-        repo = JsonFile(self.dependencies)
-        recs = []
-        for i in range(35):
-            recs.append(self.imageWithProvenance({'transformation':'red'}))
-        repo.all = Mock()
-        repo.all.return_value = recs
-        out = repo.search('red')
-        self.assertEqual(20, len(out))
+    def test_Search_returns_pages_of_20_results_by_default(self):
+        repo, images = self.searchableRepo([{'transformation':'red'}] * 35)
+        self.assertEqual(20, len(repo.search('red')))
+        self.assertEqual(15, len(repo.search('red', start=20)))
+        self.assertEqual(5, len(repo.search('red', n=5)))
+
+    def test_Search_index_is_kept_up_to_date_when_saving(self):
+        repo, (img1, img2) = self.searchableRepo([{'subject':'anne'}, 
+            {'subject':'bob'}])
+        self.assertEqual([img1], repo.search('anne'))
+        img2.provenance['subject'] = 'anne b'
+        repo.update(img2)
+        self.assertEqual([img1, img2], repo.search('anne'))
+        self.assertTrue(os.path.isfile(repo.datafile + '.search'))
 
     def test_Query_with_ALL_field(self):
         self.fileFactory.fromProvenance.side_effect = lambda p: 'img_'+p['l']
@@ -254,13 +313,8 @@ class JsonFileTest(DependencyInjectionTestBase):
         img3 = self.imageWithProvenance({'color':'blue','a':'f'})
         img4 = self.imageWithProvenance({'color':'green','a':'d'})
         img5 = self.imageWithProvenance({'color':'blue','a':'g'})
-        repo.all = Mock()
-        repo.all.return_value = [img1, img2, img3, img4, img5]
-        q = Mock()
-        field1 = Mock()
-        field1.name = 'color'
-        field1.all = True
-        q.getFields.return_value = [field1]
+        self.serializer.deserializeList.return_value = [img1, img2, img3, img4, img5]
+        q = Query(self.dependencies).allValues('color')
         out = repo.inquire(q)
         self.assertIn('red', out)
         self.assertIn('green', out)
@@ -274,8 +328,7 @@ class JsonFileTest(DependencyInjectionTestBase):
         img.getSeriesId.return_value = '2'
         img1 = self.imageWithProvenance({'seriesuid':'1','path':'a'})
         img2 = self.imageWithProvenance({'seriesuid':'2','path':'b'})
-        repo.all = Mock()
-        repo.all.return_value = [img1, img2]
+        self.serializer.deserializeList.return_value = [img1, img2]
         out = repo.getSeries(img)
         self.assertEqual(img2, out)
 
@@ -284,8 +337,152 @@ class JsonFileTest(DependencyInjectionTestBase):
         repo = JsonFile(self.dependencies)
         img = Mock()
         img.getSeriesId.return_value = None
-        repo.all = Mock()
         out = repo.getSeries(img)
-        assert not repo.all.called, "Should not be called if no series id"
+        assert not self.filesys.read.called, "Should not be called if no series id"
         self.assertEqual(None, out)
 
+
+    def test_Reads_file_only_once_while_it_does_not_change(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        img1 = self.imageWithProvenance({'id':'1','location':'a'})
+        img2 = self.imageWithProvenance({'id':'2','location':'b'})
+        self.serializer.deserializeList.return_value = [img1, img2]
+        self.filesys.stat.return_value = Mock(st_size=10, st_mtime=1, st_ino=3)
+        self.assertEqual(img2, repo.byId('2'))
+        self.assertEqual(img1, repo.byLocation('a'))
+        self.assertEqual([img1, img2], repo.byLocations(['b','a']))
+        self.assertEqual(1, self.filesys.read.call_count)
+
+    def test_Reads_file_again_if_it_changed(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        self.filesys.stat.return_value = Mock(st_size=10, st_mtime=1, st_ino=3)
+        repo.byId('2')
+        self.filesys.stat.return_value = Mock(st_size=10, st_mtime=2, st_ino=3)
+        repo.byId('2')
+        self.assertEqual(2, self.filesys.read.call_count)
+
+    def test_Keeps_files_written_in_memory(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        self.filesys.stat.return_value = Mock(st_size=10, st_mtime=1, st_ino=3)
+        repo.byId('2')
+        repo.add(self.copyableImage({'location':'a', 'id':'2'}))
+        self.assertEqual('a', repo.byId('2').provenance['location'])
+        self.assertEqual(1, self.filesys.read.call_count)
+
+    def test_Reads_file_again_if_it_changed_after_writing_it(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        self.filesys.stat.return_value = Mock(st_size=10, st_mtime=1, st_ino=3)
+        repo.add(self.copyableImage({'location':'a', 'id':'2'}))
+        self.filesys.stat.return_value = Mock(st_size=12, st_mtime=2, st_ino=3)
+        repo.byId('2')
+        self.assertEqual(2, self.filesys.read.call_count)
+
+    def test_Files_handed_out_and_saved_are_copies_of_those_in_memory(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        self.filesys.stat.return_value = Mock(st_size=10, st_mtime=1, st_ino=3)
+        self.serializer.deserializeList.return_value = [
+            self.copyableImage({'location':'a', 'parents':['p']})]
+        image = repo.byLocation('a')
+        image.provenance['parents'].append('q')
+        saved = self.copyableImage({'location':'b', 'v':1})
+        repo.add(saved)
+        saved.provenance['v'] = 2
+        self.assertEqual(['p'], repo.byLocation('a').provenance['parents'])
+        self.assertEqual(1, repo.byLocation('b').provenance['v'])
+        self.assertEqual(1, repo.all()[1].provenance['v'])
+        self.assertEqual(1, self.filesys.read.call_count)
+
+    def test_No_file_means_no_images(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        self.filesys.stat.side_effect = OSError
+        self.assertEqual([], repo.all())
+        self.assertIsNone(repo.byId('2'))
+
+    def test_iterAll_parses_file_in_pieces_if_not_in_memory(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        img1 = self.imageWithProvenance({'location':'a'})
+        self.serializer.deserializeIter.return_value = iter([img1])
+        out = list(repo.iterAll())
+        self.assertEqual([img1], out)
+        self.serializer.deserializeIter.assert_called_with(
+            self.filesys.readChunks(repo.datafile))
+        assert not self.filesys.read.called
+
+    def test_iterAll_uses_contents_in_memory_if_file_unchanged(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        img1 = self.imageWithProvenance({'location':'a'})
+        self.serializer.deserializeList.return_value = [img1]
+        self.filesys.stat.return_value = Mock(st_size=10, st_mtime=1, st_ino=3)
+        repo.all()
+        self.assertEqual([img1], list(repo.iterAll()))
+        assert not self.serializer.deserializeIter.called
+
+    def test_iterAll_sort_and_projection(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        self.fileFactory.fromProvenance.side_effect = lambda p: p
+        self.serializer.deserializeIter.return_value = iter([
+            self.imageWithProvenance({'location':'a','size':2,'x':1}),
+            self.imageWithProvenance({'location':'b','size':1,'x':2})])
+        out = list(repo.iterAll(projection=['size'], sort='size'))
+        self.assertEqual([{'location':'b','size':1},
+                          {'location':'a','size':2}], out)
+
+    def test_iterAll_on_missing_file_is_empty(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        self.filesys.stat.side_effect = OSError
+        self.assertEqual([], list(repo.iterAll()))
+
+    def test_stats_go_through_files_one_at_a_time(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        self.serializer.deserializeIter.return_value = iter([
+            self.imageWithProvenance({'size':2}), 
+            self.imageWithProvenance({}), 
+            self.imageWithProvenance({'size':5})])
+        out = repo.statistics()
+        self.assertEqual({'count':3, 'totalsize':7}, out)
+        assert not self.filesys.read.called
+
+    def test_Tallies_are_kept_up_to_date_by_writes(self):
+        repo, images = self.searchableRepo([{'modality':'MRI', 'size':2}, 
+            {'modality':'MRI', 'size':3}])
+        self.assertEqual({'MRI':{'count':2, 'totalsize':5}}, 
+            repo.facet('modality'))
+        self.serializer.deserializeIter.reset_mock()
+        repo.update(self.imageWithProvenance({'location':'1', 
+            'modality':'EEG', 'size':3}))
+        repo.add(self.imageWithProvenance({'location':'2', 'size':4}))
+        repo.update(self.imageWithProvenance({'location':'9', 
+            'modality':'EEG', 'size':1}))
+        self.assertEqual({'count':3, 'totalsize':9}, repo.statistics())
+        self.assertEqual({'MRI':{'count':1, 'totalsize':2}, 
+            'EEG':{'count':1, 'totalsize':3}}, repo.facet('modality'))
+        assert not self.serializer.deserializeIter.called
+
+    def test_revision_is_made_from_fingerprint_of_file(self):
+        from niprov.jsonfile import JsonFile
+        repo = JsonFile(self.dependencies)
+        self.filesys.stat.return_value = Mock(st_size=12, st_mtime=3.5, 
+            st_ino=7)
+        self.assertEqual('12-3.5-7', repo.revision())
+        self.filesys.stat.side_effect = OSError
+        self.assertEqual('0', repo.revision())
+
+    def test_Tallies_are_counted_again_if_file_changed_otherwise(self):
+        repo, images = self.searchableRepo([{'modality':'MRI', 'size':2}])
+        self.assertEqual({'count':1, 'totalsize':2}, repo.statistics())
+        images.append(self.imageWithProvenance({'location':'1', 
+            'modality':'MRI', 'size':3}))
+        self.filesys.stat.return_value = Mock()
+        self.assertEqual({'MRI':{'count':2, 'totalsize':5}}, 
+            repo.facet('modality'))
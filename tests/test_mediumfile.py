@@ -13,6 +13,14 @@ class FileMediumTests(DependencyInjectionTestBase):
         self.assertEqual('Once upon a time..', 
             self.filesys.write.call_args[0][1])
 
+    def test_Writes_pieces_of_formattedProvenance_one_at_a_time(self):
+        from niprov.mediumfile import FileMedium
+        medium = FileMedium(self.dependencies)
+        pieces = iter(['Once ', 'upon ', 'a time..'])
+        out = medium.export(pieces, self.format)
+        assert not self.filesys.write.called
+        self.assertEqual(pieces, self.filesys.writeChunks.call_args[0][1])
+
     def test_Comes_up_with_filename(self):
         from niprov.mediumfile import FileMedium
         self.clock.getNowString.return_value = 'hammertime'
@@ -51,7 +59,9 @@ class FileMediumTests(DependencyInjectionTestBase):
         from niprov.mediumfile import FileMedium
         from niprov.pictures import PictureCache
         medium = FileMedium(self.dependencies)
-        fmt = PictureCache(Mock())
+        self.config.picture_cache_memory = 64
+        self.config.picture_cache_disk = 0
+        fmt = PictureCache(self.dependencies)
         out = medium.export('provstr', fmt)
         self.listener.exportedToFile.assert_called_with('provstr')
         self.assertEqual(out, 'provstr')
@@ -59,7 +59,7 @@ class ParrecTests(BaseFileTests):
     def test_Tells_camera_to_save_snapshot_to_cache(self):
         img = self.libs.nibabel.load.return_value
         data = sentinel.imagedata
-        img.get_data.return_value = data
+        img.dataobj = data
         out = self.file.inspect()
         self.camera.saveSnapshot.assert_called_with(data, for_=self.file)
 
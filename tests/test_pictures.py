@@ -10,11 +10,18 @@ class PictureCacheTests(TestCase):
         if os.path.isdir(picdir):
             shutil.rmtree(picdir)
         import niprov.pictures
-        niprov.pictures._CACHE = {} # reset cache
+        niprov.pictures._CACHE.clear() # reset cache
+        niprov.pictures._MEMORY['configured'] = False
+        niprov.pictures._DISK['bytes'] = None
+        niprov.pictures._DISK['evictions'] = 0
+        self.dependencies = Mock()
+        self.config = self.dependencies.getConfiguration()
+        self.config.picture_cache_memory = 1
+        self.config.picture_cache_disk = 0
 
     def test_Serialize(self):
         from niprov.pictures import PictureCache
-        pictures = PictureCache(sentinel.dependencies)
+        pictures = PictureCache(self.dependencies)
         pictures.getFilepath = Mock()
         fpath = pictures.serializeSingle(sentinel.img)
         pictures.getFilepath.assert_called_with(for_=sentinel.img)
@@ -22,7 +29,7 @@ class PictureCacheTests(TestCase):
 
     def test_Provides_new_picture_file_handle(self):
         from niprov.pictures import PictureCache
-        pictures = PictureCache(sentinel.dependencies)
+        pictures = PictureCache(self.dependencies)
         newPicture = pictures.new()
         self.assertTrue(hasattr(newPicture, 'write'))
 
@@ -30,7 +37,7 @@ class PictureCacheTests(TestCase):
         from niprov.pictures import PictureCache
         myImg = Mock()
         myImg.provenance = {'id':'007'}
-        pictures = PictureCache(sentinel.dependencies)
+        pictures = PictureCache(self.dependencies)
         self.assertIsNone(pictures.getFilepath(for_=myImg))
         pictures.keep(io.BytesIO('/x10/x05/x5f'), for_=myImg)
         picfpath = os.path.expanduser('~/.niprov-snapshots/007.png')
@@ -40,7 +47,7 @@ class PictureCacheTests(TestCase):
         from niprov.pictures import PictureCache
         myImg = Mock()
         myImg.provenance = {'id':'007'}
-        pictures = PictureCache(sentinel.dependencies)
+        pictures = PictureCache(self.dependencies)
         newPicture = pictures.new()
         newPicture.write('/x10/x05/x5f')
         pictures.keep(newPicture, for_=myImg)
@@ -51,7 +58,7 @@ class PictureCacheTests(TestCase):
         from niprov.pictures import PictureCache
         myImg = Mock()
         myImg.provenance = {'id':'007'}
-        pictures = PictureCache(sentinel.dependencies)
+        pictures = PictureCache(self.dependencies)
         pictures.saveToDisk(for_=myImg) #shouldn't do anything
         pictures.keep(io.BytesIO('/x10/x05/x5f'), for_=myImg)
         pictures.saveToDisk(for_=myImg)
@@ -64,10 +71,10 @@ class PictureCacheTests(TestCase):
         import niprov.pictures
         myImg = Mock()
         myImg.provenance = {'id':'007'}
-        pictures = niprov.pictures.PictureCache(sentinel.dependencies)
+        pictures = niprov.pictures.PictureCache(self.dependencies)
         pictures.keep(io.BytesIO('/x10/x05/x5f'), for_=myImg)
         pictures.saveToDisk(for_=myImg)
-        niprov.pictures._CACHE = {} # reset cache
+        niprov.pictures._CACHE.clear() # reset cache
         picfpath = os.path.expanduser('~/.niprov-snapshots/007.png')
         self.assertEqual(picfpath, pictures.getFilepath(for_=myImg))
 
@@ -75,9 +82,68 @@ class PictureCacheTests(TestCase):
         from niprov.pictures import PictureCache
         myImg = Mock()
         myImg.provenance = {'id':'007'}
-        pictures = PictureCache(sentinel.dependencies)
+        pictures = PictureCache(self.dependencies)
         pictures.keep(bson.Binary('/x10/x05/x5f'), for_=myImg)
         self.assertEqual('/x10/x05/x5f', pictures.getBytes(for_=myImg))
-        
-    
+
+    def imageWithId(self, imgId):
+        img = Mock()
+        img.provenance = {'id':imgId}
+        return img
+
+    def test_Memory_cache_size_is_set_by_first_configuration(self):
+        from niprov.pictures import PictureCache
+        PictureCache(self.dependencies)
+        self.config.picture_cache_memory = 5
+        pictures = PictureCache(self.dependencies)
+        self.assertEqual(1024*1024, pictures.statistics()['memory']['maxbytes'])
+
+    def test_Memory_cache_removes_least_recently_used_pictures(self):
+        from niprov.pictures import PictureCache
+        pictures = PictureCache(self.dependencies)
+        half = 'x'*(512*1024)
+        a, b, c = [self.imageWithId(i) for i in 'abc']
+        pictures.keep(half, for_=a)
+        pictures.keep(half, for_=b)
+        pictures.getBytes(for_=a)
+        pictures.keep(half, for_=c)
+        self.assertEqual(half, pictures.getBytes(for_=a))
+        self.assertIsNone(pictures.getBytes(for_=b))
+        stats = pictures.statistics()['memory']
+        self.assertEqual(2, stats['count'])
+        self.assertEqual(1024*1024, stats['bytes'])
+        self.assertEqual(1, stats['evictions'])
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+
+    def test_Picture_larger_than_memory_cache_is_not_kept(self):
+        from niprov.pictures import PictureCache
+        pictures = PictureCache(self.dependencies)
+        img = self.imageWithId('a')
+        pictures.keep('x'*(1024*1024+1), for_=img)
+        self.assertIsNone(pictures.getBytes(for_=img))
+
+    def test_getBytes_reads_picture_from_disk_if_not_in_memory(self):
+        import niprov.pictures
+        pictures = niprov.pictures.PictureCache(self.dependencies)
+        img = self.imageWithId('007')
+        pictures.keep('/x10/x05/x5f', for_=img)
+        pictures.saveToDisk(for_=img)
+        niprov.pictures._CACHE.clear()
+        self.assertEqual('/x10/x05/x5f', pictures.getBytes(for_=img))
+        self.assertIn('007', niprov.pictures._CACHE)
+
+    def test_Disk_cache_removes_least_recently_used_pictures(self):
+        from niprov.pictures import PictureCache
+        self.config.picture_cache_disk = 1
+        pictures = PictureCache(self.dependencies)
+        picdir = os.path.expanduser('~/.niprov-snapshots')
+        third = 'x'*(400*1024)
+        images = [self.imageWithId(i) for i in 'abc']
+        for t, img in enumerate(images):
+            pictures.keep(third, for_=img)
+            fpath = pictures.saveToDisk(for_=img)
+            os.utime(fpath, (t, t))
+        self.assertEqual(['b.png', 'c.png'], sorted(os.listdir(picdir)))
+        self.assertEqual(1, pictures.statistics()['disk']['evictions'])
 
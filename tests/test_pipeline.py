@@ -29,6 +29,44 @@ class PipelineTests(DependencyInjectionTestBase):
         pipeline = Pipeline(pipelineFiles)
         self.assertEqual(set([r1,r2]), pipeline.roots)
 
+    def test_Files_with_parents_outside_pipeline_are_roots(self):
+        from niprov.pipeline import Pipeline
+        a = self.fileWithLocationAndParents('h:/a',['h:/unknown'])
+        b = self.fileWithLocationAndParents('h:/b',['h:/a','h:/other'])
+        pipeline = Pipeline([a,b])
+        self.assertEqual(set([a]), pipeline.roots)
+        self.assertEqual({'h:/a':{'h:/b':{}}}, pipeline.locationTree)
+
+    def test_Cycles_end_the_branch(self):
+        from niprov.pipeline import Pipeline
+        r = self.fileWithLocationAndParents('h:/r',[])
+        a = self.fileWithLocationAndParents('h:/a',['h:/r','h:/b'])
+        b = self.fileWithLocationAndParents('h:/b',['h:/a'])
+        pipeline = Pipeline([r,a,b])
+        self.assertEqual({'h:/r':{'h:/a':{'h:/b':{}}}}, pipeline.locationTree)
+
+    def test_File_is_again_in_tree_under_other_branches(self):
+        from niprov.pipeline import Pipeline
+        r = self.fileWithLocationAndParents('h:/r',[])
+        a = self.fileWithLocationAndParents('h:/a',['h:/r'])
+        b = self.fileWithLocationAndParents('h:/b',['h:/a','h:/r'])
+        pipeline = Pipeline([r,a,b])
+        self.assertEqual({'h:/r':{'h:/a':{'h:/b':{}}, 'h:/b':{}}}, 
+            pipeline.locationTree)
+
+    def test_Long_chain_of_files(self):
+        from niprov.pipeline import Pipeline
+        n = 3000
+        files = [self.fileWithLocationAndParents('h:/0',[])]
+        for i in range(1, n):
+            files.append(self.fileWithLocationAndParents('h:/%d' % i, 
+                ['h:/%d' % (i-1)]))
+        branch = Pipeline(files).locationTree
+        for i in range(n):
+            self.assertEqual(['h:/%d' % i], branch.keys())
+            branch = branch['h:/%d' % i]
+        self.assertEqual({}, branch)
+
     def fileWithLocationAndParents(self, loc, parents):
         f = Mock()
         f.location.toString.return_value = loc
@@ -34,8 +34,9 @@ class PipelineFactoryTests(DependencyInjectionTestBase):
         factory = PipelineFactory(dependencies=self.dependencies)
         with patch('niprov.pipelinefactory.Pipeline') as PipelineCtr:
             pipeline = factory.forFile(t)
-            PipelineCtr.assert_called_with(repodict.values())
-            self.assertEqual(3, self.repo.byLocations.call_count)
+            self.assertEqual(set(repodict.values()), 
+                set(PipelineCtr.call_args[0][0]))
+            self.assertEqual(2, self.repo.byLocations.call_count)
             self.assertEqual(1, self.repo.byParents.call_count)
 
     def test_forFile_makes_pipeline_with_targets_children(self):
@@ -57,9 +58,11 @@ class PipelineFactoryTests(DependencyInjectionTestBase):
         factory = PipelineFactory(dependencies=self.dependencies)
         with patch('niprov.pipelinefactory.Pipeline') as PipelineCtr:
             pipeline = factory.forFile(t)
-            PipelineCtr.assert_called_with(repodict.values())
-            self.assertEqual(1, self.repo.byLocations.call_count)
+            self.assertEqual(set(repodict.values()), 
+                set(PipelineCtr.call_args[0][0]))
+            self.assertEqual(0, self.repo.byLocations.call_count)
             self.assertEqual(3, self.repo.byParents.call_count)
+            self.repo.byParents.assert_called_with(['c2a', 'c2b'])
 
     def test_forFile_should_call_repo_with_list_not_set(self):
         from niprov.pipelinefactory import PipelineFactory
@@ -73,8 +76,121 @@ class PipelineFactoryTests(DependencyInjectionTestBase):
         factory = PipelineFactory(dependencies=self.dependencies)
         with patch('niprov.pipelinefactory.Pipeline') as PipelineCtr:
             pipeline = factory.forFile(t)
-            self.repo.byLocations.assert_called_with([])
-            self.repo.byLocations.assert_any_call(['p1a','p1b'])
+            self.repo.byLocations.assert_called_once_with(['p1a','p1b'])
+
+    def test_forFile_stops_at_parents_that_are_descendants(self):
+        from niprov.pipelinefactory import PipelineFactory
+        t = self.fileWithLocation('t')
+        c = self.fileWithLocation('c')
+        t.provenance['parents'] = ['c']
+        c.provenance['parents'] = ['t']
+        repodict = {'t':t, 'c':c}
+        self.repo.byLocations.side_effect = lambda ls: [repodict[l] for l in ls]
+        self.repo.byParents.side_effect = lambda ps: [repodict[
+            repodict[p].provenance['parents'][0]] for p in ps]
+        factory = PipelineFactory(dependencies=self.dependencies)
+        with patch('niprov.pipelinefactory.Pipeline') as PipelineCtr:
+            factory.forFile(t)
+            self.assertEqual(set([t, c]), set(PipelineCtr.call_args[0][0]))
+            self.assertEqual(1, self.repo.byLocations.call_count)
+            self.assertEqual(1, self.repo.byParents.call_count)
+
+    def test_forFile_follows_at_most_depth_generations(self):
+        from niprov.pipelinefactory import PipelineFactory
+        chain = [self.fileWithLocation(str(n)) for n in range(5)]
+        for n in range(1, 5):
+            chain[n].provenance['parents'] = [str(n-1)]
+        self.repo.byLocations.side_effect = lambda ls: [chain[int(l)] 
+            for l in ls]
+        self.repo.byParents.side_effect = lambda ps: [chain[int(p)+1] 
+            for p in ps if int(p) < 4]
+        factory = PipelineFactory(dependencies=self.dependencies)
+        with patch('niprov.pipelinefactory.Pipeline') as PipelineCtr:
+            factory.forFile(chain[2], depth=1)
+            self.assertEqual(set(chain[1:4]), 
+                set(PipelineCtr.call_args[0][0]))
+
+    def familyRepo(self, files):
+        """Have the repository look up files by location and parents."""
+        byLoc = {f.location.toString():f for f in files}
+        self.repo.byLocations.side_effect = lambda ls: [byLoc[l] for l in ls
+            if l in byLoc]
+        self.repo.byParents.side_effect = lambda ps: [f for f in files 
+            if set(f.provenance.get('parents', [])) & set(ps)]
+
+    def relative(self, loc, parents=(), transformation=None):
+        f = self.fileWithLocation(loc)
+        f.provenance.update({'id':loc.upper(), 'parents':list(parents), 
+            'path':'/data/'+loc})
+        if transformation:
+            f.provenance['transformation'] = transformation
+        f.parents = list(parents)
+        return f
+
+    def test_neighbourhood_collapses_siblings_with_same_transformation(self):
+        from niprov.pipelinefactory import PipelineFactory
+        p = self.relative('p')
+        t = self.relative('t', ['p'], 'import')
+        blurred = [self.relative('b%d' % n, ['t'], 'blur') for n in range(3)]
+        masked = self.relative('m', ['t'], 'mask')
+        grandchild = self.relative('g', ['m'], 'blur')
+        self.familyRepo([p, t, masked, grandchild] + blurred)
+        factory = PipelineFactory(dependencies=self.dependencies)
+        hood = factory.neighbourhood(t)
+        self.assertEqual('t', hood['center'])
+        nodes = {n['key']:n for n in hood['nodes']}
+        self.assertEqual(set(['p', 't', 'm', 'transformation t:blur:0']), 
+            set(nodes))
+        self.assertEqual(-1, nodes['p']['generation'])
+        self.assertEqual('/data/m', nodes['m']['path'])
+        group = nodes['transformation t:blur:0']
+        self.assertEqual((3, 'blur', 'T', 1), (group['count'], 
+            group['transformation'], group['parentid'], group['generation']))
+        self.assertIn({'source':'t', 'target':'transformation t:blur:0'}, 
+            hood['links'])
+        self.assertIn({'source':'p', 'target':'t'}, hood['links'])
+        hood = factory.neighbourhood(t, depth=2)
+        self.assertIn('g', [n['key'] for n in hood['nodes']])
+
+    def test_neighbourhood_lists_group_a_page_at_a_time(self):
+        from niprov.pipelinefactory import PipelineFactory
+        t = self.relative('t')
+        blurred = [self.relative('b%d' % n, ['t'], 'blur') for n in range(5)]
+        self.familyRepo([t] + blurred)
+        factory = PipelineFactory(dependencies=self.dependencies)
+        hood = factory.neighbourhood(t, fanout=2, transformation='blur', 
+            start=2)
+        nodes = {n['key']:n for n in hood['nodes']}
+        self.assertEqual(set(['t', 'b2', 'b3', 'more t:blur:4']), set(nodes))
+        self.assertEqual(1, nodes['more t:blur:4']['count'])
+        assert not self.repo.byLocations.called
+
+    def test_neighbourhood_collapses_relatives_beyond_fanout(self):
+        from niprov.pipelinefactory import PipelineFactory
+        t = self.relative('t')
+        children = [self.relative('c%d' % n, ['t'], 'step%d' % n) 
+            for n in range(5)]
+        self.familyRepo([t] + children)
+        factory = PipelineFactory(dependencies=self.dependencies)
+        hood = factory.neighbourhood(t, fanout=3)
+        nodes = {n['key']:n for n in hood['nodes']}
+        self.assertEqual(set(['t', 'c0', 'c1', 'c2', 'more t:None:3']), 
+            set(nodes))
+        self.assertEqual(2, nodes['more t:None:3']['count'])
+        hood = factory.neighbourhood(t, fanout=3, start=3)
+        self.assertEqual(set(['t', 'c3', 'c4']), 
+            set([n['key'] for n in hood['nodes']]))
+
+    def test_neighbourhood_shows_at_least_one_relative(self):
+        from niprov.pipelinefactory import PipelineFactory
+        t = self.relative('t')
+        children = [self.relative('c%d' % n, ['t'], 'step%d' % n) 
+            for n in range(3)]
+        self.familyRepo([t] + children)
+        factory = PipelineFactory(dependencies=self.dependencies)
+        hood = factory.neighbourhood(t, fanout=0)
+        nodes = {n['key']:n for n in hood['nodes']}
+        self.assertEqual(set(['t', 'c0', 'more t:None:1']), set(nodes))
 
     def fileWithLocation(self, loc):
         f = Mock()
@@ -108,6 +108,23 @@ class QueryTest(DependencyInjectionTestBase):
         self.assertEqual('modality', q.getFields()[0].name)
         self.assertTrue(q.getFields()[0].all)
 
+    def test_All_values_of_facet_without_conditions_are_read_from_tallies(self):
+        from niprov.querying import Query
+        self.repo.facet.return_value = {'MRI':{}, 'EEG':{}}
+        self.assertEqual(['EEG', 'MRI'], list(
+            Query(self.dependencies).allModalities()))
+        self.repo.facet.assert_called_with('modality')
+        assert not self.repo.inquire.called
+        self.repo.inquire.return_value = ['MRI']
+        list(Query(self.dependencies).bySubject('a').allModalities())
+        assert self.repo.inquire.called
+
+    def test_facet(self):
+        from niprov.querying import Query
+        out = Query(self.dependencies).facet('user')
+        self.repo.facet.assert_called_with('user')
+        self.assertEqual(self.repo.facet(), out)
+
     def test_allUsers(self):
         from niprov.querying import Query
         q = Query(self.dependencies).allUsers()
@@ -126,6 +143,8 @@ class QueryTest(DependencyInjectionTestBase):
         target.provenance = {'size':0}
         results = Query(self.dependencies).copiesOf(target)
         self.assertEqual(0, len(results))
+        self.assertEqual(0, results.count())
+        assert not self.repo.count.called
 
     def test_copiesOf(self):
         from niprov.querying import Query
@@ -136,5 +155,54 @@ class QueryTest(DependencyInjectionTestBase):
         self.assertEqual('hash', q.getFields()[0].name)
         self.assertEqual('a7b8c9', q.getFields()[0].value)
 
+    def test_copiesOf_with_only_sample_digest_confirms_by_full_digest(self):
+        from niprov.querying import Query
+        target = Mock()
+        target.provenance = {'hash-sample':'s1', 'size':1}
+        same, other = Mock(), Mock()
+        self.repo.inquire.return_value = [same, other]
+        self.hasher.sameContent.side_effect = lambda t, o: o is same
+        q = Query(self.dependencies).copiesOf(target)
+        self.assertEqual(1, len(q.getFields()))
+        self.assertEqual('hash-sample', q.getFields()[0].name)
+        self.assertEqual('s1', q.getFields()[0].value)
+        self.assertEqual([same], list(q))
+        self.hasher.sameContent.assert_any_call(target, other)
+
 
+    def test_Conditions_are_combined(self):
+        from niprov.querying import Query
+        from niprov.filtering import Condition
+        q = Query(self.dependencies).bySubject('x').byModality('MRI')
+        q.sizeBetween(1, 5).having('acquired').lacking('approval')
+        self.assertEqual([Condition('subject','eq','x'), 
+            Condition('modality','eq','MRI'), Condition('size','gte',1),
+            Condition('size','lte',5), Condition('acquired','exists',True),
+            Condition('approval','exists',False)], q.getFilter())
+        self.assertIsNone(q.getDistinct())
 
+    def test_either_takes_filters_of_other_queries(self):
+        from niprov.querying import Query
+        from niprov.filtering import Condition, Either
+        q = Query(self.dependencies).either(
+            Query(self.dependencies).bySubject('a'),
+            Query(self.dependencies).whereIn('subject', ('b','c')))
+        self.assertEqual([Either([[Condition('subject','eq','a')], 
+            [Condition('subject','in',['b','c'])]])], q.getFilter())
+
+    def test_Sort_offset_and_limit(self):
+        from niprov.querying import Query
+        q = Query(self.dependencies)
+        self.assertEqual((None, 0, None), 
+            (q.getSort(), q.getOffset(), q.getLimit()))
+        q.sortBy('-added').offset(20).limit(10)
+        self.assertEqual(('-added', 20, 10), 
+            (q.getSort(), q.getOffset(), q.getLimit()))
+
+    def test_count_asks_repository(self):
+        from niprov.querying import Query
+        self.repo.count.return_value = 3
+        q = Query(self.dependencies).byProject('p')
+        self.assertEqual(3, q.count())
+        self.repo.count.assert_called_with(q)
+        assert not self.repo.inquire.called
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+import unittest
+from mock import Mock
+
+
+class RecordTests(unittest.TestCase):
+
+    def setUp(self):
+        self.factory = Mock()
+
+    def test_Provides_provenance_without_creating_file(self):
+        from niprov.record import Record
+        prov = {'location':'h:/p/f.nii','path':'/p/f.nii','parents':['x']}
+        record = Record(prov, self.factory)
+        self.assertIs(prov, record.provenance)
+        self.assertEqual('/p/f.nii', record.path)
+        self.assertEqual(['x'], record.parents)
+        assert not self.factory.fromProvenance.called
+
+    def test_Copy_has_its_own_provenance(self):
+        from niprov.record import Record
+        record = Record({'location':'h:/p/f.nii','parents':['x']}, 
+            self.factory)
+        other = record.copy()
+        other.provenance['parents'].append('y')
+        self.assertEqual(['x'], record.provenance['parents'])
+        self.assertEqual('h:/p/f.nii', other.provenance['location'])
+        assert not self.factory.fromProvenance.called
+
+    def test_Location_is_created_once_when_first_needed(self):
+        from niprov.record import Record
+        record = Record({'location':'h:/p/f.nii'}, self.factory)
+        assert not self.factory.locations.fromString.called
+        location = record.location
+        self.assertIs(location, record.location)
+        self.factory.locations.fromString.assert_called_once_with('h:/p/f.nii')
+        self.assertEqual(location.path, record.path)
+
+    def test_Other_attributes_come_from_file_created_once(self):
+        from niprov.record import Record
+        prov = {'location':'h:/p/f.nii'}
+        record = Record(prov, self.factory)
+        image = self.factory.fromProvenance.return_value
+        self.assertEqual(image.getSeriesId(), record.getSeriesId())
+        self.assertEqual(image.status, record.status)
+        self.factory.fromProvenance.assert_called_once_with(prov)
+        self.assertIs(image, record.file)
+
+    def test_Is_read_only(self):
+        from niprov.record import Record
+        record = Record({'location':'h:/p/f.nii'}, self.factory)
+        with self.assertRaises(AttributeError):
+            record.status = 'new'
+
+    def test_Special_attributes_do_not_create_file(self):
+        from niprov.record import Record
+        record = Record({'location':'h:/p/f.nii'}, self.factory)
+        self.assertFalse(hasattr(record, '__iter__'))
+        assert not self.factory.fromProvenance.called
+
@@ -11,6 +11,11 @@ class SearchTests(DependencyInjectionTestBase):
     def test_Search_delegates_to_repository(self):
         from niprov.searching import search
         results = search('one day', dependencies=self.dependencies)
-        self.repo.search.assert_called_with('one day')
+        self.repo.search.assert_called_with('one day', 20, 0)
         self.assertEqual(results, self.repo.search())
 
+    def test_Search_passes_page_of_results(self):
+        from niprov.searching import search
+        search('one day', 10, 30, dependencies=self.dependencies)
+        self.repo.search.assert_called_with('one day', 10, 30)
+
@@ -0,0 +1,317 @@
+from mock import Mock, patch
+from tests.ditest import DependencyInjectionTestBase
+from niprov.querying import Query
+from datetime import datetime
+import os, json, shutil, tempfile
+
+
+class SqliteRepositoryTest(DependencyInjectionTestBase):
+
+    def setUp(self):
+        super(SqliteRepositoryTest, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.addCleanup(self.forgetDatabases)
+        self.config.database_url = os.path.join(self.tempdir, 'prov.sqlite')
+        self.config.versions_kept = 0
+        self.serializer.encode.side_effect = json.dumps
+        self.serializer.decode.side_effect = json.loads
+        self.serializer.serializeSingle.side_effect = lambda i: json.dumps(
+            i.provenance, default=str)
+        self.serializer.deserialize.side_effect = lambda r: (
+            self.imageWithProvenance(json.loads(r)))
+        self.serializer.deserializeRecord.side_effect = (
+            self.serializer.deserialize.side_effect)
+        from niprov.sqlitedb import SqliteRepository
+        self.repo = SqliteRepository(self.dependencies)
+
+    def forgetDatabases(self):
+        import niprov.sqlitedb
+        niprov.sqlitedb._DATABASES.clear()
+        niprov.sqlitedb._PREPARED.clear()
+
+    def imageWithProvenance(self, prov):
+        img = Mock()
+        img.provenance = prov
+        img.replacedVersions = []
+        if 'location' in prov:
+            img.location.toString.return_value = prov['location']
+        return img
+
+    def addImages(self, *provs):
+        for prov in provs:
+            self.repo.add(self.imageWithProvenance(prov))
+
+    def locations(self, images):
+        return sorted([i.provenance['location'] for i in images])
+
+    def fieldQuery(self, name, value=None, all=False):
+        if all:
+            return Query(self.dependencies).allValues(name)
+        return Query(self.dependencies).where(name, value)
+
+    def test_Add_and_byLocation(self):
+        self.addImages({'location':'1','foo':'baz'})
+        self.assertEqual({'location':'1','foo':'baz'},
+            self.repo.byLocation('1').provenance)
+        self.assertIsNone(self.repo.byLocation('2'))
+
+    def test_Will_tell_PictureCache_to_persist_known_Snapshot(self):
+        img = self.imageWithProvenance({'location':'1','foo':'baz'})
+        self.repo.add(img)
+        self.pictureCache.saveToDisk.assert_called_with(for_=img)
+
+    def test_Update_replaces_record(self):
+        self.addImages({'location':'1','foo':'baz','parents':['a']})
+        self.repo.update(self.imageWithProvenance(
+            {'location':'1','foo':'bar','parents':['b']}))
+        self.assertEqual(1, len(self.repo.all()))
+        self.assertEqual('bar', self.repo.byLocation('1').provenance['foo'])
+        self.assertEqual([], self.repo.byParents(['a']))
+        self.assertEqual(['1'], self.locations(self.repo.byParents(['b'])))
+
+    def test_addMany_and_updateMany(self):
+        self.repo.addMany([self.imageWithProvenance({'location':'1'}),
+            self.imageWithProvenance({'location':'2','parents':['a']})])
+        self.repo.updateMany([self.imageWithProvenance(
+            {'location':'2','foo':'bar','parents':['b']})])
+        self.assertEqual(['1','2'], self.locations(self.repo.all()))
+        self.assertEqual('bar', self.repo.byLocation('2').provenance['foo'])
+        self.assertEqual(['2'], self.locations(self.repo.byParents(['b'])))
+
+    def test_byFieldValues(self):
+        self.addImages({'location':'1','hash':'x','foo':'a'},
+                       {'location':'2','hash':'y','foo':'b'},
+                       {'location':'3','hash':'z','foo':'c'})
+        self.assertEqual(['1','3'], self.locations(
+            self.repo.byFieldValues('hash', ['x','z'])))
+        self.assertEqual(['2'], self.locations(
+            self.repo.byFieldValues('foo', ['b'])))
+
+    def test_byFieldValues_looks_inside_list_fields(self):
+        self.addImages({'location':'1','tags':['a','b']},
+                       {'location':'2','tags':['c']},
+                       {'location':'3'})
+        self.assertEqual(['1'], self.locations(
+            self.repo.byFieldValues('tags', ['b','d'])))
+
+    def test_ensureIndexes_creates_missing_indexes(self):
+        self.assertEqual([], self.repo.ensureIndexes())
+        self.repo.conn.execute('DROP INDEX provenance_hash')
+        self.assertEqual(['provenance_hash'], self.repo.ensureIndexes())
+        self.assertIn('provenance_hash', self.repo.reindex())
+
+    def test_Persists_between_connections(self):
+        self.addImages({'location':'1'})
+        from niprov.sqlitedb import SqliteRepository
+        other = SqliteRepository(self.dependencies)
+        self.assertEqual(['1'], self.locations(other.all()))
+
+    def test_byLocations_byId_getSeries(self):
+        self.addImages({'location':'i','id':'a','seriesuid':'s1'},
+                       {'location':'j','id':'b','seriesuid':'s2'},
+                       {'location':'f','id':'c'})
+        self.assertEqual(['f','j'],
+            self.locations(self.repo.byLocations(['j','f','k'])))
+        self.assertEqual('j', self.repo.byId('b').provenance['location'])
+        img = Mock()
+        img.getSeriesId.return_value = 's1'
+        self.assertEqual('i', self.repo.getSeries(img).provenance['location'])
+        img.getSeriesId.return_value = None
+        self.assertIsNone(self.repo.getSeries(img))
+
+    def test_byParents(self):
+        self.addImages({'location':'a','parents':[]},
+                       {'location':'b','parents':['x','a']},
+                       {'location':'c','parents':['b']},
+                       {'location':'d','parents':['c','y']})
+        self.assertEqual(['b','d'],
+            self.locations(self.repo.byParents(['x','y'])))
+
+    def test_byParents_lists_file_once_if_parents_are_in_different_chunks(self):
+        self.addImages({'location':'b','parents':['x','y']})
+        with patch('niprov.sqlitedb.MAXVARS', 1):
+            self.assertEqual(['b'], 
+                self.locations(self.repo.byParents(['x','y'])))
+
+    def test_Objects_for_same_database_share_connection_and_setup(self):
+        from niprov.sqlitedb import SqliteRepository
+        with patch.object(SqliteRepository, '_prepare') as prepare:
+            other = SqliteRepository(self.dependencies)
+        self.assertIs(self.repo.conn, other.conn)
+        assert not prepare.called
+
+    def test_latest(self):
+        for month in range(1, 6):
+            self.addImages({'location':str(month),
+                'added':datetime(1982, month, 5)})
+        self.assertEqual(['5','4','3'], [i.provenance['location']
+            for i in self.repo.latest(3)])
+
+    def test_iterAll_fetches_in_batches(self):
+        self.addImages({'location':'1','size':10}, {'location':'2','size':5},
+            {'location':'3','size':7})
+        out = self.repo.iterAll(batchsize=2)
+        self.assertEqual(['1','2','3'], self.locations(out))
+
+    def test_iterAll_sort_and_projection(self):
+        self.fileFactory.fromProvenance.side_effect = lambda p: (
+            self.imageWithProvenance(p))
+        self.addImages({'location':'1','size':10,'x':'a'}, 
+            {'location':'2','size':5,'x':'c'}, {'location':'3','x':'b'})
+        self.assertEqual(['3','2','1'], [i.provenance['location'] 
+            for i in self.repo.iterAll(sort='size')])
+        self.assertEqual(['2','3','1'], [i.provenance['location'] 
+            for i in self.repo.iterAll(sort='-x')])
+        self.assertEqual([{'location':'1','size':10}], [i.provenance 
+            for i in self.repo.iterAll(projection=['size'], sort='-size')][:1])
+
+    def test_statistics(self):
+        self.addImages({'location':'1','size':10}, {'location':'2','size':5},
+            {'location':'3','transient':True})
+        self.assertEqual({'count':3, 'totalsize':15}, self.repo.statistics())
+
+    def test_revision_increases_with_each_save(self):
+        self.assertEqual(0, self.repo.revision())
+        self.addImages({'location':'1'})
+        self.repo.addMany([self.imageWithProvenance({'location':'2'}),
+            self.imageWithProvenance({'location':'3'})])
+        self.assertEqual(2, self.repo.revision())
+        self.repo.update(self.imageWithProvenance({'location':'2', 
+            'size':1}))
+        self.assertEqual(3, self.repo.revision())
+
+    def test_Empty_batches_are_not_saved(self):
+        self.repo.addMany([])
+        self.repo.updateMany([])
+        self.repo.extendSeries([])
+        self.assertEqual(0, self.repo.revision())
+
+    def test_Tallies_follow_updates(self):
+        self.addImages({'location':'1','modality':'MRI','size':10,
+            'acquired':datetime(2016, 5, 3, 14, 30)}, 
+            {'location':'2','modality':'MRI','size':5})
+        self.repo.update(self.imageWithProvenance(
+            {'location':'2','modality':'EEG','size':7}))
+        self.assertEqual({'count':2, 'totalsize':17}, self.repo.statistics())
+        self.assertEqual({'MRI':{'count':1, 'totalsize':10}, 
+            'EEG':{'count':1, 'totalsize':7}}, self.repo.facet('modality'))
+        self.assertEqual({'2016-05-03':{'count':1, 'totalsize':10}}, 
+            self.repo.facet('acquired'))
+        self.repo.updateApproval('1', 'granted')
+        self.repo.updateMany([self.imageWithProvenance(
+            {'location':'1','modality':'EEG','size':10})] * 2)
+        self.assertEqual({'EEG':{'count':2, 'totalsize':17}}, 
+            self.repo.facet('modality'))
+        self.assertEqual({}, self.repo.facet('acquired'))
+
+    def test_Tallies_are_counted_for_database_without_them(self):
+        self.addImages({'location':'1','user':'me','size':3})
+        self.repo.conn.execute('DROP TABLE tallies')
+        self.forgetDatabases()
+        from niprov.sqlitedb import SqliteRepository
+        other = SqliteRepository(self.dependencies)
+        self.assertEqual({'count':1, 'totalsize':3}, other.statistics())
+        self.assertEqual({'me':{'count':1, 'totalsize':3}}, 
+            other.facet('user'))
+
+    def test_Adds_acquired_column_to_older_database(self):
+        import sqlite3
+        self.repo.conn.close()
+        self.forgetDatabases()
+        os.remove(self.config.database_url)
+        conn = sqlite3.connect(self.config.database_url)
+        conn.execute('CREATE TABLE provenance (location TEXT PRIMARY KEY, '
+            'id TEXT, hash TEXT, "hash-sample" TEXT, seriesuid TEXT, '
+            'subject TEXT, project TEXT, modality TEXT, user TEXT, '
+            'approval TEXT, added TEXT, size INTEGER, record TEXT NOT NULL)')
+        conn.execute('INSERT INTO provenance (location, size, record) '
+            'VALUES (?, ?, ?)', ('1', 2, json.dumps({'location':'1', 
+            'size':2, 'acquired':'2015-01-02T03:04:05'})))
+        conn.commit()
+        conn.close()
+        from niprov.sqlitedb import SqliteRepository
+        repo = SqliteRepository(self.dependencies)
+        self.assertEqual({'2015-01-02':{'count':1, 'totalsize':2}}, 
+            repo.facet('acquired'))
+        q = Query(self.dependencies).acquiredBetween('2015-01-01', '2015-02')
+        self.assertEqual(['1'], self.locations(repo.inquire(q)))
+
+    def test_updateApproval(self):
+        self.addImages({'location':'1','approval':'pending'})
+        self.repo.updateApproval('1', 'granted')
+        self.assertEqual('granted',
+            self.repo.byLocation('1').provenance['approval'])
+        out = self.repo.inquire(self.fieldQuery('approval', 'granted'))
+        self.assertEqual(['1'], self.locations(out))
+
+    def test_Query_with_value_field(self):
+        self.addImages({'location':'1','modality':'MRI'},
+                       {'location':'2','modality':'MEG'},
+                       {'location':'3','modality':'MRI','color':'red'})
+        out = self.repo.inquire(self.fieldQuery('modality', 'MRI'))
+        self.assertEqual(['1','3'], self.locations(out))
+        out = self.repo.inquire(self.fieldQuery('color', 'red'))
+        self.assertEqual(['3'], self.locations(out))
+
+    def test_Query_with_ALL_field(self):
+        self.addImages({'location':'1','modality':'MRI','color':'red'},
+                       {'location':'2','modality':'MEG'},
+                       {'location':'3','modality':'MRI','color':'blue'})
+        out = self.repo.inquire(self.fieldQuery('modality', all=True))
+        self.assertEqual(['MEG','MRI'], sorted(out))
+        out = self.repo.inquire(self.fieldQuery('color', all=True))
+        self.assertEqual(['blue','red'], sorted(out))
+
+    def test_Search_sorts_results_by_number_of_matches(self):
+        self.addImages({'location':'1','transformation':'red bluered'},
+                       {'location':'2','transformation':'red and green'},
+                       {'location':'3','transformation':'red red red'},
+                       {'location':'4','transformation':'nuthin'})
+        out = self.repo.search('red')
+        self.assertEqual(['3','1','2'], [i.provenance['location'] 
+            for i in out])
+
+
+    def test_Keeps_versions_apart_and_prunes_beyond_versions_kept(self):
+        self.repo.kept = 2
+        for v in range(4):
+            img = self.imageWithProvenance({'location':'1','v':v})
+            img.replacedVersions = [{'location':'1','v':v-1}] if v else []
+            self.repo.update(img)
+        stored = self.repo.byLocation('1')
+        self.assertNotIn('_versions', stored.provenance)
+        self.assertEqual([1, 2], 
+            [p['v'] for p in self.repo.versionsOf(stored)])
+        self.repo.kept = 1
+        self.assertEqual(1, self.repo.pruneVersions())
+        self.assertEqual([2], [p['v'] for p in self.repo.versionsOf(stored)])
+
+    def test_Compound_query_sorted_and_limited_in_sql(self):
+        from niprov.querying import Query
+        self.addImages({'location':'1','subject':'a','size':5,'color':'red'},
+                       {'location':'2','subject':'a','size':50},
+                       {'location':'3','subject':'b','size':30},
+                       {'location':'4','subject':'a','size':40,'color':'red'})
+        q = Query(self.dependencies).bySubject('a').sizeBetween(10)
+        self.assertEqual(2, self.repo.count(q))
+        q.sortBy('-size').limit(1)
+        self.assertEqual(['2'], self.locations(self.repo.inquire(q)))
+        q = Query(self.dependencies).either(
+            Query(self.dependencies).bySubject('b'),
+            Query(self.dependencies).where('color', 'red')).sortBy('size')
+        self.assertEqual(3, self.repo.count(q))
+        self.assertEqual(['1','3','4'], [i.provenance['location'] 
+            for i in self.repo.inquire(q)])
+        q = Query(self.dependencies).where('color', 'red').allValues('subject')
+        self.assertEqual(['a'], self.repo.inquire(q))
+
+    def test_Search_index_is_built_once_and_updated_on_save(self):
+        self.addImages({'location':'1','subject':'anne'},
+                       {'location':'2','subject':'bob'})
+        self.assertEqual(['1'], self.locations(self.repo.search('ann')))
+        self.addImages({'location':'3','subject':'annette'})
+        self.assertEqual(['1','3'], self.locations(self.repo.search('ann')))
+        self.assertEqual(1, len(self.repo.search('ann', n=1, start=1)))
+        self.assertIn('search', self.repo.reindex())
+        self.assertIn('tallies', self.repo.reindex())
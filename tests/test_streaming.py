@@ -0,0 +1,42 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+import unittest
+from mock import Mock
+
+
+class StreamingTests(unittest.TestCase):
+
+    def imageWithProvenance(self, prov):
+        img = Mock()
+        img.provenance = prov
+        return img
+
+    def test_sortOrder(self):
+        from niprov.streaming import sortOrder
+        self.assertEqual(('added', False), sortOrder('added'))
+        self.assertEqual(('added', True), sortOrder('-added'))
+
+    def test_ordered_puts_files_without_field_first_and_keeps_order(self):
+        from niprov.streaming import ordered
+        a = self.imageWithProvenance({'size':3})
+        b = self.imageWithProvenance({})
+        c = self.imageWithProvenance({'size':1})
+        d = self.imageWithProvenance({'size':1})
+        self.assertEqual([b, c, d, a], ordered(iter([a, b, c, d]), 'size'))
+        self.assertEqual([a, c, d, b], ordered([a, b, c, d], '-size'))
+
+    def test_project_keeps_location_and_fields_requested(self):
+        from niprov.streaming import project
+        factory = Mock()
+        factory.fromProvenance.side_effect = lambda p: p
+        images = [self.imageWithProvenance({'location':'a','size':3,'x':1}),
+                  self.imageWithProvenance({'location':'b','x':2})]
+        out = project(iter(images), ['size'], factory)
+        self.assertEqual([{'location':'a','size':3}, {'location':'b'}],
+            list(out))
+
+    def test_batches(self):
+        from niprov.streaming import batches
+        self.assertEqual([[0, 1], [2, 3], [4]], list(batches(iter(range(5)), 2)))
+        self.assertEqual([], list(batches([], 2)))
+
@@ -0,0 +1,49 @@
+from tests.ditest import DependencyInjectionTestBase
+from datetime import datetime
+
+
+class TallyingTests(DependencyInjectionTestBase):
+
+    def test_keysOf(self):
+        from niprov.tallying import keysOf
+        prov = {'subject':'x', 'modality':'MRI', 'project':['a','b'], 
+            'user':None, 'acquired':datetime(2016, 3, 1, 12, 30)}
+        self.assertEqual([('',''), ('modality','MRI'), ('subject','x'), 
+            ('acquired','2016-03-01')], keysOf(prov))
+        self.assertEqual([('',''), ('acquired','2016-03-02')], 
+            keysOf({'acquired':'2016-03-02T10:00:00'}))
+        self.assertEqual([('','')], keysOf({'acquired':'2016'}))
+
+    def test_add_and_remove(self):
+        from niprov.tallying import Tally
+        tally = Tally()
+        self.assertEqual({'count':0, 'totalsize':0}, tally.statistics())
+        tally.add({'modality':'MRI', 'size':3})
+        tally.add({'modality':'MRI', 'size':4})
+        tally.add({'modality':'EEG'})
+        self.assertEqual({'count':3, 'totalsize':7}, tally.statistics())
+        self.assertEqual({'MRI':{'count':2, 'totalsize':7}, 
+            'EEG':{'count':1, 'totalsize':0}}, tally.facet('modality'))
+        tally.add({'modality':'EEG'}, -1)
+        self.assertEqual({'MRI':{'count':2, 'totalsize':7}}, 
+            tally.facet('modality'))
+
+    def test_set_replaces_what_location_counted_for(self):
+        from niprov.tallying import Tally
+        tally = Tally()
+        prov = {'subject':'a', 'size':2}
+        tally.set('1', prov)
+        prov['subject'] = 'b'
+        tally.set('1', prov)
+        tally.set('2', {'subject':'b', 'size':5})
+        self.assertEqual({'count':2, 'totalsize':7}, tally.statistics())
+        self.assertEqual({'b':{'count':2, 'totalsize':7}}, 
+            tally.facet('subject'))
+
+    def test_items_of_changes(self):
+        from niprov.tallying import Tally
+        changes = Tally()
+        changes.add({'user':'me', 'size':2}, -1)
+        changes.add({'user':'you', 'size':2})
+        self.assertEqual(sorted([('', '', 0, 0), ('user', 'me', -1, -2), 
+            ('user', 'you', 1, 2)]), sorted(changes.items()))
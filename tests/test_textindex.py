@@ -0,0 +1,83 @@
+from mock import Mock
+from tests.ditest import DependencyInjectionTestBase
+import os, shutil, tempfile
+
+
+class TextIndexTests(DependencyInjectionTestBase):
+
+    def setUp(self):
+        super(TextIndexTests, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = os.path.join(self.tempdir, 'prov.search')
+
+    def image(self, location, **provenance):
+        img = Mock()
+        img.provenance = dict(provenance, location=location)
+        img.location.toString.return_value = location
+        return img
+
+    def test_tokenize_and_termsOf(self):
+        from niprov.textindex import tokenize, termsOf
+        self.assertEqual([u'sub01', u'fmri', u'nii'], 
+            tokenize('sub01/FMRI.nii'))
+        self.assertEqual({u'h':1, u'p':1, u'f':1, u'nii':1, u'john':1, 
+            u'mri':2}, termsOf({'location':'h:/p/f.nii', 'user':'John', 
+            'modality':['MRI', 'mri'], 'size':5, 'color':'red'}))
+
+    def test_Ranks_with_BM25_and_matches_prefixes(self):
+        from niprov.textindex import TextIndex
+        index = TextIndex(self.path)
+        self.assertFalse(index.exists())
+        index.rebuild([self.image('a', transformation='motion correction'),
+            self.image('b', transformation='motion motion'),
+            self.image('c', transformation='smoothing')])
+        self.assertTrue(index.exists())
+        self.assertEqual(['b', 'a'], index.search('motion'))
+        self.assertEqual(['b', 'a'], index.search('mot'))
+        self.assertEqual(['c', 'b', 'a'], index.search('smooth moti'))
+        self.assertEqual(['b'], index.search('moti', n=1, start=0))
+        self.assertEqual(['a'], index.search('moti', n=1, start=1))
+        self.assertEqual([], index.search('xyz'))
+
+    def test_Updates_are_appended_and_seen_by_other_processes(self):
+        from niprov.textindex import TextIndex
+        index = TextIndex(self.path)
+        index.update([self.image('a', subject='anne')])
+        self.assertFalse(index.exists())
+        index.rebuild([self.image('a', subject='anne')])
+        other = TextIndex(self.path)
+        self.assertEqual(['a'], other.search('anne'))
+        index.update([self.image('a', subject='bob'), 
+            self.image('b', subject='anne')])
+        self.assertEqual(['b'], other.search('anne'))
+        self.assertEqual(['a'], other.search('bob'))
+
+    def test_Compacts_when_mostly_stale(self):
+        from niprov.textindex import TextIndex
+        index = TextIndex(self.path)
+        index.compactionMinimum = 3
+        index.rebuild([self.image('a', subject='s0')])
+        for s in range(1, 4):
+            index.update([self.image('a', subject='s{0}'.format(s))])
+        with open(self.path) as fhandle:
+            self.assertEqual(1, len(fhandle.readlines()))
+        self.assertEqual(['a'], TextIndex(self.path).search('s3'))
+        self.assertEqual([], TextIndex(self.path).search('s2'))
+
+    def test_Reads_index_again_after_other_process_replaces_it(self):
+        from niprov.textindex import TextIndex
+        index = TextIndex(self.path)
+        index.rebuild([self.image('a', subject='anne')])
+        other = TextIndex(self.path)
+        self.assertEqual(['a'], other.search('anne'))
+        index.update([self.image('a', subject='bob')])
+        index.compact()
+        index.update([self.image('b', subject='carl carlsson'), 
+            self.image('c', subject='dora')])
+        assert os.path.getsize(self.path) > other.end
+        self.assertEqual([], other.search('anne'))
+        self.assertEqual(['b'], other.search('carl'))
+        index.rebuild([self.image('d', subject='dora'),
+            self.image('e', subject='eve'), self.image('f', subject='fay')])
+        self.assertEqual(['d'], other.search('dora'))
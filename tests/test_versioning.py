@@ -0,0 +1,119 @@
+from mock import Mock
+from tests.ditest import DependencyInjectionTestBase
+import os, json, shutil, tempfile
+
+
+class VersioningTests(DependencyInjectionTestBase):
+
+    def setUp(self):
+        super(VersioningTests, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.serializer.encode.side_effect = json.dumps
+        self.serializer.decode.side_effect = json.loads
+
+    def test_pruneVersions_asks_repository_and_informs_listener(self):
+        from niprov.versioning import pruneVersions
+        self.repo.pruneVersions.return_value = 3
+        out = pruneVersions(dependencies=self.dependencies)
+        self.listener.versionsPruned.assert_called_with(3)
+        self.assertEqual(3, out)
+
+    def test_delta_has_changed_and_removed_fields(self):
+        from niprov.versioning import delta
+        newer = {'a':1, 'b':2, 'c':3, '_id':'x'}
+        older = {'a':1, 'b':5, 'd':4, '_versions':[]}
+        self.assertEqual({'set':{'b':5, 'd':4}, 'unset':['c']}, 
+            delta(newer, older))
+        self.assertEqual({}, delta(newer, {'a':1, 'b':2, 'c':3}))
+
+    def test_restore_applies_delta(self):
+        from niprov.versioning import delta, restore
+        newer = {'a':1, 'b':2, 'c':3}
+        older = {'a':1, 'b':5, 'd':4}
+        self.assertEqual(older, restore(newer, delta(newer, older)))
+        self.assertEqual({'a':1, 'b':2, 'c':3}, newer)
+
+    def test_restoreVersions_starts_from_latest_and_includes_legacy(self):
+        from niprov.versioning import restoreVersions
+        provenance = {'y':3, '_versions':[{'y':0}]}
+        differences = [{'set':{'y':2}}, {'set':{'y':1}, 'unset':['z']}]
+        self.assertEqual([{'y':0}, {'y':1}, {'y':2}], 
+            restoreVersions(provenance, differences))
+
+    def test_takeDeltas_for_replaced_versions_only_once(self):
+        from niprov.versioning import takeDeltas, restoreVersions
+        img = Mock()
+        img.provenance = {'y':3}
+        img.replacedVersions = [{'y':1}, {'y':2, 'z':0}]
+        deltas = takeDeltas(img)
+        self.assertEqual([{'set':{'y':1}, 'unset':['z']}, 
+            {'set':{'y':2, 'z':0}}], deltas)
+        self.assertEqual([{'y':1}, {'y':2, 'z':0}], 
+            restoreVersions(img.provenance, list(reversed(deltas))))
+        self.assertEqual([], takeDeltas(img))
+
+    def test_VersionFile_deltas_per_location_latest_first(self):
+        from niprov.versioning import VersionFile
+        vfile = VersionFile(os.path.join(self.tempdir, 'p.versions'), 
+            self.serializer)
+        self.assertEqual([], vfile.deltasFor('a'))
+        vfile.append([('a', {'set':{'y':1}}), ('b', {'set':{'y':5}})])
+        vfile.append([('a', {'set':{'y':2}})])
+        self.assertEqual([{'set':{'y':2}}, {'set':{'y':1}}], 
+            vfile.deltasFor('a'))
+
+    def test_VersionFile_reads_only_new_lines_unless_replaced(self):
+        from niprov.versioning import VersionFile
+        path = os.path.join(self.tempdir, 'p.versions')
+        vfile = VersionFile(path, self.serializer)
+        vfile.append([('a', {'set':{'y':1}}), ('b', {'set':{'y':5}})])
+        self.assertEqual([{'set':{'y':1}}], vfile.deltasFor('a'))
+        self.serializer.decode.reset_mock()
+        VersionFile(path, self.serializer).append([('a', {'set':{'y':2}})])
+        self.assertEqual([{'set':{'y':2}}, {'set':{'y':1}}], 
+            vfile.deltasFor('a'))
+        self.assertEqual(3, self.serializer.decode.call_count)
+        other = path + '.other'
+        VersionFile(other, self.serializer).append([('a', {'set':{'y':7}})])
+        os.rename(other, path)
+        self.assertEqual([{'set':{'y':7}}], vfile.deltasFor('a'))
+        self.assertEqual([], vfile.deltasFor('b'))
+
+    def test_withVersions_and_unpackVersions_carry_versions_through_backup(
+            self):
+        from niprov.versioning import withVersions, unpackVersions
+        img = Mock()
+        img.provenance = {'y':2}
+        img.copy.return_value.provenance = {'y':2}
+        self.repo.versionsOf.return_value = [{'y':1}]
+        [backedUp] = list(withVersions([img], self.repo))
+        self.assertEqual({'y':2}, img.provenance)
+        self.assertEqual({'y':2, '_versions':[{'y':1}]}, backedUp.provenance)
+        self.assertIs(backedUp, unpackVersions(backedUp))
+        self.assertEqual({'y':2}, backedUp.provenance)
+        self.assertEqual([{'y':1}], backedUp.replacedVersions)
+
+    def test_unpackVersions_gives_file_object_of_Record(self):
+        from niprov.versioning import unpackVersions
+        from niprov.record import Record
+        record = Record({'location':'a', '_versions':[{'y':1}]}, 
+            self.fileFactory)
+        out = unpackVersions(record)
+        self.fileFactory.fromProvenance.assert_called_with({'location':'a'})
+        self.assertIs(self.fileFactory.fromProvenance(), out)
+        self.assertEqual([{'y':1}], out.replacedVersions)
+        plain = Record({'location':'b'}, self.fileFactory)
+        self.assertIs(plain, unpackVersions(plain))
+
+    def test_VersionFile_prune_removes_oldest_beyond_kept(self):
+        from niprov.versioning import VersionFile
+        vfile = VersionFile(os.path.join(self.tempdir, 'p.versions'), 
+            self.serializer)
+        vfile.append([('a', {'set':{'y':v}}) for v in range(4)])
+        vfile.append([('b', {'set':{'y':9}})])
+        self.assertEqual(2, vfile.prune(2))
+        self.assertEqual([{'set':{'y':3}}, {'set':{'y':2}}], 
+            vfile.deltasFor('a'))
+        self.assertEqual([{'set':{'y':9}}], vfile.deltasFor('b'))
+        self.assertEqual(0, vfile.prune(2))
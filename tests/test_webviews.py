@@ -39,15 +39,56 @@ class ViewTests(DependencyInjectionTestBase):
         import niprov.views
         out = niprov.views.stats(self.request)
         self.assertEqual(self.repo.statistics(), out['stats'])
+        self.repo.facet.assert_any_call('subject')
+        self.repo.facet.assert_any_call('acquired')
+        self.assertEqual(self.repo.facet(), out['facets']['modality'])
+        self.assertEqual(self.repo.facet(), out['days'])
 
     def test_pipeline_by_id(self):
         import niprov.views
         self.request.matchdict = {'id':'1a2b3c'}
+        self.request.GET = {}
         out = niprov.views.pipeline(self.request)
         self.repo.byId.assert_called_with('1a2b3c')
-        self.pipelineFactory.forFile.assert_called_with(self.repo.byId())
-        self.assertEqual(self.pipelineFactory.forFile(), out['pipeline'])
+        self.assertEqual(self.repo.byId(), out['image'])
         self.assertEqual(out['sid'], '1a2b3c')
+        self.assertEqual(1, out['depth'])
+        assert not self.pipelineFactory.forFile.called
+
+    def test_neighbourhood(self):
+        import niprov.views
+        self.request.matchdict = {'id':'1a2b3c'}
+        self.request.GET = {}
+        out = niprov.views.neighbourhood(self.request)
+        self.repo.byId.assert_called_with('1a2b3c')
+        self.pipelineFactory.neighbourhood.assert_called_with(
+            self.repo.byId(), depth=1, fanout=20, transformation=None, 
+            start=0)
+        self.assertEqual(self.pipelineFactory.neighbourhood(), out)
+        self.request.GET = {'depth':'2', 'fanout':'5', 
+            'transformation':'blur', 'start':'5'}
+        niprov.views.neighbourhood(self.request)
+        self.pipelineFactory.neighbourhood.assert_called_with(
+            self.repo.byId(), depth=2, fanout=5, transformation='blur', 
+            start=5)
+
+    def test_Invalid_numbers_are_bad_requests_and_fanout_is_at_least_one(self):
+        from pyramid.httpexceptions import HTTPBadRequest
+        import niprov.views
+        self.request.matchdict = {'id':'1a2b3c'}
+        for name in ['depth', 'fanout', 'start']:
+            self.request.GET = {name:'x'}
+            self.assertRaises(HTTPBadRequest, niprov.views.neighbourhood, 
+                self.request)
+        self.request.GET = {'depth':'1.5'}
+        self.assertRaises(HTTPBadRequest, niprov.views.pipeline, self.request)
+        self.request.GET = {'text':'hello', 'start':'x'}
+        self.assertRaises(HTTPBadRequest, niprov.views.search, self.request)
+        self.request.GET = {'fanout':'0', 'depth':'-1'}
+        niprov.views.neighbourhood(self.request)
+        self.pipelineFactory.neighbourhood.assert_called_with(
+            self.repo.byId(), depth=0, fanout=1, transformation=None, 
+            start=0)
 
     def test_by_project(self):
         import niprov.views
@@ -79,6 +120,7 @@ class ViewTests(DependencyInjectionTestBase):
 
     def test_search_provides_searchstring_to_template(self):
         import niprov.views
+        self.repo.search.return_value = []
         self.request.GET = {'text':'hello world'}
         out = niprov.views.search(self.request)
         self.assertEqual('hello world', out['searchtext'])
@@ -88,33 +130,43 @@ class ViewTests(DependencyInjectionTestBase):
         self.request.GET = {'text':'hello world'}
         with patch('niprov.views.searching') as searching:
             out = niprov.views.search(self.request)
-            searching.search.assert_called_with('hello world',
+            searching.search.assert_called_with('hello world', 20, 0,
                                                 self.request.dependencies)
             self.assertEqual(searching.search(), out['images'])
 
+    def test_search_links_next_page_if_page_is_full(self):
+        import niprov.views
+        self.request.GET = {'text':'hello', 'start':'20'}
+        self.repo.search.return_value = [Mock()] * 20
+        out = niprov.views.search(self.request)
+        self.repo.search.assert_called_with('hello', 20, 20)
+        self.assertEqual(40, out['more'])
+        self.repo.search.return_value = [Mock()] * 3
+        self.assertIsNone(niprov.views.search(self.request)['more'])
+
     def test_modalities(self):
         import niprov.views
         out = niprov.views.modalities(self.request)
-        self.query.allModalities.assert_called_with()
+        self.query.facet.assert_called_with('modality')
         self.assertEqual('modalities', out['categoryPlural'])
         self.assertEqual('modality', out['category'])
-        self.assertEqual(self.query.allModalities(), out['items'])
+        self.assertEqual(self.query.facet(), out['items'])
 
     def test_projects(self):
         import niprov.views
         out = niprov.views.projects(self.request)
-        self.query.allProjects.assert_called_with()
+        self.query.facet.assert_called_with('project')
         self.assertEqual('projects', out['categoryPlural'])
         self.assertEqual('project', out['category'])
-        self.assertEqual(self.query.allProjects(), out['items'])
+        self.assertEqual(self.query.facet(), out['items'])
 
     def test_users(self):
         import niprov.views
         out = niprov.views.users(self.request)
-        self.query.allUsers.assert_called_with()
+        self.query.facet.assert_called_with('user')
         self.assertEqual('users', out['categoryPlural'])
         self.assertEqual('user', out['category'])
-        self.assertEqual(self.query.allUsers(), out['items'])
+        self.assertEqual(self.query.facet(), out['items'])
 
     def test_If_byId_byLocation_return_None_views_return_404(self):
         from pyramid.httpexceptions import HTTPNotFound
@@ -126,6 +178,8 @@ class ViewTests(DependencyInjectionTestBase):
         self.assertRaises(HTTPNotFound, niprov.views.short, self.request)
         self.assertRaises(HTTPNotFound, niprov.views.location, self.request)
         self.assertRaises(HTTPNotFound, niprov.views.pipeline, self.request)
+        self.assertRaises(HTTPNotFound, niprov.views.neighbourhood, 
+            self.request)
 
 
 